@@ -0,0 +1,108 @@
+"""
+Benchmark catalog lock contention between transfer threads and the main loop
+
+N transfer threads each call report_files_local after every simulated file,
+as the sftp transfer does, and mark some files present with add_files. The main
+thread meanwhile runs the checks the main loop makes every iteration. The
+main loop latency is reported with a plain threading.Lock and with an RWLock
+
+    python benchmarks/bench_catalog_contention.py --threads 8 --seconds 5 --file-time 0.05
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+from time import time, sleep
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.filemanager import FileManager, FileStatus
+from lib.events import EventList
+from lib.rwlock import RWLock
+from bench_render_templates import make_config
+
+
+def transfer(filemanager, case, file_time, stop, counts):
+    idx = 0
+    while not stop.is_set():
+        # a file landing
+        sleep(file_time)
+        filemanager.report_files_local()
+        idx += 1
+        if idx % 10 == 0:
+            filemanager.add_files('transferred', [{
+                'name': 'file{}'.format(idx),
+                'local_path': '/nowhere/file{}'.format(idx),
+                'case': case,
+                'local_status': FileStatus.PRESENT.value
+            }])
+    counts.append(idx)
+
+
+def run(lock, args):
+    tempdir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(tempdir, 'output'))
+        config = make_config(tempdir, args.years, args.datatypes, args.cases)
+        config['global']['catalog_backend'] = args.catalog_backend
+        filemanager = FileManager(
+            mutex=lock,
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(tempdir, 'output', 'processflow.db'))
+        filemanager.populate_file_list()
+        cases = [x for x in config['simulations'] if x not in ['start_year', 'end_year']]
+        requirements = [(case, _type, year, year + 4)
+                        for case in cases
+                        for _type in config['data_types']
+                        for year in range(1, args.years + 1, 5)]
+
+        stop = threading.Event()
+        counts = list()
+        threads = [threading.Thread(target=transfer, args=(filemanager, cases[0], args.file_time, stop, counts))
+                   for _ in range(args.threads)]
+        for thread in threads:
+            thread.start()
+
+        latencies = list()
+        end = time() + args.seconds
+        while time() < end:
+            start = time()
+            filemanager.data_ready_map(requirements)
+            filemanager.all_data_local()
+            filemanager.get_file_paths_by_year('type0', cases[0], 1, 5)
+            latencies.append(time() - start)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+        print '{}:'.format('RWLock' if isinstance(lock, RWLock) else 'threading.Lock')
+        print '    main loop iterations: {}'.format(len(latencies))
+        print '    median latency:       {:.1f}ms'.format(latencies[len(latencies) // 2] * 1000)
+        print '    95th pct latency:     {:.1f}ms'.format(latencies[int(len(latencies) * 0.95)] * 1000)
+        print '    transfer reports:     {}'.format(sum(counts))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=int, default=5)
+    parser.add_argument('--file-time', type=float, default=0.05,
+                        help='seconds each simulated file takes to transfer')
+    parser.add_argument('--years', type=int, default=50)
+    parser.add_argument('--datatypes', type=int, default=6)
+    parser.add_argument('--cases', type=int, default=2)
+    parser.add_argument('--catalog-backend', default='table', choices=['table', 'series'])
+    args = parser.parse_args()
+    for lock in [threading.Lock(), RWLock()]:
+        run(lock, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark the DataFile catalog queries with and without the composite indexes
+
+Builds a synthetic catalog, times the queries used by check_data_ready,
+get_file_paths_by_year, years_ready and transfer_needed against the bare table,
+then migrates the catalog to the current schema and times them again
+
+    python benchmarks/bench_catalog_indexes.py --rows 1000000
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import random
+from time import time
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.models import DataFile, database, setup_catalog
+
+
+def build_catalog(rows, cases, datatypes):
+    """
+    Fill the bare DataFile table with monthly rows spread across the cases and types
+    """
+    years = max(1, rows // (cases * datatypes * 12))
+    columns = ['case', 'name', 'local_path', 'local_status', 'remote_path', 'remote_status',
+               'year', 'month', 'datatype', 'local_size', 'transfer_type', 'remote_uuid',
+               'remote_hostname']
+    sql = 'INSERT INTO datafile ({}) VALUES ({})'.format(
+        ', '.join('"{}"'.format(x) for x in columns),
+        ', '.join('?' for _ in columns))
+    total = 0
+    with database.atomic():
+        for case_idx in range(cases):
+            case = 'case_{}'.format(case_idx)
+            for type_idx in range(datatypes):
+                datatype = 'type_{}'.format(type_idx)
+                batch = list()
+                for year in range(1, years + 1):
+                    for month in range(1, 13):
+                        name = '{}.{}.{:04d}-{:02d}.nc'.format(case, datatype, year, month)
+                        batch.append((
+                            case, name, '/input/{}/{}/{}'.format(case, datatype, name),
+                            random.choice([0, 0, 0, 1, 2]), '/remote/' + name, 1,
+                            year, month, datatype, 0, 'globus', '', ''))
+                database.get_cursor().executemany(sql, batch)
+                total += len(batch)
+    return total, years
+
+
+def run_queries(cases, datatypes, years, repeat):
+    """
+    Run each catalog query shape repeat times, returning the mean time in ms
+    """
+    results = list()
+
+    def timed(name, make_query):
+        start = time()
+        for _ in range(repeat):
+            case = 'case_{}'.format(random.randrange(cases))
+            datatype = 'type_{}'.format(random.randrange(datatypes))
+            start_year = random.randint(1, years)
+            end_year = min(years, start_year + 4)
+            list(make_query(case, datatype, start_year, end_year).tuples().execute())
+        results.append((name, (time() - start) * 1000.0 / repeat))
+
+    timed('check_data_ready', lambda case, datatype, start_year, end_year: (
+        DataFile
+        .select(DataFile.local_status)
+        .where(
+            (DataFile.year >= start_year) &
+            (DataFile.year <= end_year) &
+            (DataFile.case == case) &
+            (DataFile.datatype == datatype))))
+    timed('get_file_paths_by_year', lambda case, datatype, start_year, end_year: (
+        DataFile
+        .select(DataFile.local_path)
+        .where(
+            (DataFile.year <= end_year) &
+            (DataFile.year >= start_year) &
+            (DataFile.case == case) &
+            (DataFile.datatype == datatype) &
+            (DataFile.local_status == 0))))
+    timed('years_ready', lambda case, datatype, start_year, end_year: (
+        DataFile
+        .select(DataFile.local_status)
+        .where(
+            (DataFile.datatype == datatype) &
+            (DataFile.year >= start_year) &
+            (DataFile.year <= end_year))))
+    timed('transfer_needed', lambda case, datatype, start_year, end_year: (
+        DataFile
+        .select(DataFile.id)
+        .where(
+            (DataFile.case == case) &
+            (DataFile.local_status == 1))))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--cases', type=int, default=5)
+    parser.add_argument('--datatypes', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        database.init(os.path.join(tempdir, 'bench.db'))
+        # the pre-versioning table, without any indexes
+        database.create_table(DataFile)
+
+        start = time()
+        total, years = build_catalog(args.rows, args.cases, args.datatypes)
+        print 'built {} rows in {:.1f}s'.format(total, time() - start)
+
+        before = run_queries(args.cases, args.datatypes, years, args.repeat)
+
+        start = time()
+        setup_catalog()
+        print 'migrated catalog in {:.1f}s'.format(time() - start)
+
+        after = run_queries(args.cases, args.datatypes, years, args.repeat)
+
+        print '{:<24}{:>14}{:>14}{:>10}'.format('query', 'no index ms', 'indexed ms', 'speedup')
+        for (name, slow), (_, fast) in zip(before, after):
+            print '{:<24}{:>14.2f}{:>14.2f}{:>9.1f}x'.format(
+                name, slow, fast, slow / fast if fast else float('inf'))
+    finally:
+        database.close()
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark per-operation commits against the batching CatalogWriter
+
+N threads each mark files present one at a time, as the transfer threads
+do when files land. The old path takes the lock and commits every update,
+the writer queues them and commits batches from its own thread
+
+    python benchmarks/bench_catalog_writer.py --threads 8 --updates 500
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+from time import time
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.catalog_writer import CatalogWriter
+from lib.models import DataFile, database, setup_catalog, insert_rows
+from lib.rwlock import RWLock
+
+
+def make_rows(count):
+    return [{
+        'case': 'case', 'name': 'file{}'.format(x), 'local_path': '/a/file{}'.format(x),
+        'local_status': 1, 'remote_path': '', 'remote_status': 1, 'year': 1, 'month': 1,
+        'datatype': 'atm', 'local_size': 0, 'transfer_type': 'local', 'remote_uuid': '',
+        'remote_hostname': ''
+    } for x in range(count)]
+
+
+def direct(lock, ids):
+    for _id in ids:
+        lock.acquire()
+        try:
+            with database.atomic():
+                DataFile.update(local_status=0).where(DataFile.id == _id).execute()
+        finally:
+            lock.release()
+
+
+def batched(writer, ids):
+    for _id in ids:
+        writer.update_status(DataFile, [_id], 0)
+
+
+def run(name, args, target, make_arg):
+    tempdir = tempfile.mkdtemp()
+    try:
+        database.init(os.path.join(tempdir, 'catalog.db'))
+        setup_catalog()
+        total = args.threads * args.updates
+        insert_rows(DataFile, make_rows(total))
+        arg, finish = make_arg()
+        start = time()
+        threads = [threading.Thread(target=target,
+                                    args=(arg, range(x * args.updates + 1, (x + 1) * args.updates + 1)))
+                   for x in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        finish()
+        elapsed = time() - start
+        present = DataFile.select().where(DataFile.local_status == 0).count()
+        assert present == total
+        print '{}: {} updates in {:.2f}s, {:.0f} updates/s'.format(
+            name, total, elapsed, total / elapsed)
+        database.close()
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--updates', type=int, default=500,
+                        help='status updates made by each thread')
+    args = parser.parse_args()
+
+    def make_lock():
+        return RWLock(), lambda: None
+
+    def make_writer():
+        writer = CatalogWriter(mutex=RWLock(), database=database)
+        writer.start()
+        return writer, writer.stop
+
+    run('commit per update', args, direct, make_lock)
+    run('CatalogWriter', args, batched, make_writer)
+
+
+if __name__ == '__main__':
+    main()
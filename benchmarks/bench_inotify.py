@@ -0,0 +1,75 @@
+"""
+Benchmark how long it takes a new input file to reach the catalog
+
+With polling the file is only noticed by the next update_local_status,
+on average half the main loop delay later. With the inotify watcher the
+time from the file being closed to the catalog row being committed and
+the main loop being woken is measured directly
+
+    python benchmarks/bench_inotify.py --files 50
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+from time import time
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.filemanager import FileManager, FileStatus
+from lib.models import DataFile
+from lib.events import EventList
+from lib.rwlock import RWLock
+from bench_render_templates import make_config
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--years', type=int, default=50)
+    parser.add_argument('--datatypes', type=int, default=6)
+    parser.add_argument('--loop-delay', type=int, default=10)
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(tempdir, 'output'))
+        config = make_config(tempdir, args.years, args.datatypes, 1)
+        filemanager = FileManager(
+            mutex=RWLock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(tempdir, 'output', 'processflow.db'))
+        filemanager.populate_file_list()
+        wake_event = threading.Event()
+        watched = filemanager.watch(wake_event)
+        if not watched:
+            print 'inotify is not available here'
+            return
+        print 'watching {} directories, {} files'.format(len(watched), DataFile.select().count())
+
+        datafiles = list(DataFile.select().limit(args.files))
+        latencies = list()
+        for datafile in datafiles:
+            wake_event.clear()
+            start = time()
+            with open(datafile.local_path, 'w') as fp:
+                fp.write('test')
+            wake_event.wait(5)
+            latencies.append(time() - start)
+            assert DataFile.get(DataFile.id == datafile.id).local_status == FileStatus.PRESENT.value
+        filemanager.terminate_transfers()
+
+        latencies.sort()
+        print 'polling, expected latency:   {:.1f}ms'.format(args.loop_delay / 2.0 * 1000)
+        print 'inotify, median latency:     {:.1f}ms'.format(latencies[len(latencies) // 2] * 1000)
+        print 'inotify, max latency:        {:.1f}ms'.format(latencies[-1] * 1000)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark staging files from an archive on the same filesystem with each
+local_copy method, against a single threaded shutil.copy of every file as a
+plain cp would do it
+
+    python benchmarks/bench_local_copy.py --files 200 --size 16 --threads 8 --dir /scratch/tmp
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+from time import time
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.local_copy import parallel_copy, METHODS
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size', type=int, default=16, help='MB per file')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--dir', default=None, help='where to make the archive, on the filesystem to test')
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp(dir=args.dir)
+    try:
+        archive = os.path.join(tempdir, 'archive')
+        os.makedirs(archive)
+        block = os.urandom(2**20)
+        for idx in range(args.files):
+            with open(os.path.join(archive, 'file{}.nc'.format(idx)), 'wb') as fp:
+                for _ in range(args.size):
+                    fp.write(block)
+        total = args.files * args.size
+        print '{} files, {} MB, {} threads'.format(args.files, total, args.threads)
+
+        def file_list(name):
+            return [{'remote_path': os.path.join(archive, 'file{}.nc'.format(idx)),
+                     'local_path': os.path.join(tempdir, name, 'file{}.nc'.format(idx))}
+                    for idx in range(args.files)]
+
+        os.makedirs(os.path.join(tempdir, 'cp'))
+        start = time()
+        for file in file_list('cp'):
+            shutil.copy(file['remote_path'], file['local_path'])
+        elapsed = time() - start
+        print '{:<18} {:8.2f}s {:9.0f} MB/s'.format('shutil.copy', elapsed, total / elapsed)
+        shutil.rmtree(os.path.join(tempdir, 'cp'))
+
+        for idx, method in enumerate(METHODS):
+            start = time()
+            succeeded, failed, counts = parallel_copy(
+                file_list(method), threads=args.threads, methods=METHODS[idx:])
+            elapsed = time() - start
+            used = ', '.join('{} {}'.format(y, x) for x, y in counts.items())
+            print '{:<18} {:8.2f}s {:9.0f} MB/s  {}'.format(method, elapsed, total / elapsed, used)
+            shutil.rmtree(os.path.join(tempdir, method))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark the per-iteration catalog summaries, report_files_local,
+all_data_local and progress, on a large table backed catalog
+
+    python benchmarks/bench_progress.py --years 100 --datatypes 6 --cases 2
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+from time import time
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.filemanager import FileManager
+from lib.events import EventList
+from bench_render_templates import make_config
+
+
+def timed(func, repeat):
+    start = time()
+    for _ in range(repeat):
+        func()
+    return (time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=100)
+    parser.add_argument('--datatypes', type=int, default=6)
+    parser.add_argument('--cases', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(tempdir, 'output'))
+        config = make_config(tempdir, args.years, args.datatypes, args.cases)
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(tempdir, 'output', 'processflow.db'))
+        filemanager.populate_file_list()
+        print filemanager.report_files_local()
+        for name in ['report_files_local', 'all_data_local', 'progress']:
+            if not hasattr(filemanager, name):
+                continue
+            elapsed = timed(getattr(filemanager, name), args.repeat)
+            print '{:<20} {:.1f}ms'.format(name, elapsed * 1000)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
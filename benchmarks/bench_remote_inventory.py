@@ -0,0 +1,96 @@
+"""
+Benchmark finding out which of the needed files exist on an sftp host,
+checking each file with its own stat against FileManager.update_remote_status,
+which lists each remote directory once
+
+The files are served by a paramiko sftp server on loopback, waiting --latency
+seconds before answering each stat or listing to stand in for a remote site
+
+    python benchmarks/bench_remote_inventory.py --years 20 --datatypes 3 --latency 0.02
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+from time import time
+from mock import patch
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(0, os.path.join(os.path.abspath('.'), 'tests'))
+
+from lib.filemanager import FileManager, FileStatus
+from lib.models import DataFile
+from lib.events import EventList
+from sftp_server import SFTPServer
+from bench_render_templates import make_config
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--datatypes', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds the server waits before each stat or listing')
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    server = SFTPServer(tempdir, latency=args.latency)
+    try:
+        os.makedirs(os.path.join(tempdir, 'output'))
+        config = make_config(tempdir, args.years, args.datatypes, 1)
+        case = [x for x in config['simulations'] if x not in ['start_year', 'end_year']][0]
+        config['simulations'][case].update({
+            'transfer_type': 'sftp',
+            'remote_path': '/remote',
+            'remote_hostname': '127.0.0.1:{}'.format(server.port)
+        })
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(tempdir, 'output', 'processflow.db'))
+        filemanager.populate_file_list()
+        # the last year hasnt been written yet
+        remote_paths = [x.remote_path for x in DataFile.select().where(DataFile.year < args.years)]
+        for remote_path in remote_paths:
+            path = os.path.join(tempdir, remote_path.lstrip('/'))
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+        total = DataFile.select().count()
+        print '{} files in {} directories, {:.0f}ms server latency'.format(
+            total, args.datatypes, args.latency * 1000)
+
+        with patch('lib.ssh_interface.getpass', return_value='test'):
+            client = filemanager._ssh_pool.get(config['simulations'][case]['remote_hostname'])
+            sftp_client = client.open_sftp()
+            start = time()
+            found = 0
+            for datafile in DataFile.select():
+                try:
+                    sftp_client.stat(datafile.remote_path)
+                    found += 1
+                except IOError:
+                    pass
+            elapsed = time() - start
+            sftp_client.close()
+            print '{:<24} {:7.2f}s  {} found'.format('stat per file', elapsed, found)
+
+            start = time()
+            listed = filemanager.update_remote_status(force=True)
+            elapsed = time() - start
+            found = DataFile.select().where(
+                DataFile.remote_status != FileStatus.NOT_PRESENT.value).count()
+            print '{:<24} {:7.2f}s  {} found, {} listings'.format(
+                'update_remote_status', elapsed, found, listed)
+        filemanager.terminate_transfers()
+    finally:
+        server.stop()
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark building the file catalog for a large config
+
+Times generating every monthly file path with the old replace-chain renderer
+and with the compiled templates, then times a full populate_file_list
+
+    python benchmarks/bench_render_templates.py --years 1000 --datatypes 10 --cases 5
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+from time import time
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.filemanager import FileManager
+from lib.models import DataFile
+from lib.events import EventList
+
+
+def make_config(project_path, years, datatypes, cases):
+    config = {
+        'global': {
+            'project_path': project_path
+        },
+        'simulations': {
+            'start_year': 1,
+            'end_year': years
+        },
+        'data_types': dict()
+    }
+    for idx in range(cases):
+        case = '20180129.DECKv1b_case{}.ne30_oEC.edison'.format(idx)
+        config['simulations'][case] = {
+            'transfer_type': 'globus',
+            'remote_uuid': '9d6d994a-6d04-11e5-ba46-22000b92c6ec',
+            'remote_path': '/global/homes/r/renata/ACME_simulations/' + case,
+            'short_name': 'case{}'.format(idx),
+            'data_types': ['all']
+        }
+    for idx in range(datatypes):
+        config['data_types']['type{}'.format(idx)] = {
+            'remote_path': 'REMOTE_PATH/archive/type{}/hist'.format(idx),
+            'file_format': 'CASEID.type{}.h0.YEAR-MONTH.nc'.format(idx),
+            'local_path': 'PROJECT_PATH/input/CASEID/type{}'.format(idx),
+            'monthly': True
+        }
+    return config
+
+
+def legacy_render(config, data_type, data_type_option, case, year=None, month=None):
+    """
+    The replace-chain renderer used before templates were compiled
+    """
+    start_year = int(config['simulations']['start_year'])
+    end_year = int(config['simulations']['end_year'])
+    replace = {
+        'PROJECT_PATH': config['global']['project_path'],
+        'REMOTE_PATH': config['simulations'][case].get('remote_path', ''),
+        'CASEID': case,
+        'REST_YR': '{:04d}'.format(start_year + 1),
+        'START_YR': '{:04d}'.format(start_year),
+        'END_YR': '{:04d}'.format(end_year)
+    }
+    if year is not None:
+        replace['YEAR'] = '{:04d}'.format(year)
+    if month is not None:
+        replace['MONTH'] = '{:02d}'.format(month)
+    if config['data_types'][data_type].get(case):
+        if config['data_types'][data_type][case].get(data_type_option):
+            instring = config['data_types'][data_type][case][data_type_option]
+            for item in config['simulations'][case]:
+                if item.upper() in config['data_types'][data_type][case][data_type_option]:
+                    instring = instring.replace(item.upper(), config['simulations'][case][item])
+            return instring
+    instring = config['data_types'][data_type][data_type_option]
+    for string, val in replace.items():
+        if string in instring:
+            instring = instring.replace(string, val)
+    return instring
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=1000)
+    parser.add_argument('--datatypes', type=int, default=10)
+    parser.add_argument('--cases', type=int, default=5)
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(tempdir, 'output'))
+        config = make_config(tempdir, args.years, args.datatypes, args.cases)
+        cases = [x for x in config['simulations'] if x not in ['start_year', 'end_year']]
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(tempdir, 'output', 'processflow.db'))
+        total = args.years * 12 * args.datatypes * args.cases
+
+        start = time()
+        for case in cases:
+            for _type in config['data_types']:
+                for year in range(1, args.years + 1):
+                    for month in range(1, 13):
+                        legacy_render(config, _type, 'file_format', case, year, month)
+                        legacy_render(config, _type, 'remote_path', case, year, month)
+        legacy = time() - start
+
+        start = time()
+        for case in cases:
+            for _type in config['data_types']:
+                format_name = filemanager._compile_template(_type, 'file_format', case).format
+                format_remote = filemanager._compile_template(_type, 'remote_path', case).format
+                months = ['{:02d}'.format(x) for x in range(1, 13)]
+                for year in range(1, args.years + 1):
+                    year_str = '{:04d}'.format(year)
+                    for month_str in months:
+                        format_name(year=year_str, month=month_str)
+                        format_remote(year=year_str, month=month_str)
+        compiled = time() - start
+
+        print 'rendering {} file names and remote paths'.format(total)
+        print '    replace chain:      {:.2f}s'.format(legacy)
+        print '    compiled templates: {:.2f}s ({:.1f}x)'.format(compiled, legacy / compiled)
+
+        start = time()
+        filemanager.populate_file_list()
+        print 'populate_file_list built {} rows in {:.2f}s'.format(
+            DataFile.select().count(), time() - start)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Benchmark processflow.main on a synthetic project against simulated slurm
+commands, reporting how long each pass of the main loop spends scheduling,
+not counting the loop_delay it sleeps for
+
+    python benchmarks/bench_scheduler.py --cases 4 --years 250 --runtime 2 --nodes 100
+
+The simulated jobs dont write any output, so each job is taken as valid
+when slurm says it completed
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+from time import time
+from functools import wraps
+from collections import defaultdict
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(0, os.path.join(os.path.abspath('.'), 'tests'))
+sys.path.insert(0, os.path.join(os.path.abspath('.'), 'benchmarks'))
+
+import processflow
+from lib.runmanager import RunManager, job_map
+from lib.filemanager import FileManager
+from lib.jobstatus import JobStatus
+from fake_slurm import FakeSlurm
+from synthetic_config import write_config
+
+PHASES = [
+    (FileManager, 'update_local_status'),
+    (FileManager, 'all_data_local'),
+    (RunManager, 'check_data_ready'),
+    (RunManager, 'start_ready_jobs'),
+    (RunManager, 'monitor_running_jobs'),
+    (RunManager, 'write_job_sets'),
+]
+
+
+def timed(method, name, timings, loop):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        start = time()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            elapsed = time() - start
+            timings[name].append(elapsed)
+            loop['total'] += elapsed
+            # the main loop ends each pass by writing the state with the data progress
+            if name == 'write_job_sets' and len(args) > 1:
+                loop['passes'].append(loop['total'])
+                loop['total'] = 0
+    return wrapper
+
+
+def trust_slurm(self, *args, **kwargs):
+    return self.status == JobStatus.COMPLETED
+
+
+def no_outputs(self, *args, **kwargs):
+    pass
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cases', type=int, default=2)
+    parser.add_argument('--years', type=int, default=100)
+    parser.add_argument('--climo-frequency', type=int, default=1)
+    parser.add_argument('--ts-frequency', type=int, default=1)
+    parser.add_argument('--nodes', type=int, default=100,
+                        help='the max jobs queued at once is six per node')
+    parser.add_argument('--runtime', type=float, default=2)
+    parser.add_argument('--queue-wait', type=float, default=1)
+    parser.add_argument('--failure-rate', type=float, default=0)
+    parser.add_argument('--timeout-rate', type=float, default=0)
+    parser.add_argument('--transport-error-rate', type=float, default=0)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds each slurm command waits before answering')
+    parser.add_argument('--loop-delay', type=float, default=1)
+    parser.add_argument('--no-arrays', action='store_true')
+    parser.add_argument('--slurm-dependencies', action='store_true')
+    args = parser.parse_args()
+
+    project_path = tempfile.mkdtemp()
+    fake = FakeSlurm(latency=args.latency, nodes=args.nodes, simulate={
+        'runtime': args.runtime,
+        'queue_wait': args.queue_wait,
+        'failure_rate': args.failure_rate,
+        'timeout_rate': args.timeout_rate,
+        'transport_error_rate': args.transport_error_rate})
+    timings = defaultdict(list)
+    loop = {'total': 0, 'passes': list()}
+    patched = list()
+    try:
+        config_path = write_config(
+            project_path,
+            cases=args.cases,
+            years=args.years,
+            climo_frequency=args.climo_frequency,
+            ts_frequency=args.ts_frequency,
+            loop_delay=args.loop_delay,
+            job_arrays=not args.no_arrays,
+            slurm_dependencies=args.slurm_dependencies)
+        for cls, name in PHASES:
+            patched.append((cls, name, cls.__dict__[name]))
+            setattr(cls, name, timed(cls.__dict__[name], name, timings, loop))
+        for cls in set(job_map.values()):
+            for name, replacement in [('postvalidate', trust_slurm), ('handle_completion', no_outputs)]:
+                patched.append((cls, name, cls.__dict__[name]))
+                setattr(cls, name, replacement)
+
+        runmanagers = list()
+        setup_jobs = RunManager.__dict__['setup_jobs']
+        def keep_runmanager(self, *a, **k):
+            runmanagers.append(self)
+            return setup_jobs(self, *a, **k)
+        patched.append((RunManager, 'setup_jobs', setup_jobs))
+        RunManager.setup_jobs = keep_runmanager
+
+        resources = os.path.join(os.path.abspath('.'), 'resources')
+        with fake.on_path():
+            start = time()
+            ret = processflow.main(test=True, testargs=['-c', config_path, '-r', resources])
+            elapsed = time() - start
+    finally:
+        for cls, name, method in patched:
+            setattr(cls, name, method)
+
+    try:
+        jobs = [job for case in runmanagers[0].cases for job in case['jobs']] if runmanagers else list()
+        states = defaultdict(int)
+        for job in jobs:
+            states[job.status.name] += 1
+        calls = defaultdict(int)
+        for call in fake.calls():
+            calls[call[0]] += 1
+        passes = loop['passes']
+        print
+        print '{} jobs in {} cases over {} years, returned {}'.format(
+            len(jobs), args.cases, args.years, ret)
+        print 'job states: {}'.format(', '.join('{} {}'.format(y, x) for x, y in sorted(states.items())))
+        print 'slurm calls: {}'.format(', '.join('{} {}'.format(y, x) for x, y in sorted(calls.items())))
+        print '{:.1f}s in total, {} passes of the main loop'.format(elapsed, len(passes))
+        if passes:
+            print '{:<24} {:>9} {:>9} {:>9} {:>9}'.format('per pass', 'mean', 'p95', 'max', 'total')
+            rows = [(name, timings[name]) for _, name in PHASES] + [('scheduling overhead', passes)]
+            for name, values in rows:
+                if not values:
+                    continue
+                print '{:<24} {:8.3f}s {:8.3f}s {:8.3f}s {:8.1f}s'.format(
+                    name, sum(values) / len(values), percentile(values, 0.95), max(values), sum(values))
+    finally:
+        fake.remove()
+        shutil.rmtree(project_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark the table and series catalog backends
+
+Builds the catalog for a large config with each backend, then times a
+readiness check for every 5 year window and reports the size of the database
+
+    python benchmarks/bench_series_catalog.py --years 1000 --datatypes 6 --cases 5
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+from time import time
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.filemanager import FileManager
+from lib.events import EventList
+from bench_render_templates import make_config
+
+
+def run(backend, args):
+    tempdir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(tempdir, 'output'))
+        config = make_config(tempdir, args.years, args.datatypes, args.cases)
+        config['global']['catalog_backend'] = backend
+        database = os.path.join(tempdir, 'output', 'processflow.db')
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=database)
+
+        start = time()
+        filemanager.populate_file_list()
+        populate = time() - start
+
+        cases = [x for x in config['simulations'] if x not in ['start_year', 'end_year']]
+        requirements = list()
+        for case in cases:
+            for _type in config['data_types']:
+                for year in range(1, args.years + 1, 5):
+                    requirements.append((case, _type, year, year + 4))
+        start = time()
+        filemanager.data_ready_map(requirements)
+        ready = time() - start
+
+        start = time()
+        filemanager.update_local_status()
+        update = time() - start
+
+        print '{} backend'.format(backend)
+        print '    populate_file_list:  {:.2f}s'.format(populate)
+        print '    data_ready_map({}): {:.3f}s'.format(len(requirements), ready)
+        print '    update_local_status: {:.2f}s'.format(update)
+        print '    database size:       {:.1f}MB'.format(os.path.getsize(database) / 1e6)
+    finally:
+        shutil.rmtree(tempdir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=1000)
+    parser.add_argument('--datatypes', type=int, default=6)
+    parser.add_argument('--cases', type=int, default=5)
+    args = parser.parse_args()
+    print '{} monthly files'.format(args.years * 12 * args.datatypes * args.cases)
+    for backend in ['table', 'series']:
+        run(backend, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Benchmark pulling many files over sftp one at a time against
+parallel_transfer with several channels on one connection
+
+The files are served by a paramiko sftp server on loopback. Loopback has
+almost no round trip time, so the server waits --latency seconds before
+answering each stat and open to stand in for a remote site
+
+    python benchmarks/bench_sftp_transfer.py --files 200 --size 65536 --latency 0.02
+
+With --large the time to download one large file with sftp get is compared
+to the windowed .part download, and to resuming it from half way
+
+    python benchmarks/bench_sftp_transfer.py --large 256
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+from time import time
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(0, os.path.join(os.path.abspath('.'), 'tests'))
+
+from lib.ssh_interface import transfer, parallel_transfer, download
+from sftp_server import SFTPServer
+
+
+def sequential(client, file_list):
+    sftp_client = client.open_sftp()
+    for file in file_list:
+        transfer(sftp_client, file)
+    sftp_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size', type=int, default=65536, help='bytes per file')
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds the server waits before each stat or open')
+    parser.add_argument('--channels', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--large', type=int, default=0,
+                        help='MB in a single file to download instead')
+    parser.add_argument('--windows', type=int, nargs='+', default=[1, 4, 16],
+                        help='download windows to try with --large, in MB')
+    args = parser.parse_args()
+    if args.large:
+        return large(args)
+
+    tempdir = tempfile.mkdtemp()
+    server = SFTPServer(tempdir, latency=args.latency)
+    try:
+        remote = os.path.join(tempdir, 'remote')
+        os.makedirs(remote)
+        payload = os.urandom(args.size)
+        for idx in range(args.files):
+            with open(os.path.join(remote, 'file{}.nc'.format(idx)), 'wb') as fp:
+                fp.write(payload)
+
+        def run(name, func):
+            local = os.path.join(tempdir, 'local')
+            os.makedirs(local)
+            file_list = [{
+                'remote_path': '/remote/file{}.nc'.format(idx),
+                'local_path': os.path.join(local, 'file{}.nc'.format(idx))
+            } for idx in range(args.files)]
+            client = server.client()
+            start = time()
+            func(client, file_list)
+            elapsed = time() - start
+            client.close()
+            assert len(os.listdir(local)) == args.files
+            shutil.rmtree(local)
+            print '{:<24} {:6.2f}s  {:6.1f} files/s  {:6.1f} MB/s'.format(
+                name, elapsed, args.files / elapsed, args.files * args.size / elapsed / 2**20)
+
+        print '{} files of {} bytes, {:.0f}ms server latency'.format(
+            args.files, args.size, args.latency * 1000)
+        run('one at a time', sequential)
+        for channels in args.channels:
+            run('{} channels'.format(channels),
+                lambda client, file_list: parallel_transfer(client, file_list, channels=channels))
+    finally:
+        server.stop()
+        shutil.rmtree(tempdir)
+
+
+def large(args):
+    tempdir = tempfile.mkdtemp()
+    server = SFTPServer(tempdir)
+    try:
+        size = args.large * 2**20
+        with open(os.path.join(tempdir, 'ocn.nc'), 'wb') as fp:
+            for _ in range(args.large):
+                fp.write(os.urandom(2**20))
+        local_path = os.path.join(tempdir, 'local.nc')
+        client = server.client()
+        sftp_client = client.open_sftp()
+
+        def run(name, func):
+            start = time()
+            func()
+            elapsed = time() - start
+            assert os.path.getsize(local_path) == size
+            os.remove(local_path)
+            print '{:<24} {:6.2f}s  {:6.1f} MB/s'.format(name, elapsed, args.large / elapsed)
+
+        print 'one {}MB file'.format(args.large)
+        run('sftp get', lambda: sftp_client.get('/ocn.nc', local_path))
+        for window in args.windows:
+            run('download, {}MB window'.format(window),
+                lambda: download(sftp_client, '/ocn.nc', local_path, window * 2**20))
+        with open(os.path.join(tempdir, 'ocn.nc'), 'rb') as fp:
+            with open(local_path + '.part', 'wb') as part:
+                part.write(fp.read(size // 2))
+        run('resumed from half way', lambda: download(sftp_client, '/ocn.nc', local_path))
+        sftp_client.close()
+        client.close()
+    finally:
+        server.stop()
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark one pass of job monitoring against fake slurm commands on the PATH,
+looking up each running job with its own scontrol show job, as
+monitor_running_jobs used to, against the batched squeue and sacct lookup
+
+    python benchmarks/bench_slurm_polling.py --jobs 200 --finished 0.2 --latency 0.01
+"""
+import os
+import sys
+import argparse
+from time import time
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+sys.path.insert(0, os.path.join(os.path.abspath('.'), 'tests'))
+
+from lib.slurm import Slurm
+from fake_slurm import FakeSlurm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--finished', type=float, default=0.2,
+                        help='the fraction of jobs that have left the queue')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='seconds each slurm command waits before answering')
+    args = parser.parse_args()
+
+    fake = FakeSlurm(latency=args.latency)
+    try:
+        finished = int(args.jobs * args.finished)
+        ids = [fake.add_job('COMPLETED' if x < finished else 'RUNNING', queued=x >= finished)
+               for x in range(args.jobs)]
+        print '{} jobs, {} left the queue, {:.0f}ms per slurm call'.format(
+            args.jobs, finished, args.latency * 1000)
+        with fake.on_path():
+            fake.reset_calls()
+            start = time()
+            found = 0
+            for job_id in ids:
+                try:
+                    if Slurm().showjob(job_id).get('JobState'):
+                        found += 1
+                except Exception:
+                    pass
+            elapsed = time() - start
+            print '{:<18} {:7.2f}s {:6} forks  {} states'.format(
+                'showjob per job', elapsed, len(fake.calls()), found)
+
+            fake.reset_calls()
+            start = time()
+            found = len(Slurm().showjobs(ids))
+            elapsed = time() - start
+            print '{:<18} {:7.2f}s {:6} forks  {} states'.format(
+                'showjobs', elapsed, len(fake.calls()), found)
+    finally:
+        fake.remove()
+
+
+if __name__ == '__main__':
+    main()
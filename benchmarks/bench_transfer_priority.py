@@ -0,0 +1,113 @@
+"""
+Benchmark how soon jobs can start when the missing files are transferred in
+catalog order, as transfer_needed used to send them, against the order ranked
+by the jobs waiting on them. Files are assumed to arrive one at a time at a
+steady rate, so positions in the order stand in for time
+
+    python benchmarks/bench_transfer_priority.py --years 50 --datatypes 3 --cases 2
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import threading
+from time import time
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.filemanager import FileManager
+from lib.runmanager import RunManager
+from lib.models import DataFile
+from lib.events import EventList
+from jobs.job import Job
+from bench_render_templates import make_config
+
+
+def make_jobs(config, years):
+    """
+    A climo and a diagnostic depending on it every 5 years, and a timeseries
+    every 10 years, for each case, all needing every data type
+    """
+    datatypes = list(config['data_types'].keys())
+    cases = list()
+    for case in config['simulations']:
+        if case in ['start_year', 'end_year']:
+            continue
+        jobs = list()
+        for start in range(1, years + 1, 5):
+            climo = Job(start, start + 4, case, case, data_required=datatypes)
+            diags = Job(start, start + 4, case, case, data_required=datatypes)
+            diags.depends_on.append(climo.id)
+            jobs.extend([climo, diags])
+        for start in range(1, years + 1, 10):
+            jobs.append(Job(start, start + 9, case, case, data_required=datatypes))
+        cases.append({'case': case, 'jobs': jobs})
+    return cases
+
+
+def runnable_at(order, cases):
+    """
+    Return the position in the order at which each job has all its files
+    """
+    arrival = dict()
+    for position, (datafile, _) in enumerate(order):
+        arrival[(datafile.case, datafile.datatype, datafile.year)] = position
+    positions = list()
+    for case in cases:
+        for job in case['jobs']:
+            positions.append(max(
+                arrival[(_case, datatype, year)]
+                for _case, datatype, start, end in job.get_data_requirements()
+                for year in range(start, end + 1)))
+    return sorted(positions)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--years', type=int, default=50)
+    parser.add_argument('--datatypes', type=int, default=3)
+    parser.add_argument('--cases', type=int, default=2)
+    args = parser.parse_args()
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(tempdir, 'output'))
+        config = make_config(tempdir, args.years, args.datatypes, args.cases)
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(tempdir, 'output', 'processflow.db'))
+        filemanager.populate_file_list()
+        candidates = [(x, None) for x in DataFile.select().order_by(DataFile.id)]
+
+        # only the job list is needed, not slurm
+        runmanager = RunManager.__new__(RunManager)
+        runmanager.cases = make_jobs(config, args.years)
+        start = time()
+        priorities = runmanager.transfer_priorities()
+        ranked = filemanager._rank_transfers(candidates, priorities)
+        elapsed = time() - start
+
+        total = float(len(candidates))
+        print '{} files, {} jobs, ranked in {:.1f}ms'.format(
+            len(candidates), len(priorities), elapsed * 1000)
+        print '{:<10} {:>12} {:>12} {:>14} {:>14}'.format(
+            'order', 'first job', 'mean job', 'jobs by 25%', 'jobs by 50%')
+        for name, order in [('catalog', candidates), ('ranked', ranked)]:
+            positions = runnable_at(order, runmanager.cases)
+            print '{:<10} {:>11.1f}% {:>11.1f}% {:>14} {:>14}'.format(
+                name,
+                100 * (positions[0] + 1) / total,
+                100 * (sum(positions) / float(len(positions)) + 1) / total,
+                len([x for x in positions if x < total / 4]),
+                len([x for x in positions if x < total / 2]))
+        filemanager.terminate_transfers()
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main()
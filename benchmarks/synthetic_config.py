@@ -0,0 +1,103 @@
+"""
+Write a processflow config for a synthetic project, with empty monthly atm
+files for every case and year in place locally, so processflow can be run
+against the fake slurm commands with as many jobs as wanted
+
+    python benchmarks/synthetic_config.py /tmp/synthetic --cases 4 --years 500
+"""
+import os
+import argparse
+
+from configobj import ConfigObj
+
+MONTHS = range(1, 13)
+
+
+def write_config(project_path, cases=2, years=100, climo_frequency=1,
+                 ts_frequency=1, ts_variables=None, **options):
+    """
+    Write the config and the input files of a synthetic project
+
+    Parameters:
+        project_path (str): the directory to create the project in
+        cases (int): how many simulations to post-process
+        years (int): how many years each simulation has
+        climo_frequency (int): the climo run_frequency in years
+        ts_frequency (int): the timeseries run_frequency in years, 0 for no timeseries
+        ts_variables (list): the atm variables to make timeseries of
+        options: any other global options, such as max_jobs or job_arrays
+    Returns:
+        the path to the config file
+    """
+    config = ConfigObj()
+    config['global'] = {
+        'project_path': project_path,
+        'native_grid_cleanup': 'False',
+        'loop_delay': '1'
+    }
+    config['global'].update({x: str(y) for x, y in options.items()})
+    config['simulations'] = {'start_year': '1', 'end_year': str(years)}
+    for idx in range(cases):
+        case = 'synthetic.case{:04d}'.format(idx)
+        config['simulations'][case] = {
+            'transfer_type': 'local',
+            'local_path': os.path.join(project_path, 'input', case),
+            'short_name': 'case{:04d}'.format(idx),
+            'native_grid_name': 'ne30',
+            'native_mpas_grid_name': 'oEC60to30v3',
+            'data_types': 'atm',
+            'job_types': 'all'
+        }
+        atm_path = os.path.join(project_path, 'input', case, 'atm')
+        if not os.path.exists(atm_path):
+            os.makedirs(atm_path)
+        for year in range(1, years + 1):
+            for month in MONTHS:
+                name = '{}.cam.h0.{:04d}-{:02d}.nc'.format(case, year, month)
+                open(os.path.join(atm_path, name), 'a').close()
+
+    config['post-processing'] = {
+        'climo': {
+            'run_frequency': str(climo_frequency),
+            'destination_grid_name': 'fv129x256',
+            'regrid_map_path': os.path.join(project_path, 'map_ne30np4_to_fv129x256_aave.nc')
+        }
+    }
+    if ts_frequency:
+        config['post-processing']['timeseries'] = {
+            'run_frequency': str(ts_frequency),
+            'destination_grid_name': 'fv129x256',
+            'regrid_map_path': os.path.join(project_path, 'map_ne30np4_to_fv129x256_aave.nc'),
+            'atm': ts_variables or ['FSNTOA', 'FLUT', 'TREFHT']
+        }
+    config['data_types'] = {
+        'atm': {
+            'remote_path': 'REMOTE_PATH/archive/atm/hist',
+            'file_format': 'CASEID.cam.h0.YEAR-MONTH.nc',
+            'local_path': 'PROJECT_PATH/input/CASEID/atm',
+            'monthly': 'True'
+        }
+    }
+    config.filename = os.path.join(project_path, 'synthetic.cfg')
+    config.write()
+    return config.filename
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('project_path')
+    parser.add_argument('--cases', type=int, default=2)
+    parser.add_argument('--years', type=int, default=100)
+    parser.add_argument('--climo-frequency', type=int, default=1)
+    parser.add_argument('--ts-frequency', type=int, default=1)
+    args = parser.parse_args()
+    print write_config(
+        args.project_path,
+        cases=args.cases,
+        years=args.years,
+        climo_frequency=args.climo_frequency,
+        ts_frequency=args.ts_frequency)
+
+
+if __name__ == '__main__':
+    main()
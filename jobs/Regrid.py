@@ -8,11 +8,14 @@ from lib.jobstatus import JobStatus
 from lib.slurm import Slurm
 from lib.util import print_line, get_data_output_files
 from lib.filemanager import FileStatus
+from lib.cadence import Cadence, get_frequency
 
 class Regrid(Job):
     """
     Perform regridding with no climatology or timeseries generation on atm, lnd, and orn data
     """
+    array_capable = True
+
     def __init__(self, *args, **kwargs):
         """
         Initialize a regrid job
@@ -106,9 +109,10 @@ class Regrid(Job):
         
         contents = os.listdir(self._output_path)
         contents.sort()
+        cadence = Cadence(self.frequency(config))
         for year in range(self.start_year, self.end_year + 1):
-            for month in range(1, 13):
-                pattern = r'%04d-%02d' % (year, month)
+            for slot in range(cadence.slots_per_year):
+                pattern = cadence.date_string(year, slot)
                 found = False
                 for item in contents:
                     if re.search(pattern, item):
@@ -116,14 +120,20 @@ class Regrid(Job):
                         break
                 if not found:
                     if not self._has_been_executed:
-                        msg = '{prefix}: Unable to find regridded output file for {yr}-{mon}'.format(
+                        msg = '{prefix}: Unable to find regridded output file for {date}'.format(
                             prefix=self.msg_prefix(),
-                            yr=year,
-                            mon=month)
+                            date=pattern)
                         logging.error(msg)
                     return False
         return True
     # -----------------------------------------------
+    def frequency(self, config):
+        """
+        Return the frequency of the data being regridded, monthly unless
+        its data_types entry says otherwise
+        """
+        return get_frequency(config['data_types'].get(self.run_type, {})) or 'monthly'
+    # -----------------------------------------------
     def handle_completion(self, filemanager, event_list, config):
         if self.status != JobStatus.COMPLETED:
             msg = '{prefix}: Job failed, not running completion handler'.format(
@@ -137,8 +147,10 @@ class Regrid(Job):
             print_line(msg, event_list)
             logging.info(msg)
         
+        frequency = self.frequency(config)
         new_files = list()
-        for regrid_file in get_data_output_files(self._output_path, self.case, self.start_year, self.end_year):
+        for regrid_file in get_data_output_files(
+                self._output_path, self.case, self.start_year, self.end_year, frequency=frequency):
             new_files.append({
                 'name': regrid_file,
                 'local_path': os.path.join(self._output_path, regrid_file),
@@ -150,7 +162,7 @@ class Regrid(Job):
                 data_type='regrid',
                 file_list=new_files)
         if not config['data_types'].get('regrid'):
-            config['data_types']['regrid'] = {'monthly': True}
+            config['data_types']['regrid'] = {'frequency': frequency}
     # -----------------------------------------------
     @property
     def run_type(self):
@@ -8,6 +8,8 @@ from lib.util import get_ts_output_files, print_line
 from lib.filemanager import FileStatus
 
 class Timeseries(Job):
+    array_capable = True
+
     def __init__(self, *args, **kwargs):
         super(Timeseries, self).__init__(*args, **kwargs)
         self._job_type = 'timeseries'
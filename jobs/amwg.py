@@ -1,6 +1,7 @@
 import os
 import re
 import json
+import pipes
 import logging
 
 from subprocess import call
@@ -122,7 +123,8 @@ class AMWG(Diag):
             self._dryrun = True
             return
 
-        self._change_input_file_names()
+        if not self._stage_commands:
+            self._change_input_file_names()
         # create the run command and submit it
         self._has_been_executed = True
         cmd = ['csh', csh_template_out]
@@ -318,6 +320,18 @@ class AMWG(Diag):
             logging.info(msg)
             return True
     # -----------------------------------------------
+    def stage_inputs(self, config, dependencies):
+        """
+        Link in the climos from the run script, then rename them like _change_input_file_names
+        """
+        if not super(AMWG, self).stage_inputs(config, dependencies):
+            return False
+        self._stage_commands.append(
+            'for file in {path}/*_??????_??????_climo.nc; do '
+            'mv "$file" "${{file%??????_??????_climo.nc}}climo.nc"; done'.format(
+                path=pipes.quote(self._temp_path(config))))
+        return True
+    # -----------------------------------------------
     def _change_input_file_names(self):
         """
         change case_01_000101_000201_climo.nc to 
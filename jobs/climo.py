@@ -7,6 +7,8 @@ from lib.util import get_climo_output_files, print_line
 from lib.slurm import Slurm
 
 class Climo(Job):
+    array_capable = True
+
     def __init__(self, *args, **kwargs):
         super(Climo, self).__init__(*args, **kwargs)
         self._data_required = ['atm']
@@ -24,6 +26,15 @@ class Climo(Job):
         """
         return True
     # -----------------------------------------------
+    def get_regrid_path(self, config):
+        """
+        Returns the directory the regridded climos are written to
+        """
+        return os.path.join(
+            config['global']['project_path'], 'output', 'pp',
+            config['post-processing']['climo']['destination_grid_name'],
+            self._short_name, 'climo', '{length}yr'.format(length=self.end_year-self.start_year+1))
+    # -----------------------------------------------
     def postvalidate(self, config, *args, **kwargs):
         """
         Postrun validation for Ncclimo
@@ -32,10 +43,7 @@ class Climo(Job):
         """
         if self._dryrun:
             return True
-        regrid_path = os.path.join(
-            config['global']['project_path'], 'output', 'pp',
-            config['post-processing']['climo']['destination_grid_name'],
-            self._short_name, 'climo', '{length}yr'.format(length=self.end_year-self.start_year+1))
+        regrid_path = self.get_regrid_path(config)
         climo_path = os.path.join(
             config['global']['project_path'], 'output', 'pp',
             config['simulations'][self.case]['native_grid_name'],
@@ -70,10 +78,7 @@ class Climo(Job):
         return True
     # -----------------------------------------------
     def execute(self, config, dryrun=False):
-        regrid_path = os.path.join(
-            config['global']['project_path'], 'output', 'pp',
-            config['post-processing']['climo']['destination_grid_name'],
-            self._short_name, 'climo', '{length}yr'.format(length=self.end_year-self.start_year+1))
+        regrid_path = self.get_regrid_path(config)
         if not os.path.exists(regrid_path):
             os.makedirs(regrid_path)
 
@@ -126,10 +131,7 @@ class Climo(Job):
             print_line(msg, event_list)
             logging.info(msg)
 
-        regrid_path = os.path.join(
-            config['global']['project_path'], 'output', 'pp',
-            config['post-processing']['climo']['destination_grid_name'],
-            self._short_name, 'climo', '{length}yr'.format(length=self.end_year-self.start_year+1))
+        regrid_path = self.get_regrid_path(config)
 
         new_files = list()
         for regrid_file in get_climo_output_files(regrid_path, self.start_year, self.end_year):
@@ -1,5 +1,6 @@
 import json
 import os
+import pipes
 import logging
 
 from uuid import uuid4
@@ -34,6 +35,28 @@ class Diag(Job):
             'case': self._case
         }, sort_keys=True, indent=4)
     # -----------------------------------------------
+    def stage_inputs(self, config, dependencies):
+        """
+        Have the run script link in the regridded climos of the climo jobs this
+        diag depends on, so it can be queued while they're still running
+        """
+        if not dependencies or any(x.job_type != 'climo' for x in dependencies):
+            return False
+        temp_path = self._temp_path(config)
+        if not os.path.exists(temp_path):
+            os.makedirs(temp_path)
+        self._stage_commands = list()
+        for climo in dependencies:
+            self._stage_commands.append(
+                'ln -sf {src}/*_{start:04d}??_{end:04d}??_climo.nc {dst}/'.format(
+                    src=pipes.quote(climo.get_regrid_path(config)),
+                    start=climo.start_year,
+                    end=climo.end_year,
+                    dst=pipes.quote(temp_path)))
+        # the templates only need the directory the inputs will be in
+        self._input_file_paths = [os.path.join(temp_path, '')]
+        return True
+    # -----------------------------------------------
     def setup_hosting(self, config, img_source, host_path, event_list):
         if config['global']['always_copy']:
             if os.path.exists(host_path) and self.job_type != 'aprime':
@@ -8,12 +8,16 @@ from uuid import uuid4
 from lib.slurm import Slurm
 from lib.jobstatus import JobStatus
 from lib.util import create_symlink_dir, print_line
+from lib.cadence import get_frequency
 
 
 class Job(object):
     """
     A base job class for all post-processing and diagnostic jobs
     """
+    # if jobs of this type can be submitted together as a slurm job array
+    array_capable = False
+
     def __init__(self, start, end, case, short_name, data_required=None, **kwargs):
         self._start_year = start
         self._end_year = end
@@ -33,6 +37,12 @@ class Job(object):
         self._output_path = ''
         self._dryrun = True if kwargs.get('dryrun') == True else False
         self._slurm_args = dict()
+        # shell commands the run script runs first, see stage_inputs
+        self._stage_commands = list()
+        # the JobArray to submit with instead of on its own, set by the RunManager
+        self.array = None
+        # the Executor to submit to, set by the RunManager, Slurm if its not
+        self.executor = None
     # -----------------------------------------------
     def setup_dependencies(self, *args, **kwargs):
         msg = '{} has not implemented the setup_dependencies method'.format(self.job_type)
@@ -72,9 +82,8 @@ class Job(object):
         and puts a copy of the path for the links into the _input_file_paths field
         """
         for datatype in self._data_required:
-            monthly = config['data_types'][datatype].get('monthly')
             # first get the list of file paths to the data
-            if monthly == 'True' or monthly == True:
+            if get_frequency(config['data_types'][datatype]):
                 files = filemanager.get_file_paths_by_year(
                     datatype=datatype,
                     case=case,
@@ -92,26 +101,7 @@ class Job(object):
                 continue
             
             # setup the temp directory to hold symlinks
-            if self._run_type is not None:
-                temp_path = os.path.join(
-                    config['global']['project_path'],
-                    'output', 'temp', self._short_name, 
-                    '{}_{}'.format(self._job_type, self._run_type), 
-                    '{:04d}_{:04d}'.format(self._start_year, self._end_year))
-            elif isinstance(self, Diag):
-                if self._comparison == 'obs':
-                    comp = 'obs'
-                else:
-                    comp = config['simulations'][self.comparison]['short_name']
-                temp_path = os.path.join(
-                    config['global']['project_path'],
-                    'output', 'temp', self._short_name, self._job_type, 
-                    '{:04d}_{:04d}_vs_{}'.format(self._start_year, self._end_year, comp))
-            else:
-                temp_path = os.path.join(
-                    config['global']['project_path'],
-                    'output', 'temp', self._short_name, self._job_type, 
-                    '{:04d}_{:04d}'.format(self._start_year, self._end_year))
+            temp_path = self._temp_path(config)
             if not os.path.exists(temp_path):
                 os.makedirs(temp_path)
             
@@ -131,6 +121,58 @@ class Job(object):
             self._input_file_paths.extend([os.path.join(temp_path, x) for x in filesnames])
         return
     # -----------------------------------------------
+    def _temp_path(self, config):
+        """
+        Returns the temp directory the jobs input data is symlinked into
+        """
+        if self._run_type is not None:
+            return os.path.join(
+                config['global']['project_path'],
+                'output', 'temp', self._short_name, 
+                '{}_{}'.format(self._job_type, self._run_type), 
+                '{:04d}_{:04d}'.format(self._start_year, self._end_year))
+        elif isinstance(self, Diag):
+            if self._comparison == 'obs':
+                comp = 'obs'
+            else:
+                comp = config['simulations'][self.comparison]['short_name']
+            return os.path.join(
+                config['global']['project_path'],
+                'output', 'temp', self._short_name, self._job_type, 
+                '{:04d}_{:04d}_vs_{}'.format(self._start_year, self._end_year, comp))
+        else:
+            return os.path.join(
+                config['global']['project_path'],
+                'output', 'temp', self._short_name, self._job_type, 
+                '{:04d}_{:04d}'.format(self._start_year, self._end_year))
+    # -----------------------------------------------
+    def stage_inputs(self, config, dependencies):
+        """
+        Setup the job to be submitted before its dependencies have finished,
+        with its run script staging the data they produce instead of setup_data
+
+        Parameters:
+            config (dict): the global configuration object
+            dependencies (list): every job this job depends on
+        Returns:
+            True if the run script will stage the data, False if this type of job
+            has to wait for its dependencies to finish
+        """
+        return False
+    # -----------------------------------------------
+    def set_dependencies(self, slurm_ids):
+        """
+        Hold the job in the queue until the given slurm jobs have completed successfully
+
+        Parameters:
+            slurm_ids (list): the slurm job ids, or array task ids, to wait for
+        """
+        if slurm_ids:
+            self._slurm_args['dependency'] = '--dependency=afterok:{}'.format(
+                ':'.join(str(x) for x in slurm_ids))
+        else:
+            self._slurm_args.pop('dependency', None)
+    # -----------------------------------------------
     def check_data_ready(self, filemanager):
         """
         Checks that the data needed for the job is present on the machine, in the input directory
@@ -145,6 +187,14 @@ class Job(object):
                 end_year=self.end_year)
         return
     # -----------------------------------------------
+    def get_data_requirements(self):
+        """
+        Returns the (case, datatype, start_year, end_year) tuples this job needs
+        to be present before it can run, as used by FileManager.data_ready_map
+        """
+        return [(self._case, datatype, self.start_year, self.end_year)
+                for datatype in self._data_required]
+    # -----------------------------------------------
     def check_data_in_place(self):
         """
         Checks that the data needed for the job has been symlinked into the jobs temp directory
@@ -196,7 +246,7 @@ class Job(object):
             cmd (str): the command to submit
             config (dict): the global configuration object
         Retuns:
-            job_id (int): the slurm job_id
+            job_id (int): the slurm job_id, or the JobArray the job was added to
         """    
         # setup for the run script
         scripts_path = os.path.join(
@@ -239,6 +289,8 @@ class Job(object):
         with open(run_script, 'w') as batchfile:
             batchfile.write('#!/bin/bash\n')
             batchfile.write(slurm_prefix)
+            for command in self._stage_commands:
+                batchfile.write(command + '\n')
             batchfile.write(slurm_command)
 
         # if this is a dry run, set the status and exit
@@ -246,13 +298,23 @@ class Job(object):
             self.status = JobStatus.COMPLETED
             return 0
 
-        # submit the run script to the slurm controller
-        slurm = Slurm()
-        self._job_id = slurm.batch(run_script)
+        # the run manager submits the array once every job in it has been added
+        if self.array is not None:
+            self.array.add(
+                self, run_script,
+                [val for key, val in self._slurm_args.items() if key != 'output_file'])
+            return self.array
+
+        # submit the run script to the slurm controller, or whichever executor was set
+        executor = self.executor if self.executor is not None else Slurm()
+        self._job_id = executor.batch(run_script)
         self._has_been_executed = True
         return self._job_id
     # -----------------------------------------------
     def prevalidate(self, *args, **kwargs):
+        if self._stage_commands:
+            # the run script stages the data once the dependencies finish
+            return True
         if not self.data_ready:
             return False
         if not self.check_data_in_place():
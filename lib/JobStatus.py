@@ -24,7 +24,12 @@ StatusMap = {
     'WAITING_ON_INPUT': JobStatus.WAITING_ON_INPUT,
     'CANCELLED': JobStatus.CANCELLED,
     'COMPLETING': JobStatus.COMPLETED,
-    'TIMEOUT': JobStatus.TIMEOUT
+    'TIMEOUT': JobStatus.TIMEOUT,
+    'DEADLINE': JobStatus.TIMEOUT,
+    'NODE_FAIL': JobStatus.FAILED,
+    'BOOT_FAIL': JobStatus.FAILED,
+    'OUT_OF_MEMORY': JobStatus.FAILED,
+    'PREEMPTED': JobStatus.CANCELLED
 }
 
 ReverseMap = {
@@ -0,0 +1,104 @@
+"""
+File cadences for periodic data types
+"""
+import re
+
+# E3SM runs on a no-leap calendar
+DAYS_PER_MONTH = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+FIRST_DAY_OF_MONTH = [sum(DAYS_PER_MONTH[:x]) for x in range(12)]
+
+# the number of each unit in a year, the step has to divide the length of the
+# next unit up so that files never straddle a day, year etc
+_UNITS = {
+    'yearly': (1, 1),
+    'monthly': (12, 12),
+    'daily': (365, 365),
+    'hourly': (365 * 24, 24),
+}
+
+
+def get_frequency(type_options):
+    """
+    Return the frequency of a data_types entry, or None if it
+    isnt a periodic type. monthly = True is the same as frequency = monthly
+
+    Parameters:
+        type_options (dict): the data_types entry
+    """
+    if type_options.get('frequency'):
+        return type_options['frequency']
+    if type_options.get('monthly') in [True, 'True']:
+        return 'monthly'
+    return None
+
+
+class Cadence(object):
+    """
+    How often a periodic data type writes a file, parsed from a frequency
+    like yearly, monthly, 3monthly, daily or 6hourly
+
+    Every year holds the same slots_per_year files, which are named by the
+    date and time of their first sample
+    """
+
+    def __init__(self, frequency):
+        match = re.match(r'^(\d*)(yearly|monthly|daily|hourly)$', str(frequency).strip())
+        if not match:
+            raise ValueError('{} is not a valid frequency'.format(frequency))
+        step = int(match.group(1)) if match.group(1) else 1
+        unit = match.group(2)
+        per_year, period = _UNITS[unit]
+        if step < 1 or period % step:
+            raise ValueError('{} does not evenly divide a {}'.format(
+                frequency, 'year' if period == per_year else 'day'))
+        self.frequency = frequency
+        self.unit = unit
+        self.step = step
+        self.slots_per_year = per_year // step
+
+        # the (month, day, seconds) of the first sample of each file in a year
+        if unit == 'yearly':
+            dates = [(1, 1, 0)]
+        elif unit == 'monthly':
+            dates = [(x, 1, 0) for x in range(1, 13, step)]
+        else:
+            days = list()
+            for month, length in enumerate(DAYS_PER_MONTH):
+                days.extend([(month + 1, x) for x in range(1, length + 1)])
+            if unit == 'daily':
+                dates = [days[x] + (0,) for x in range(0, 365, step)]
+            else:
+                dates = [(month, day, hour * 3600)
+                         for month, day in days
+                         for hour in range(0, 24, step)]
+        self.dates = dates
+        # the same dates already formatted for the MONTH, DAY and SECONDS fields
+        self.fields = [('{:02d}'.format(month), '{:02d}'.format(day), '{:05d}'.format(seconds))
+                       for month, day, seconds in dates]
+
+    def slot(self, month=1, day=1, seconds=0):
+        """
+        Return the index inside a year of the file holding the given date
+        """
+        day_of_year = FIRST_DAY_OF_MONTH[month - 1] + day - 1
+        if self.unit == 'yearly':
+            return 0
+        elif self.unit == 'monthly':
+            return (month - 1) // self.step
+        elif self.unit == 'daily':
+            return day_of_year // self.step
+        return (day_of_year * 24 + seconds // 3600) // self.step
+
+    def date_string(self, year, slot):
+        """
+        Return the date stamp E3SM puts in the name of a file, YYYY for yearly,
+        YYYY-MM for monthly, YYYY-MM-DD for daily and YYYY-MM-DD-SSSSS for hourly files
+        """
+        month, day, seconds = self.fields[slot]
+        if self.unit == 'yearly':
+            return '{:04d}'.format(year)
+        elif self.unit == 'monthly':
+            return '{:04d}-{}'.format(year, month)
+        elif self.unit == 'daily':
+            return '{:04d}-{}-{}'.format(year, month, day)
+        return '{:04d}-{}-{}-{}'.format(year, month, day, seconds)
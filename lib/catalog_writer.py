@@ -0,0 +1,237 @@
+"""
+A single thread that applies all the catalog writes in batched transactions
+"""
+import logging
+import threading
+
+from Queue import Queue, Empty
+from time import time
+
+from models import insert_rows
+from lib.util import format_debug
+
+
+class Future(object):
+    """
+    The result of an operation queued on the CatalogWriter
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def set_result(self, result):
+        self._result = result
+        self._event.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the operation to be committed and return its result,
+        raising the exception it failed with if it failed
+        """
+        if not self._event.wait(timeout):
+            raise Exception('Timed out waiting for the catalog writer')
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+class CatalogWriter(object):
+    """
+    Applies queued catalog writes from one thread, committing everything
+    queued within flush_interval seconds, up to batch_size operations, in a
+    single transaction. Status updates and inserts for the same model are
+    coalesced into one statement each
+
+    Operations queued with wait=True are committed as soon as the writer
+    has drained what is already queued, and the caller blocks until then.
+    The caller must not be holding the write lock when it waits
+    """
+
+    def __init__(self, mutex, database, batch_size=500, flush_interval=0.5):
+        """
+        Parameters:
+            mutex (RWLock): the catalog lock, held for writing while a batch commits
+            database (SqliteDatabase): the catalog database
+            batch_size (int): the most operations to put in one transaction
+            flush_interval (float): the longest a queued operation waits to be committed
+        """
+        self._mutex = mutex
+        self._database = database
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue = Queue()
+        self._thread = None
+        self._started = False
+
+    def start(self):
+        if not self._started:
+            self._started = True
+            self._thread = threading.Thread(target=self._run, name='catalog_writer')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+        Commit everything queued and stop the writer thread
+        """
+        if not self._started:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._started = False
+
+    def submit(self, func, args=(), wait=False):
+        """
+        Queue func(*args) to be run inside the next batch
+
+        Returns:
+            a Future holding the return value of func
+        """
+        return self._put(('call', func, args), wait)
+
+    def submit_once(self, func, wait=False):
+        """
+        Queue func() to be run at the end of the next batch, once however many
+        times it is queued within that batch, for writes such as saving
+        everything the calls of the batch marked as changed
+
+        Returns:
+            a Future holding the return value of func
+        """
+        return self._put(('once', func, ()), wait)
+
+    def update_status(self, model, ids, status, wait=False):
+        """
+        Queue setting the local_status of the given model ids
+        """
+        return self._put(('status', model, (list(ids), status)), wait)
+
+    def insert(self, model, rows, wait=False):
+        """
+        Queue inserting a list of row dicts, see models.insert_rows
+        """
+        return self._put(('insert', model, list(rows)), wait)
+
+    def flush(self):
+        """
+        Block until everything queued so far has been committed
+        """
+        self._put(('call', lambda: None, ()), wait=True)
+
+    def _put(self, operation, wait):
+        future = Future()
+        self._queue.put((operation, future, wait))
+        if wait:
+            future.result()
+        return future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            urgent = item[2]
+            deadline = time() + self._flush_interval
+            while len(batch) < self._batch_size:
+                try:
+                    if urgent:
+                        item = self._queue.get_nowait()
+                    else:
+                        timeout = deadline - time()
+                        if timeout <= 0:
+                            break
+                        item = self._queue.get(timeout=timeout)
+                except Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                urgent = urgent or item[2]
+            self._commit(batch)
+
+    def _commit(self, batch):
+        """
+        Apply a batch in one transaction, then resolve its futures
+        """
+        results = list()
+        self._mutex.acquire()
+        try:
+            with self._database.atomic():
+                statuses = dict()
+                inserts = dict()
+                # (func, futures) of the once calls, in the order first queued
+                once = list()
+                for (kind, target, payload), future, _ in batch:
+                    if kind == 'status':
+                        ids, status = payload
+                        updates = statuses.setdefault(target, dict())
+                        for _id in ids:
+                            updates[_id] = status
+                        results.append((future, None, None))
+                    elif kind == 'insert':
+                        inserts.setdefault(target, list()).extend(payload)
+                        results.append((future, None, None))
+                    elif kind == 'once':
+                        for func, futures in once:
+                            if func == target:
+                                futures.append(future)
+                                break
+                        else:
+                            once.append((target, [future]))
+                    else:
+                        # calls see every write queued before them
+                        self._apply(statuses, inserts)
+                        try:
+                            with self._database.atomic():
+                                results.append((future, target(*payload), None))
+                        except Exception as e:
+                            logging.error(format_debug(e))
+                            results.append((future, None, e))
+                self._apply(statuses, inserts)
+                for func, futures in once:
+                    try:
+                        with self._database.atomic():
+                            result, exception = func(), None
+                    except Exception as e:
+                        logging.error(format_debug(e))
+                        result, exception = None, e
+                    results.extend((x, result, exception) for x in futures)
+        except Exception as e:
+            logging.error(format_debug(e))
+            results = [(x[1], None, e) for x in batch]
+        finally:
+            self._mutex.release()
+        for future, result, exception in results:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+    def _apply(self, statuses, inserts):
+        for model, rows in inserts.items():
+            insert_rows(model, rows)
+        inserts.clear()
+        for model, updates in statuses.items():
+            by_status = dict()
+            for _id, status in updates.items():
+                by_status.setdefault(status, list()).append(_id)
+            step = 500
+            for status, ids in by_status.items():
+                for idx in range(0, len(ids), step):
+                    (model
+                     .update(local_status=status)
+                     .where(model.id << ids[idx: idx + step])
+                     .execute())
+        statuses.clear()
@@ -0,0 +1,64 @@
+"""
+The interface the RunManager and jobs run their batch scripts through
+"""
+
+
+class Executor(object):
+    """
+    Runs the batch scripts written by Job._submit_cmd_to_slurm, whose #SBATCH
+    lines give the resources each needs. Job states are reported with the
+    slurm names, see lib.jobstatus.StatusMap
+    """
+
+    def batch(self, cmd, sargs=None):
+        """
+        Submit a batch script
+
+        Parameters:
+            cmd (str): The path to the run script that should be submitted
+            sargs (str): The additional arguments to submit it with
+        Returns:
+            job id of the new job
+        """
+        raise Exception('{} has not implemented the batch method'.format(type(self).__name__))
+
+    def showjobs(self, jobids):
+        """
+        Look up the state of many jobs at once
+
+        Parameters:
+            jobids (list): the job ids to get information about
+        Returns:
+            A dictionary mapping each job id (str) the executor knows about to a dict
+            with at least JobId and JobState, and the Reason a pending job is waiting
+        """
+        raise Exception('{} has not implemented the showjobs method'.format(type(self).__name__))
+
+    def queue(self):
+        """
+        Get the jobs that have not finished yet
+
+        Returns:
+            a list of dicts, one per job, with at least JOBID and STATE, where
+            STATE is R for running and PD for pending as squeue shows them
+        """
+        raise Exception('{} has not implemented the queue method'.format(type(self).__name__))
+
+    def cancel(self, jobid):
+        """
+        Cancel a job by id
+
+        Parameters:
+            jobid (str): The id of the job to cancel
+        Returns:
+            True of the job was canceled, False otherwise
+        """
+        raise Exception('{} has not implemented the cancel method'.format(type(self).__name__))
+
+    def max_running_jobs(self):
+        """
+        Returns:
+            how many jobs to keep submitted at once when max_jobs isnt set,
+            0 if that cant be found out right now
+        """
+        raise Exception('{} has not implemented the max_running_jobs method'.format(type(self).__name__))
@@ -4,22 +4,43 @@ import sys
 import threading
 import logging
 import random
+import operator
+import functools
 
-from time import sleep
+from bisect import bisect_left
+from time import sleep, time
 from peewee import *
 from enum import IntEnum
 from threading import Thread
+from collections import namedtuple
 
-from models import DataFile
+from models import DataFile, DataDirectory, SeriesStatus, CATALOG_MODELS, setup_catalog, insert_rows, update_rows
 from lib.jobstatus import JobStatus
+from lib.series import DataSeries
+from lib.cadence import get_frequency
+from lib.catalog_writer import CatalogWriter
+from lib import inotify
 from lib.util import print_debug
 from lib.util import print_line
+from lib.util import format_debug
 
-from lib.globus_interface import transfer as globus_transfer
+from lib.globus_interface import submit_transfer as globus_submit_transfer
+from lib.globus_interface import TaskMonitor
+from lib.globus_interface import list_directory as globus_list_directory
 from globus_cli.services.transfer import get_client
 
-from lib.ssh_interface import transfer as ssh_transfer
-from lib.ssh_interface import get_ssh_client
+from lib.ssh_interface import parallel_transfer as ssh_parallel_transfer
+from lib.ssh_interface import DEFAULT_WINDOW
+from lib.ssh_interface import SSHConnectionPool
+from lib.ssh_interface import remote_checksums
+from lib.ssh_interface import list_directory as ssh_list_directory
+from lib.verification import selected as verify_selected
+from lib.verification import compare_checksums
+from lib.verification import checksum_algorithm
+from lib.transfer_limits import TransferLimits
+from lib.local_copy import parallel_copy as local_parallel_copy
+from lib.local_copy import list_directory as local_list_directory
+from lib.local_copy import METHODS as LOCAL_COPY_METHODS
 
 
 class FileStatus(IntEnum):
@@ -28,6 +49,13 @@ class FileStatus(IntEnum):
     IN_TRANSIT = 2
 
 
+# The number of files of one case and datatype in each local status
+DataProgress = namedtuple('DataProgress', ['present', 'not_present', 'in_transit', 'total'])
+
+# how many times to run a globus verification task that fails before giving up
+GLOBUS_VERIFY_ATTEMPTS = 3
+
+
 class FileManager(object):
     """
     Manage all files required by jobs
@@ -36,29 +64,89 @@ class FileManager(object):
     def __init__(self, mutex, event_list, config, database='processflow.db'):
         """
         Parameters:
-            mutex (theading.Lock) the mutext for accessing the database
+            mutex (RWLock): the lock for accessing the database, a threading.Lock also works
             database (str): the path to where to create the sqlite database file
             config (dict): the global configuration dict
+
+        If config['global']['resume'] is set and the database already exists
+        the previous catalog is reused instead of being rebuilt from scratch
+
+        If config['global']['catalog_backend'] is 'series' periodic data types are
+        kept as DataSeries instead of a DataFile row per file. Daily and finer
+        data types are always kept as DataSeries
         """
         self._mutex = mutex
+        # reads share the lock when given an RWLock, a plain Lock serializes them
+        self._acquire_read = getattr(mutex, 'acquire_read', mutex.acquire)
+        self._release_read = getattr(mutex, 'release_read', mutex.release)
         self._event_list = event_list
         self._db_path = database
         self._config = config
+        # compiled data_types strings, see _compile_template
+        self._templates = dict()
+        # maps (case, datatype) to its DataSeries
+        self._series = dict()
+        self._use_series = config['global'].get('catalog_backend', 'table') == 'series'
+        self._resume = bool(config['global'].get('resume')) and os.path.exists(database)
+        # on resume, files that were present last run need to be checked again
+        self._check_present = self._resume
 
-        if os.path.exists(database):
-            os.remove(database)
+        if not self._resume:
+            # along with the write-ahead log from a previous run
+            for path in [database, database + '-wal', database + '-shm']:
+                if os.path.exists(path):
+                    os.remove(path)
 
         self._mutex.acquire()
         DataFile._meta.database.init(database)
-        if DataFile.table_exists():
-            DataFile.drop_table()
-
-        DataFile.create_table()
+        if not self._resume:
+            for table in CATALOG_MODELS:
+                if table.table_exists():
+                    table.drop_table()
+        setup_catalog()
         if self._mutex.locked():
             self._mutex.release()
-        
+
+        # series whose statuses changed since they were last saved, only
+        # touched by the writer thread, see _save_dirty_series
+        self._dirty_series = set()
+        # local paths of transferred files waiting to be verified, which
+        # update_local_status leaves alone until the verification records them
+        self._verifying = set()
+        # every write after the catalog is populated goes through the writer
+        self._writer = CatalogWriter(
+            mutex=self._mutex,
+            database=DataFile._meta.database)
+        self._writer.start()
+
+        # sftp connections, opened the first time each host is needed
+        usernames = dict()
+        for case, options in config['simulations'].items():
+            if isinstance(options, dict) and options.get('remote_username'):
+                usernames[options.get('remote_hostname')] = options['remote_username']
+        self._ssh_pool = SSHConnectionPool(
+            usernames=usernames,
+            key_filename=config['global'].get('ssh_key'),
+            keepalive=int(config['global'].get('ssh_keepalive', 30)))
+
+        # caps how much each sftp host and globus endpoint transfers at once
+        self._limits = TransferLimits(config, defaults={'sftp': 8})
+
+        # see update_remote_status, when each remote directory was last listed
+        # and the sizes of the remote files that didnt look complete yet
+        self._remote_listed = dict()
+        self._remote_sizes = dict()
+
+        # see watch
+        self._watcher = None
+        self._watched_inputs = set()
+        self._watch_found = False
+        self._wake_event = None
+
         self.thread_list = list()
         self.kill_event = threading.Event()
+        # polls every globus task this run submits
+        self._globus_monitor = TaskMonitor(event=self.kill_event)
 
     def __str__(self):
         # TODO: make this better
@@ -70,7 +158,7 @@ class FileManager(object):
         """
         Return a list of globus endpoints for all cases
         """
-        self._mutex.acquire()
+        self._acquire_read()
         q = (DataFile
              .select()
              .where(
@@ -79,7 +167,10 @@ class FileManager(object):
         for x in q.execute():
             if x.remote_uuid not in endpoints:
                 endpoints.append(x.remote_uuid)
-        self._mutex.release()
+        for x in self._series.values():
+            if x.transfer_type == 'globus' and x.remote_uuid not in endpoints:
+                endpoints.append(x.remote_uuid)
+        self._release_read()
         return endpoints
 
     def write_database(self):
@@ -91,7 +182,7 @@ class FileManager(object):
             'output',
             'file_list.txt')
         with open(file_list_path, 'w') as fp:
-            self._mutex.acquire()
+            self._acquire_read()
             try:
                 for case in self._config['simulations']:
                     if case in ['start_year', 'end_year', 'comparisons']:
@@ -103,16 +194,22 @@ class FileManager(object):
                          .select(DataFile.datatype)
                          .where(DataFile.case == case)
                          .distinct())
-                    for df_type in q.execute():
-                        _type = df_type.datatype
+                    types = [x.datatype for x in q.execute()]
+                    types += [x[1] for x in self._series if x[0] == case]
+                    for _type in types:
                         fp.write('===================================\n')
                         fp.write('\t' + _type + ':\n')
-                        datafiles = (DataFile
-                                     .select()
-                                     .where(
-                                            (DataFile.datatype == _type) &
-                                            (DataFile.case == case)))
-                        for datafile in datafiles.execute():
+                        series = self._series.get((case, _type))
+                        if series is not None:
+                            datafiles = (series.file(x) for x in xrange(len(series)))
+                        else:
+                            datafiles = (DataFile
+                                         .select()
+                                         .where(
+                                                (DataFile.datatype == _type) &
+                                                (DataFile.case == case))
+                                         .execute())
+                        for datafile in datafiles:
                             filestr = '-------------------------------------'
                             filestr += '\n\t     name: ' + datafile.name + '\n\t     local_status: '
                             if datafile.local_status == 0:
@@ -121,23 +218,24 @@ class FileManager(object):
                                 filestr += ' missing, '
                             else:
                                 filestr += ' in transit, '
+                            # series dont track the remote side
+                            remote_status = getattr(datafile, 'remote_status', 1)
                             filestr += '\n\t     remote_status: '
-                            if datafile.remote_status == 0:
+                            if remote_status == 0:
                                 filestr += ' present'
-                            elif datafile.remote_status == 1:
+                            elif remote_status == 1:
                                 filestr += ' missing'
                             else:
                                 filestr += ' in transit'
                             filestr += '\n\t     local_size: ' + \
-                                str(datafile.local_size)
+                                str(getattr(datafile, 'local_size', 0))
                             filestr += '\n\t     local_path: ' + datafile.local_path
                             filestr += '\n\t     remote_path: ' + datafile.remote_path + '\n'
                             fp.write(filestr)
             except Exception as e:
                 print_debug(e)
             finally:
-                if self._mutex.locked():
-                    self._mutex.release()
+                self._release_read()
 
     # def render_string(self, instring, **kwargs):
     #     """
@@ -149,9 +247,14 @@ class FileManager(object):
     #     return instring
 
     def check_data_ready(self, data_required, case, start_year=None, end_year=None):
-        self._mutex.acquire()
+        self._acquire_read()
         try:
             for datatype in data_required:
+                series = self._series.get((case, datatype))
+                if series is not None:
+                    if not series.all(FileStatus.PRESENT.value, start_year, end_year):
+                        return False
+                    continue
                 if start_year and end_year:
                     q = (DataFile
                             .select()
@@ -170,24 +273,126 @@ class FileManager(object):
                 for df in datafiles:
                     if not os.path.exists(df.local_path) and df.local_status == FileStatus.PRESENT.value:
                         df.local_status = FileStatus.NOT_PRESENT.value
-                        df.save()
+                        self._writer.update_status(DataFile, [df.id], df.local_status)
                     elif os.path.exists(df.local_path) and df.local_status == FileStatus.NOT_PRESENT.value:
                         df.local_status = FileStatus.PRESENT.value
-                        df.save()
+                        self._writer.update_status(DataFile, [df.id], df.local_status)
                     if df.local_status != FileStatus.PRESENT.value:
                         return False
             return True
         finally:
-            self._mutex.release()
+            self._release_read()
 
-    def render_file_string(self, data_type, data_type_option, case, year=None, month=None):
+    def data_ready_map(self, requirements):
+        """
+        Check the readiness of many (case, datatype, year range) requirements at once
+
+        A single grouped query counts the present and expected files for each
+        (case, datatype, year), so the cost doesnt depend on the number of requirements.
+        Requirements on a DataSeries are a range test on its statuses
+
+        Parameters:
+            requirements (list): a list of (case, datatype, start_year, end_year) tuples,
+                if start_year or end_year is None all years are required
+        Returns:
+            a dict mapping each requirement tuple to True if all its files are present
+        """
+        if not requirements:
+            return dict()
+        ready = dict()
+        self._acquire_read()
+        try:
+            for requirement in requirements:
+                series = self._series.get(requirement[:2])
+                if series is not None:
+                    ready[requirement] = series.all(
+                        FileStatus.PRESENT.value, requirement[2], requirement[3])
+        finally:
+            self._release_read()
+        requirements = [x for x in requirements if x not in ready]
+        if not requirements:
+            return ready
+        cases = list(set([x[0] for x in requirements]))
+        datatypes = list(set([x[1] for x in requirements]))
+
+        self._acquire_read()
+        try:
+            # sqlite evaluates the comparison to 0 or 1
+            present = fn.SUM(DataFile.local_status == FileStatus.PRESENT.value)
+            query = (DataFile
+                     .select(
+                         DataFile.case,
+                         DataFile.datatype,
+                         DataFile.year,
+                         fn.COUNT(DataFile.id),
+                         present)
+                     .where(
+                         (DataFile.case << cases) &
+                         (DataFile.datatype << datatypes))
+                     .group_by(DataFile.case, DataFile.datatype, DataFile.year)
+                     .tuples())
+            # the sorted years that still have files missing, for each (case, datatype)
+            missing_years = dict()
+            for case, datatype, year, expected, found in query.execute():
+                if found < expected:
+                    missing_years.setdefault((case, datatype), list()).append(year)
+        finally:
+            self._release_read()
+        for years in missing_years.values():
+            years.sort()
+
+        for requirement in requirements:
+            case, datatype, start_year, end_year = requirement
+            years = missing_years.get((case, datatype))
+            if not years:
+                ready[requirement] = True
+            elif start_year and end_year:
+                # is there a year with missing files inside the range
+                idx = bisect_left(years, start_year)
+                ready[requirement] = idx == len(years) or years[idx] > end_year
+            else:
+                ready[requirement] = False
+        return ready
+
+    def render_file_string(self, data_type, data_type_option, case, year=None, month=None,
+                           day=None, seconds=None):
         """
         Takes strings from the data_types dict and replaces the keywords with the appropriate values
         """
-        # setup the replacement dict
+        template = self._compile_template(data_type, data_type_option, case)
+        return template.format(
+            year='{:04d}'.format(year) if year is not None else 'YEAR',
+            month='{:02d}'.format(month) if month is not None else 'MONTH',
+            day='{:02d}'.format(day) if day is not None else 'DAY',
+            seconds='{:05d}'.format(seconds) if seconds is not None else 'SECONDS')
+
+    def _compile_template(self, data_type, data_type_option, case):
+        """
+        Turn a data_types string into a format string with every keyword that doesnt
+        depend on the date already replaced, leaving {year}, {month}, {day} and {seconds} fields
+
+        Templates are compiled once for each (data_type, data_type_option, case)
+        """
+        key = (data_type, data_type_option, case)
+        template = self._templates.get(key)
+        if template is not None:
+            return template
+
+        def escape(string):
+            return string.replace('{', '{{').replace('}', '}}')
+
+        type_options = self._config['data_types'][data_type]
+        if type_options.get(case) and type_options[case].get(data_type_option):
+            # per-case overrides only use the simulations keys
+            template = escape(type_options[case][data_type_option])
+            for item, val in self._config['simulations'][case].items():
+                if item.upper() in template:
+                    template = template.replace(item.upper(), escape(val))
+            self._templates[key] = template
+            return template
+
         start_year = int(self._config['simulations']['start_year'])
         end_year = int(self._config['simulations']['end_year'])
-
         replace = {
             'PROJECT_PATH': self._config['global']['project_path'],
             'REMOTE_PATH': self._config['simulations'][case].get('remote_path', ''),
@@ -196,30 +401,24 @@ class FileManager(object):
             'START_YR': '{:04d}'.format(start_year),
             'END_YR': '{:04d}'.format(end_year)
         }
-        if year is not None:
-            replace['YEAR'] = '{:04d}'.format(year)
-        if month is not None:
-            replace['MONTH'] = '{:02d}'.format(month)
-
-        if self._config['data_types'][data_type].get(case):
-            if self._config['data_types'][data_type][case].get(data_type_option):
-                instring = self._config['data_types'][data_type][case][data_type_option]
-                for item in self._config['simulations'][case]:
-                    if item.upper() in self._config['data_types'][data_type][case][data_type_option]:
-                        instring = instring.replace(item.upper(), self._config['simulations'][case][item])
-                return instring
-        
-        instring = self._config['data_types'][data_type][data_type_option]
+        template = escape(type_options[data_type_option])
+        for string, field in [('YEAR', '{year}'), ('MONTH', '{month}'),
+                              ('DAY', '{day}'), ('SECONDS', '{seconds}')]:
+            template = template.replace(string, field)
         for string, val in replace.items():
-            if string in instring:
-                instring = instring.replace(string, val)
-        return instring
+            if string in template:
+                template = template.replace(string, escape(val))
+        self._templates[key] = template
+        return template
 
     def populate_file_list(self):
         """
         Populate the database with the required DataFile entries
+
+        When resuming from a previous catalog, the existing entries are reconciled
+        against the current config instead of being recreated
         """
-        msg = 'Creating file table'
+        msg = 'Creating file table' if not self._resume else 'Reconciling file table with config'
         print_line(
             line=msg,
             event_list=self._event_list)
@@ -229,6 +428,8 @@ class FileManager(object):
         with DataFile._meta.database.atomic():
             self._mutex.acquire()
 
+            expected = dict()
+            series = dict()
             # for each case
             for case in self._config['simulations']:
                 if case in ['start_year', 'end_year', 'comparisons']:
@@ -246,38 +447,51 @@ class FileManager(object):
                         data_type_option='local_path',
                         case=case)
 
+                    # the fields shared by every file of this type
+                    base = {
+                        'local_status': FileStatus.NOT_PRESENT.value,
+                        'case': case,
+                        'remote_status': FileStatus.NOT_PRESENT.value,
+                        'year': 0,
+                        'month': 0,
+                        'datatype': _type,
+                        'local_size': 0,
+                        'transfer_type': self._config['simulations'][case]['transfer_type'],
+                        'remote_uuid': self._config['simulations'][case].get('remote_uuid', ''),
+                        'remote_hostname': self._config['simulations'][case].get('remote_hostname', '')
+                    }
                     new_files = list()
-                    if self._config['data_types'][_type].get('monthly'):
-                        # handle monthly data
-                        for year in range(start_year, end_year + 1):
-                            for month in range(1, 13):
-                                filename = self.render_file_string(
-                                    data_type=_type,
-                                    data_type_option='file_format',
-                                    case=case,
-                                    year=year,
-                                    month=month)
-                                r_path = self.render_file_string(
-                                    data_type=_type,
-                                    data_type_option='remote_path',
-                                    case=case,
-                                    year=year,
-                                    month=month)
-                                new_files.append({
-                                    'name': filename,
-                                    'remote_path': os.path.join(r_path, filename),
-                                    'local_path': os.path.join(local_path, filename),
-                                    'local_status': FileStatus.NOT_PRESENT.value,
-                                    'case': case,
-                                    'remote_status': FileStatus.NOT_PRESENT.value,
-                                    'year': year,
-                                    'month': month,
-                                    'datatype': _type,
-                                    'local_size': 0,
-                                    'transfer_type': self._config['simulations'][case]['transfer_type'],
-                                    'remote_uuid': self._config['simulations'][case].get('remote_uuid', ''),
-                                    'remote_hostname': self._config['simulations'][case].get('remote_hostname', '')
-                                })
+                    frequency = get_frequency(self._config['data_types'][_type])
+                    if frequency:
+                        # handle periodic data
+                        data_series = DataSeries(
+                            case=case,
+                            datatype=_type,
+                            start_year=start_year,
+                            end_year=end_year,
+                            name_format=self._compile_template(_type, 'file_format', case),
+                            remote_format=self._compile_template(_type, 'remote_path', case),
+                            local_path=local_path,
+                            status=FileStatus.NOT_PRESENT.value,
+                            transfer_type=base['transfer_type'],
+                            remote_uuid=base['remote_uuid'],
+                            remote_hostname=base['remote_hostname'],
+                            frequency=frequency)
+                        if self._use_series or data_series.cadence.slots_per_year > 12:
+                            # kept as a series, no rows are needed
+                            if not os.path.exists(local_path):
+                                os.makedirs(local_path)
+                            series[(case, _type)] = data_series
+                            continue
+                        for offset in xrange(len(data_series)):
+                            datafile = data_series.file(offset)
+                            new_file = base.copy()
+                            new_file['name'] = datafile.name
+                            new_file['remote_path'] = datafile.remote_path
+                            new_file['local_path'] = datafile.local_path
+                            new_file['year'] = datafile.year
+                            new_file['month'] = datafile.month
+                            new_files.append(new_file)
                     else:
                         # handle one-off data
                         filename = self.render_file_string(
@@ -288,28 +502,25 @@ class FileManager(object):
                                     data_type=_type,
                                     data_type_option='remote_path',
                                     case=case)
-                        new_files.append({
-                            'name': filename,
-                            'remote_path': os.path.join(r_path, filename),
-                            'local_path': os.path.join(local_path, filename),
-                            'local_status': FileStatus.NOT_PRESENT.value,
-                            'case': case,
-                            'remote_status': FileStatus.NOT_PRESENT.value,
-                            'year': 0,
-                            'month': 0,
-                            'datatype': _type,
-                            'local_size': 0,
-                            'transfer_type': self._config['simulations'][case]['transfer_type'],
-                            'remote_uuid': self._config['simulations'][case].get('remote_uuid', ''),
-                            'remote_hostname': self._config['simulations'][case].get('remote_hostname', '')
-                        })
+                        new_file = base.copy()
+                        new_file['name'] = filename
+                        new_file['remote_path'] = os.path.join(r_path, filename)
+                        new_file['local_path'] = os.path.join(local_path, filename)
+                        new_files.append(new_file)
                     tail, _ = os.path.split(new_files[0]['local_path'])
                     if not os.path.exists(tail):
                         os.makedirs(tail)
-                    step = 50
-                    for idx in range(0, len(new_files), step):
-                        DataFile.insert_many(
-                            new_files[idx: idx + step]).execute()
+                    expected[(case, _type)] = new_files
+
+            if self._resume:
+                new_files = self._reconcile_file_list(expected)
+                self._restore_series(series)
+            else:
+                new_files = [x for files in expected.values() for x in files]
+            self._invalidate_directories([x['local_path'] for x in new_files])
+            insert_rows(DataFile, new_files)
+            self._series = series
+            self._save_series(series.values())
 
             if self._mutex.locked():
                 self._mutex.release()
@@ -317,16 +528,135 @@ class FileManager(object):
             print_line(
                 line=msg,
                 event_list=self._event_list)
+
+    def _reconcile_file_list(self, expected):
+        """
+        Diff the existing catalog against the files the current config expects,
+        removing entries that are no longer needed and keeping the status of the rest
+
+        Parameters:
+            expected (dict): maps (case, datatype) to the list of expected DataFile dicts
+        Returns:
+            a list of the expected DataFile dicts that arent in the catalog yet
+        """
+        cases = [x for x in self._config['simulations']
+                 if x not in ['start_year', 'end_year', 'comparisons']]
+        config_types = self._config['data_types'].keys()
+
+        # drop cases that have been removed from the config
+        removed = (DataFile
+                   .delete()
+                   .where(~(DataFile.case << cases))
+                   .execute())
+
+        missing = list()
+        q = (DataFile
+             .select(DataFile.case, DataFile.datatype)
+             .distinct())
+        existing_types = [(x.case, x.datatype) for x in q.execute()]
+        for case, datatype in existing_types:
+            if (case, datatype) in expected:
+                continue
+            # types generated by jobs (climos etc) arent part of the config,
+            # only remove types the config used to ask for
+            if datatype in config_types:
+                removed += (DataFile
+                            .delete()
+                            .where(
+                                (DataFile.case == case) &
+                                (DataFile.datatype == datatype))
+                            .execute())
+
+        for (case, datatype), files in expected.items():
+            q = (DataFile
+                 .select()
+                 .where(
+                     (DataFile.case == case) &
+                     (DataFile.datatype == datatype)))
+            current = {x.local_path: x for x in q.execute()}
+            for new_file in files:
+                datafile = current.pop(new_file['local_path'], None)
+                if datafile is None:
+                    missing.append(new_file)
+                    continue
+                changed = False
+                for key in ['remote_path', 'transfer_type', 'remote_uuid', 'remote_hostname']:
+                    if getattr(datafile, key) != new_file[key]:
+                        setattr(datafile, key, new_file[key])
+                        changed = True
+                # transfers dont survive a restart
+                if datafile.local_status == FileStatus.IN_TRANSIT.value:
+                    datafile.local_status = FileStatus.NOT_PRESENT.value
+                    changed = True
+                if changed:
+                    datafile.save()
+            # anything left over is outside the configured years
+            if current:
+                ids = [x.id for x in current.values()]
+                step = 500
+                for idx in range(0, len(ids), step):
+                    removed += (DataFile
+                                .delete()
+                                .where(DataFile.id << ids[idx: idx + step])
+                                .execute())
+
+        msg = 'Catalog reconciled, {added} files added and {removed} removed'.format(
+            added=len(missing), removed=removed)
+        print_line(msg, self._event_list)
+        return missing
     
+    def _restore_series(self, series):
+        """
+        Copy the saved statuses of the previous run onto the new series
+        and drop the saved series the config no longer asks for
+
+        Parameters:
+            series (dict): maps (case, datatype) to the new DataSeries
+        """
+        for saved in SeriesStatus.select().execute():
+            new_series = series.get((saved.case, saved.datatype))
+            if new_series is None:
+                saved.delete_instance()
+                continue
+            if saved.frequency != new_series.frequency:
+                # the files are different, everything has to be checked again
+                continue
+            new_series.restore(saved.start_year, bytearray(saved.local_status))
+            # transfers dont survive a restart
+            new_series.set_status(
+                new_series.find(FileStatus.IN_TRANSIT.value),
+                FileStatus.NOT_PRESENT.value)
+
+    def _save_series(self, series_list):
+        """
+        Write the statuses of the given series to the catalog
+        """
+        for series in series_list:
+            (SeriesStatus
+             .insert(
+                 case=series.case,
+                 datatype=series.datatype,
+                 start_year=series.start_year,
+                 frequency=series.frequency,
+                 local_status=bytes(series.local_status))
+             .upsert()
+             .execute())
+
     def terminate_transfers(self):
         self.kill_event.set()
         for thread in self.thread_list:
             msg = 'terminating {}, this may take a moment'.format(thread.name)
             print_line(msg, self._event_list)
             thread.join()
+        self._globus_monitor.stop()
+        if self._watcher is not None:
+            self._watcher.stop()
+            self._watcher = None
+        self._ssh_pool.close()
+        self._writer.stop()
 
     def print_db(self):
-        self._mutex.acquire()
+        self._acquire_read()
         for df in DataFile.select():
             print {
                 'case': df.case,
@@ -336,7 +666,18 @@ class FileManager(object):
                 'remote_path': df.remote_path,
                 'transfer_type': df.transfer_type,
             }
-        self._mutex.release()
+        for series in self._series.values():
+            for offset in xrange(len(series)):
+                df = series.file(offset)
+                print {
+                    'case': df.case,
+                    'type': df.datatype,
+                    'name': df.name,
+                    'local_path': df.local_path,
+                    'remote_path': df.remote_path,
+                    'transfer_type': df.transfer_type,
+                }
+        self._release_read()
     
     def add_files(self, data_type, file_list):
         """
@@ -354,216 +695,1015 @@ class FileManager(object):
                 month (int): the month of the file, optional
                 remote_uuid (str): remote globus endpoint id, optional
                 remote_hostname (str): remote hostname for sftp transfer, optional
+        Returns:
+            a Future that is resolved once the files are committed
         """
-        self._mutex.acquire()
-        try:
-            new_files = list()
-            for file in file_list:
-                new_files.append({
-                    'name': file['name'],
-                    'local_path': file['local_path'],
-                    'local_status': file.get('local_status', FileStatus.NOT_PRESENT.value),
-                    'datatype': data_type,
-                    'case': file['case'],
-                    'year': file.get('year', 0),
-                    'month': file.get('month', 0),
-                    'remote_uuid': file.get('remote_uuid', ''),
-                    'remote_hostname': file.get('remote_hostname', ''),
-                    'remote_path': file.get('remote_path', ''),
-                    'remote_status': FileStatus.NOT_PRESENT.value,
-                    'local_size': 0,
-                    'transfer_type': file.get('transfer_type', 'local')
-                })
-            step = 50
-            for idx in range(0, len(new_files), step):
-                DataFile.insert_many(
-                    new_files[idx: idx + step]).execute()
-        finally:
-            self._mutex.release()
-        
+        new_files = list()
+        for file in file_list:
+            new_files.append({
+                'name': file['name'],
+                'local_path': file['local_path'],
+                'local_status': file.get('local_status', FileStatus.NOT_PRESENT.value),
+                'datatype': data_type,
+                'case': file['case'],
+                'year': file.get('year', 0),
+                'month': file.get('month', 0),
+                'remote_uuid': file.get('remote_uuid', ''),
+                'remote_hostname': file.get('remote_hostname', ''),
+                'remote_path': file.get('remote_path', ''),
+                'remote_status': FileStatus.NOT_PRESENT.value,
+                'local_size': 0,
+                'transfer_type': file.get('transfer_type', 'local')
+            })
+        self._writer.submit(
+            self._invalidate_directories,
+            ([x['local_path'] for x in new_files],))
+        return self._writer.insert(DataFile, new_files)
 
-    def update_local_status(self):
+    def update_local_status(self, directories=None):
         """
         Update the database with the local status of the expected files
 
+        Each directory holding expected files is listed once and the listing
+        is diffed against the expected file names. Directories whose modification
+        time hasnt changed since they were last listed are skipped. The scan only
+        holds the read lock, the status changes are committed together by the
+        catalog writer
+
+        Parameters:
+            directories (set): only check these directories, and check them even
+                if their modification time hasnt changed, default is all of them
+
         Return True if there was new local data found, False othewise
         """
-        self._mutex.acquire()
+        if directories is not None and not directories:
+            return False
+        self._acquire_read()
         try:
             query = (DataFile
-                     .select()
-                     .where(
-                            (DataFile.local_status == FileStatus.NOT_PRESENT.value) |
-                            (DataFile.local_status == FileStatus.IN_TRANSIT.value)))
+                     .select(
+                         DataFile.id,
+                         DataFile.local_path,
+                         DataFile.local_status,
+                         DataFile.transfer_type,
+                         DataFile.case)
+                     .tuples())
+            if not self._check_present:
+                # unless we're resuming, only look for new files
+                query = query.where(
+                    (DataFile.local_status == FileStatus.NOT_PRESENT.value) |
+                    (DataFile.local_status == FileStatus.IN_TRANSIT.value))
+            if directories is not None:
+                prefixes = [DataFile.local_path.startswith(os.path.join(x, '')) for x in directories]
+                query = query.where(reduce(operator.or_, prefixes))
+            expected = dict()
+            for row in query.execute():
+                directory, name = os.path.split(row[1])
+                if directories is None or directory in directories:
+                    expected.setdefault(directory, list()).append((name,) + row)
+            if directories is None:
+                known = {x.path: x.mtime for x in DataDirectory.select().execute()}
+            else:
+                known = dict()
+
             printed = False
-            change = False
-            for datafile in query.execute():
-                marked = False
-                if os.path.exists(datafile.local_path):
-                    if datafile.local_status == FileStatus.NOT_PRESENT.value or datafile.local_status == FileStatus.IN_TRANSIT.value:
-                        datafile.local_status = FileStatus.PRESENT.value
-                        marked = True
-                        change = True
-                else:
-                    if datafile.transfer_type == 'local':
+            now_present = list()
+            now_missing = list()
+            seen = dict()
+            for directory, datafiles in expected.items():
+                try:
+                    mtime = os.stat(directory).st_mtime
+                    contents = set(os.listdir(directory))
+                except OSError:
+                    mtime = None
+                    contents = set()
+                if mtime is not None and known.get(directory) == mtime:
+                    continue
+                for name, _id, local_path, local_status, transfer_type, case in datafiles:
+                    if local_path in self._verifying:
+                        continue
+                    if name in contents:
+                        if local_status != FileStatus.PRESENT.value:
+                            now_present.append(_id)
+                        continue
+                    if transfer_type == 'local':
                         msg = '{case} transfer_type is local, but {filename} is not present'.format(
-                            case=datafile.case, filename=datafile.name)
+                            case=case, filename=name)
                         logging.error(msg)
                         if not printed:
                             print_line(msg, self._event_list)
                             printed = True
-                    if datafile.local_status == FileStatus.PRESENT.value:
-                        datafile.local_status = FileStatus.NOT_PRESENT.value
-                        marked = True
-                if marked:
-                    datafile.save()
+                    if local_status == FileStatus.PRESENT.value:
+                        now_missing.append(_id)
+                # coarse mtime resolution could hide a file written in the same
+                # second, so dont trust very recent changes
+                if mtime is not None and time() - mtime >= 2:
+                    seen[directory] = mtime
+
+            changed_series = list()
+            series_found = 0
+            for series in self._series.values():
+                directory = series.local_path
+                if directories is not None and directory not in directories:
+                    continue
+                if self._check_present:
+                    offsets = range(len(series))
+                else:
+                    offsets = series.find(FileStatus.NOT_PRESENT.value) + \
+                        series.find(FileStatus.IN_TRANSIT.value)
+                if not offsets:
+                    continue
+                try:
+                    mtime = os.stat(directory).st_mtime
+                    contents = set(os.listdir(directory))
+                except OSError:
+                    mtime = None
+                    contents = set()
+                if mtime is not None and known.get(directory) == mtime:
+                    continue
+                found = list()
+                lost = list()
+                missing = 0
+                for offset in offsets:
+                    local_status = series.local_status[offset]
+                    if self._verifying and \
+                            os.path.join(directory, series.name(offset)) in self._verifying:
+                        continue
+                    if series.name(offset) in contents:
+                        if local_status != FileStatus.PRESENT.value:
+                            found.append(offset)
+                        continue
+                    missing += 1
+                    if local_status == FileStatus.PRESENT.value:
+                        lost.append(offset)
+                if series.transfer_type == 'local' and missing and not printed:
+                    msg = '{case} transfer_type is local, but {datatype} files are not present'.format(
+                        case=series.case, datatype=series.datatype)
+                    logging.error(msg)
+                    print_line(msg, self._event_list)
+                    printed = True
+                if found or lost:
+                    changed_series.append((series, found, lost))
+                    series_found += len(found)
+                if mtime is not None and time() - mtime >= 2:
+                    seen[directory] = mtime
+        finally:
+            self._release_read()
+
+        try:
+            self._writer.update_status(DataFile, now_present, FileStatus.PRESENT.value)
+            self._writer.update_status(DataFile, now_missing, FileStatus.NOT_PRESENT.value)
+            self._writer.submit(self._record_scan, (changed_series, seen), wait=True)
+            if directories is None:
+                self._check_present = False
         except OperationalError as operror:
             line = 'Error writing to database, database is locked by another process'
             print_line(
                 line=line,
                 event_list=self._event_list)
             logging.error(line)
+            return False
+        found = len(now_present) > 0 or series_found > 0
+        if directories is not None:
+            self._watch_found = self._watch_found or found
+        elif self._watch_found:
+            # files the watcher found since the last full check count as new
+            self._watch_found = False
+            found = True
+        return found
+
+    def _record_scan(self, changed_series, seen):
+        """
+        Apply the series status changes and directory mtimes found by
+        update_local_status, run by the catalog writer
+
+        Parameters:
+            changed_series (list): (DataSeries, found offsets, lost offsets) tuples
+            seen (dict): maps directories to their mtime
+        """
+        for series, found, lost in changed_series:
+            series.set_status(found, FileStatus.PRESENT.value)
+            series.set_status(lost, FileStatus.NOT_PRESENT.value)
+        self._save_series([x[0] for x in changed_series])
+        for directory, mtime in seen.items():
+            DataDirectory.insert(path=directory, mtime=mtime).upsert().execute()
+
+    def watch(self, wake_event, output_path=None):
+        """
+        Watch the directories holding expected files with inotify, so new files
+        are added to the catalog as soon as they are written instead of on the
+        next update_local_status. wake_event is set whenever a watched directory
+        gets a new file, including anything under output_path
+
+        Directories on filesystems where inotify misses changes made by other
+        nodes, like Lustre and GPFS, arent watched and are left to update_local_status
+
+        Parameters:
+            wake_event (threading.Event): set when new files arrive
+            output_path (str): a directory to watch recursively for job output
+        Returns:
+            the list of watched directories, empty if inotify isnt available
+        """
+        if not inotify.available():
+            logging.info('inotify is not available, polling for new files')
+            return list()
+        self._acquire_read()
+        try:
+            directories = set(os.path.dirname(x[0]) for x in (DataFile
+                                                              .select(DataFile.local_path)
+                                                              .distinct()
+                                                              .tuples()
+                                                              .execute()))
+            directories.update(x.local_path for x in self._series.values())
         finally:
-            if self._mutex.locked():
-                self._mutex.release()
-        return change
+            self._release_read()
+
+        self._wake_event = wake_event
+        self._watcher = inotify.InotifyWatcher(callback=self._files_arrived)
+        for directory in sorted(directories):
+            if not inotify.reliable(directory):
+                logging.info('not watching {}, its filesystem is polled instead'.format(directory))
+            elif self._watcher.add_watch(directory):
+                self._watched_inputs.add(directory)
+        if output_path and inotify.reliable(output_path):
+            self._watcher.add_watch(output_path, recursive=True)
+        self._watcher.start()
+        return self._watcher.watched()
+
+    def _files_arrived(self, paths):
+        """
+        Called by the inotify watcher with the paths of new files, or None
+        if events were lost
+        """
+        if paths is None:
+            self.update_local_status(self._watched_inputs)
+        else:
+            directories = set(os.path.dirname(x) for x in paths) & self._watched_inputs
+            if directories:
+                self.update_local_status(directories)
+        self._wake_event.set()
+
+    def _invalidate_directories(self, paths):
+        """
+        Forget the recorded mtime of the directories holding the given files so that
+        the next update_local_status checks them again
+
+        Parameters:
+            paths (list): a list of file paths
+        """
+        directories = list(set([os.path.dirname(x) for x in paths]))
+        step = 500
+        for idx in range(0, len(directories), step):
+            (DataDirectory
+             .delete()
+             .where(DataDirectory.path << directories[idx: idx + step])
+             .execute())
+
+    def progress(self):
+        """
+        Count the files of each case and datatype by local status, using
+        one GROUP BY over the table and the in-memory series
+
+        Returns:
+            a dict mapping (case, datatype) to a DataProgress
+        """
+        counts = dict()
+        self._acquire_read()
+        try:
+            q = (DataFile
+                 .select(DataFile.case, DataFile.datatype, DataFile.local_status, fn.COUNT(DataFile.id))
+                 .group_by(DataFile.case, DataFile.datatype, DataFile.local_status)
+                 .tuples())
+            for case, datatype, status, count in q.execute():
+                counts.setdefault((case, datatype), [0, 0, 0])[status] += count
+            for key, series in self._series.items():
+                counts[key] = [series.count(x.value) for x in FileStatus]
+        finally:
+            self._release_read()
+        return {key: DataProgress(*(value + [sum(value)])) for key, value in counts.items()}
 
     def all_data_local(self):
         """
         Returns True if all data is local, False otherwise
         """
-        self._mutex.acquire()
+        self._acquire_read()
         try:
-            query = (DataFile
-                     .select()
-                     .where(
-                         (DataFile.local_status == FileStatus.NOT_PRESENT.value) |
-                         (DataFile.local_status == FileStatus.IN_TRANSIT.value)))
-            missing_data = query.execute()
-            # if any of the data is missing, not all data is local
-            if missing_data:
-                logging.debug('All data is not local, missing the following')
-                logging.debug([x.name for x in missing_data])
-                return False
+            missing = (DataFile
+                       .select(DataFile.id)
+                       .where(DataFile.local_status != FileStatus.PRESENT.value)
+                       .exists())
+            if not missing:
+                missing = any(not series.all(FileStatus.PRESENT.value)
+                              for series in self._series.values())
         except Exception as e:
             print_debug(e)
+            missing = False
         finally:
-            if self._mutex.locked():
-                self._mutex.release()
+            self._release_read()
+        if missing:
+            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                for (case, datatype), progress in sorted(self.progress().items()):
+                    if progress.present != progress.total:
+                        logging.debug('All data is not local, missing {} of {} {} {} files'.format(
+                            progress.total - progress.present, progress.total, case, datatype))
+            return False
         logging.debug('All data is local')
         return True
 
-    def transfer_needed(self, event_list, event):
+    def update_remote_status(self, force=False):
+        """
+        Take an inventory of the remote directories holding files that are still
+        needed, with one listing per directory, and record which of the files
+        exist on the remote and their size
+
+        A remote file is only marked present once it looks complete, its size hasnt
+        changed since the last listing or it hasnt been modified for remote_settle
+        seconds. Files that are still being written are marked in transit. Each
+        directory is listed at most once every remote_inventory_interval seconds
+
+        Parameters:
+            force (bool): list every directory, even if it was listed recently
+        Returns:
+            the number of directories listed
+        """
+        interval = float(self._config['global'].get('remote_inventory_interval', 300))
+        settle = float(self._config['global'].get('remote_settle', 60))
+        now = time()
+
+        # the files that are still needed, by the remote directory holding them
+        directories = dict()
+        self._acquire_read()
+        try:
+            query = (DataFile
+                     .select(
+                         DataFile.id,
+                         DataFile.remote_path,
+                         DataFile.transfer_type,
+                         DataFile.remote_uuid,
+                         DataFile.remote_hostname)
+                     .where(
+                         (DataFile.local_status == FileStatus.NOT_PRESENT.value) &
+                         (DataFile.remote_status != FileStatus.PRESENT.value) &
+                         (DataFile.transfer_type != 'local'))
+                     .tuples())
+            for _id, remote_path, transfer_type, remote_uuid, remote_hostname in query.execute():
+                host = remote_uuid if transfer_type == 'globus' else remote_hostname
+                directory, name = os.path.split(remote_path)
+                directories.setdefault((transfer_type, host, directory), list()).append(
+                    (name, remote_path, _id))
+            for series in self._series.values():
+                if series.transfer_type == 'local':
+                    continue
+                host = series.remote_uuid if series.transfer_type == 'globus' else series.remote_hostname
+                for offset in series.find(FileStatus.NOT_PRESENT.value):
+                    if series.remote_status[offset] == FileStatus.PRESENT.value:
+                        continue
+                    remote_path = series.file(offset).remote_path
+                    directory, name = os.path.split(remote_path)
+                    directories.setdefault((series.transfer_type, host, directory), list()).append(
+                        (name, remote_path, (series, offset)))
+        finally:
+            self._release_read()
+
+        stale = [x for x in directories
+                 if force or now - self._remote_listed.get(x, 0) >= interval]
+        if not stale:
+            return 0
+        rows = list()
+        series_updates = list()
+        globus_client = None
+        sftp_clients = dict()
+        listed = 0
+        try:
+            for key in stale:
+                transfer_type, host, directory = key
+                try:
+                    if transfer_type == 'globus':
+                        if globus_client is None:
+                            globus_client = get_client()
+                        contents = globus_list_directory(globus_client, host, directory)
+                    elif transfer_type == 'sftp':
+                        if host not in sftp_clients:
+                            sftp_clients[host] = self._ssh_pool.get(host).open_sftp()
+                        contents = ssh_list_directory(sftp_clients[host], directory)
+                    elif transfer_type == 'local_copy':
+                        contents = local_list_directory(directory)
+                    else:
+                        continue
+                except Exception as e:
+                    print_debug(e)
+                    contents = None
+                if contents is None:
+                    msg = 'Unable to list {}:{}, it will be listed again next time'.format(
+                        host, directory)
+                    logging.error(msg)
+                    continue
+                self._remote_listed[key] = now
+                listed += 1
+                for name, remote_path, ref in directories[key]:
+                    size, mtime = contents.get(name, (None, None))
+                    if size is None:
+                        status = FileStatus.NOT_PRESENT.value
+                    elif size == self._remote_sizes.get(remote_path) or now - mtime >= settle:
+                        status = FileStatus.PRESENT.value
+                    else:
+                        status = FileStatus.IN_TRANSIT.value
+                    if status == FileStatus.IN_TRANSIT.value:
+                        self._remote_sizes[remote_path] = size
+                    else:
+                        self._remote_sizes.pop(remote_path, None)
+                    if isinstance(ref, tuple):
+                        series_updates.append(ref + (status, size))
+                    else:
+                        rows.append((status, size, ref))
+        finally:
+            for sftp_client in sftp_clients.values():
+                sftp_client.close()
+        self._writer.submit(self._set_remote_status, (rows, series_updates), wait=True)
+        logging.info('listed %d remote directories', listed)
+        return listed
+
+    def _set_remote_status(self, rows, series_updates):
+        """
+        Record the results of update_remote_status, run by the catalog writer
+
+        Parameters:
+            rows (list): (remote_status, remote_size, id) tuples for DataFile rows
+            series_updates (list): (series, offset, remote_status, remote_size) tuples
+        """
+        update_rows(DataFile, ['remote_status', 'remote_size'], rows)
+        for series, offset, status, size in series_updates:
+            series.remote_status[offset] = status
+            if size is None:
+                series.remote_size.pop(offset, None)
+            else:
+                series.remote_size[offset] = size
+
+    def transfer_needed(self, event_list, event, priorities=None):
         """
         Start a transfer job for any files that arent local, but do exist remotely
 
+        Unless remote_inventory is turned off, only files that update_remote_status
+        found complete on the remote are requested. Missing files are ranked by the
+        jobs waiting on them and sent in waves of transfer_wave_size files, the next
+        wave starts once less than half of the one before is still in transit. A globus
+        endpoint already running max_transfers tasks gets no new task until one finishes
+
         Globus user must already be logged in
-        """
 
-        # required files dont exist locally, do exist remotely
-        # or if they do exist locally have a different local and remote size
-        target_files = list()
-        self._mutex.acquire()
+        Parameters:
+            event_list (EventList): the event list
+            event (threading.Event): the kill event
+            priorities (list): (rank, requirements) tuples from RunManager.transfer_priorities,
+                best first. Without them files are sent in year order
+        """
+        wave_size = int(self._config['global'].get('transfer_wave_size', 500))
+        inventory = self._config['global'].get('remote_inventory', True)
+        if inventory:
+            self.update_remote_status()
+        candidates = list()
+        self._acquire_read()
         try:
+            in_flight = (DataFile
+                         .select()
+                         .where(DataFile.local_status == FileStatus.IN_TRANSIT.value)
+                         .count())
+            in_flight += sum(x.count(FileStatus.IN_TRANSIT.value) for x in self._series.values())
+            if in_flight > wave_size // 2:
+                # the last wave is still going
+                return
             q = (DataFile
-                 .select(DataFile.case)
+                 .select()
                  .where(
-                     DataFile.local_status == FileStatus.NOT_PRESENT.value))
-            caselist = [x.case for x in q.execute()]
-            if not caselist or len(caselist) == 0:
-                return
-            cases = list()
-            for case in caselist:
-                if case not in cases:
-                    cases.append(case)
+                     (DataFile.local_status == FileStatus.NOT_PRESENT.value) &
+                     (DataFile.transfer_type != 'local')))
+            if inventory:
+                q = q.where(DataFile.remote_status == FileStatus.PRESENT.value)
+            # the catalog entry of each file goes along with it so the
+            # transfer can record whether it succeeded
+            for datafile in q.execute():
+                candidates.append((datafile, {
+                    'local_path': datafile.local_path,
+                    'remote_path': datafile.remote_path,
+                    'id': datafile.id
+                }))
+            for series in self._series.values():
+                if series.transfer_type == 'local':
+                    continue
+                for offset in series.find(FileStatus.NOT_PRESENT.value):
+                    if inventory and series.remote_status[offset] != FileStatus.PRESENT.value:
+                        continue
+                    datafile = series.file(offset)
+                    candidates.append((datafile, {
+                        'local_path': datafile.local_path,
+                        'remote_path': datafile.remote_path,
+                        'series': series,
+                        'offset': offset
+                    }))
+        except Exception as e:
+            print_debug(e)
+            return False
+        finally:
+            self._release_read()
+        if not candidates:
+            return
 
-            for case in cases:
-                q = (DataFile
-                     .select()
-                     .where(
-                            (DataFile.case == case) &
-                            (DataFile.local_status == FileStatus.NOT_PRESENT.value)))
-                required_files = [x for x in q.execute()]
-                for file in required_files:
-                    if file.transfer_type == 'local':
-                        required_files.remove(file)
-                if not required_files:
-                    msg = 'ERROR: all missing files are marked as local'
-                    print_line(msg, self._event_list)
-                    return
-                # mark files as in-transit so we dont double-copy
-                q = (DataFile
-                     .update({DataFile.local_status: FileStatus.IN_TRANSIT})
-                     .where(DataFile.name << [x.name for x in required_files]))
-                q.execute()
-
-                for file in required_files:
-                    target_files.append({
-                        'local_path': file.local_path,
-                        'remote_path': file.remote_path,
-                    })
-
-                if required_files[0].transfer_type == 'globus':
-                    msg = 'Starting globus file transfer of {} files'.format(
-                        len(required_files))
-                    print_line(msg, self._event_list)
-                    msg = 'See https://www.globus.org/app/activity for transfer details'
-                    print_line(msg, self._event_list)
+        wave = self._rank_transfers(candidates, priorities)[:wave_size]
+
+        # globus transfers between the same endpoints with the same sync level
+        # go in one task, sftp transfers to the same host share one connection,
+        # and local copies using the same methods share one thread pool
+        globus_tasks = dict()
+        sftp_hosts = dict()
+        local_copies = dict()
+        for datafile, target in wave:
+            policy = self._transfer_option(datafile.case, datafile.datatype, 'verify', 'none')
+            fraction = float(self._transfer_option(
+                datafile.case, datafile.datatype, 'verify_fraction', 0.05))
+            target['verify'] = verify_selected(target['local_path'], policy, fraction)
+            if datafile.transfer_type == 'globus':
+                sync_level = self._transfer_option(
+                    datafile.case, datafile.datatype, 'sync_level', 'checksum')
+                if sync_level == 'checksum':
+                    # checksum syncs are already verified by globus
+                    target['verify'] = False
+                key = (datafile.remote_uuid, self._config['global']['local_globus_uuid'], sync_level)
+                globus_tasks.setdefault(key, list()).append(target)
+            elif datafile.transfer_type == 'sftp':
+                sftp_hosts.setdefault(datafile.remote_hostname, list()).append(target)
+            elif datafile.transfer_type == 'local_copy':
+                target['verify'] = False
+                methods = self._transfer_option(
+                    datafile.case, datafile.datatype, 'local_copy_methods', LOCAL_COPY_METHODS)
+                if not isinstance(methods, list):
+                    methods = [methods]
+                local_copies.setdefault(tuple(methods), list()).append(target)
 
+        # connect before any file is marked in transit, so any password prompt
+        # happens on the main thread and the files of a host that cant be
+        # reached are simply left for a later call
+        for hostname in sftp_hosts.keys():
+            try:
+                self._ssh_pool.get(hostname)
+            except Exception as e:
+                logging.error(format_debug(e))
+                msg = 'Unable to connect to {}, its files will be transferred later'.format(hostname)
+                print_line(msg, self._event_list)
+                del sftp_hosts[hostname]
+
+        # endpoints already running as many tasks as they're allowed wait for a later call
+        for key in globus_tasks.keys():
+            if not self._limits.get(key[0]).acquire(block=False):
+                msg = 'Waiting for a globus task on {} to finish before starting another'.format(key[0])
+                logging.info(msg)
+                del globus_tasks[key]
+        target_files = [x for group in globus_tasks.values() + sftp_hosts.values() + local_copies.values()
+                        for x in group]
+        if not target_files:
+            return
+        row_ids = [x['id'] for x in target_files if 'id' in x]
+        series_offsets = dict()
+        for target in target_files:
+            if 'series' in target:
+                series_offsets.setdefault(target['series'], list()).append(target['offset'])
+        series_offsets = series_offsets.items()
+        if len(target_files) < len(candidates):
+            msg = 'Transferring the first {} of {} missing files'.format(
+                len(target_files), len(candidates))
+            print_line(msg, self._event_list)
+
+        # the groups not yet handed to a transfer, if anything goes wrong their
+        # files are reset and their globus slots given back
+        unstarted = [('globus', x, y) for x, y in globus_tasks.items()]
+        unstarted += [('sftp', x, y) for x, y in sftp_hosts.items()]
+        unstarted += [('local_copy', x, y) for x, y in local_copies.items()]
+        # sampled files land under their own name before they're verified
+        self._verifying.update(x['local_path'] for x in target_files if x['verify'])
+        try:
+            # mark files as in-transit so we dont double-copy
+            self._writer.update_status(DataFile, row_ids, FileStatus.IN_TRANSIT.value)
+            self._writer.submit(
+                self._set_series_status,
+                (series_offsets, FileStatus.IN_TRANSIT.value))
+            self._writer.flush()
+
+            for (remote_uuid, local_uuid, sync_level), target_files in globus_tasks.items():
+                msg = 'Starting globus file transfer of {} files with sync level {}'.format(
+                    len(target_files), sync_level)
+                print_line(msg, self._event_list)
+                msg = 'See https://www.globus.org/app/activity for transfer details'
+                print_line(msg, self._event_list)
+
+                limit = self._limits.get(remote_uuid)
+                try:
                     client = get_client()
-                    remote_uuid = required_files[0].remote_uuid
-                    local_uuid = self._config['global']['local_globus_uuid']
-                    thread_name = '{}_globus_transfer'.format(required_files[0].case)
-                    _args = (client, remote_uuid,
-                             local_uuid, target_files,
-                             self.kill_event)
-                    thread = Thread(
-                        target=globus_transfer,
-                        name=thread_name,
-                        args=_args)
-                    self.thread_list.append(thread)
-                    thread.start()
-                elif required_files[0].transfer_type == 'sftp':
-                    msg = 'Starting sftp file transfer of {} files'.format(
-                        len(required_files))
-                    print_line(msg, self._event_list)
+                    task_id = globus_submit_transfer(
+                        client, remote_uuid, local_uuid, target_files, sync_level=sync_level)
+                    if task_id is not None:
+                        verify = None
+                        if sync_level != 'checksum':
+                            verify = functools.partial(
+                                self._globus_task_done, client, remote_uuid, local_uuid, target_files)
+                        self._globus_monitor.add(
+                            client, task_id, target_files, self._globus_file_done,
+                            done=functools.partial(self._globus_task_finished, limit, target_files, verify),
+                            progress=limit.transferred)
+                except Exception as e:
+                    logging.error(format_debug(e))
+                    task_id = None
+                unstarted.remove(('globus', (remote_uuid, local_uuid, sync_level), target_files))
+                if task_id is None:
+                    limit.release()
+                    self._record_transfer(target_files, FileStatus.NOT_PRESENT.value)
+                    self._verifying.difference_update(x['local_path'] for x in target_files)
 
-                    client = get_ssh_client(required_files[0].remote_hostname)
-                    thread_name = '{}_sftp_transfer'.format(required_files[0].case)
-                    _args = (target_files, client, self.kill_event)
-                    thread = Thread(
-                        target=self._ssh_transfer,
-                        name=thread_name,
-                        args=_args)
-                    self.thread_list.append(thread)
-                    thread.start()
+            channels = int(self._config['global'].get('sftp_channels', 4))
+            window = int(self._config['global'].get('sftp_window', DEFAULT_WINDOW))
+            for hostname, target_files in sftp_hosts.items():
+                msg = 'Starting sftp file transfer of {} files from {} over {} channels'.format(
+                    len(target_files), hostname, channels)
+                print_line(msg, self._event_list)
+
+                thread_name = '{}_sftp_transfer'.format(hostname)
+                _args = (target_files, hostname, self.kill_event, channels, window)
+                thread = Thread(
+                    target=self._ssh_transfer,
+                    name=thread_name,
+                    args=_args)
+                self.thread_list.append(thread)
+                thread.start()
+                unstarted.remove(('sftp', hostname, target_files))
+
+            threads = int(self._config['global'].get('local_copy_threads', 8))
+            for methods, target_files in local_copies.items():
+                msg = 'Starting local copy of {} files'.format(len(target_files))
+                print_line(msg, self._event_list)
+                thread = Thread(
+                    target=self._local_copy,
+                    name='local_copy',
+                    args=(target_files, self.kill_event, list(methods), threads))
+                self.thread_list.append(thread)
+                thread.start()
+                unstarted.remove(('local_copy', methods, target_files))
         except Exception as e:
             print_debug(e)
+            for kind, key, target_files in unstarted:
+                if kind == 'globus':
+                    self._limits.get(key[0]).release()
+                self._record_transfer(target_files, FileStatus.NOT_PRESENT.value)
+                self._verifying.difference_update(x['local_path'] for x in target_files)
             return False
+
+    def transfer_stats(self):
+        """
+        Returns:
+            a dict mapping each sftp host and globus endpoint used so far to its
+            TransferStats, how many transfers are active, the files and bytes moved,
+            and the recent rate in bytes per second
+        """
+        return self._limits.stats()
+
+    def _rank_transfers(self, candidates, priorities):
+        """
+        Order the missing files by the best ranked job that needs them. Between
+        jobs of the same rank, the one with the fewest files left goes first
+        since it will be ready soonest. Files no job is waiting on go last,
+        everything else being equal earlier years go first
+
+        Parameters:
+            candidates (list): (datafile, target) tuples
+            priorities (list): (rank, requirements) tuples, best first
+        Returns:
+            the candidates in the order they should be transferred
+        """
+        if not priorities:
+            return sorted(candidates, key=lambda x: (x[0].year, x[0].month))
+
+        # the positions of the jobs that need each (case, datatype)
+        needed_by = dict()
+        for position, (_, requirements) in enumerate(priorities):
+            for case, datatype, start_year, end_year in requirements:
+                needed_by.setdefault((case, datatype), list()).append(
+                    (start_year, end_year, position))
+
+        # every file of a year has the same jobs waiting on it
+        jobs_waiting = dict()
+        missing = [0] * len(priorities)
+        keys = list()
+        for datafile, _ in candidates:
+            key = (datafile.case, datafile.datatype, datafile.year)
+            keys.append((key, datafile.month))
+            positions = jobs_waiting.get(key)
+            if positions is None:
+                year = key[2]
+                positions = jobs_waiting[key] = [
+                    position for start_year, end_year, position in needed_by.get(key[:2], [])
+                    if (start_year is None or year >= start_year) and
+                    (end_year is None or year <= end_year)]
+            for position in positions:
+                missing[position] += 1
+
+        unneeded = (float('inf'),)
+        best_rank = dict()
+        for key, positions in jobs_waiting.items():
+            ranks = [priorities[x][0] + (missing[x],) for x in positions]
+            best_rank[key] = min(ranks) if ranks else unneeded
+
+        order = sorted(
+            range(len(candidates)),
+            key=lambda x: (best_rank[keys[x][0]], keys[x][0][2], keys[x][1]))
+        return [candidates[x] for x in order]
+
+    def _transfer_option(self, case, datatype, option, default):
+        """
+        Look up a transfer option set for the data type, then the case, then globally
+        """
+        for options in [self._config['data_types'].get(datatype, {}),
+                        self._config['simulations'].get(case, {}),
+                        self._config['global']]:
+            if options.get(option) is not None:
+                return options[option]
+        return default
+
+    def _set_series_status(self, series_offsets, status, save=False):
+        """
+        Set the status of a list of (DataSeries, offsets) in memory, run by the
+        catalog writer. If save is set the series are marked to be written to
+        the catalog by the next _save_dirty_series
+        """
+        for series, offsets in series_offsets:
+            series.set_status(offsets, status)
+        if save:
+            self._dirty_series.update(x[0] for x in series_offsets)
+
+    def _save_dirty_series(self):
+        """
+        Write every series marked by _set_series_status to the catalog, queued
+        with submit_once so each is written once per writer batch rather than
+        once per file
+        """
+        dirty = list(self._dirty_series)
+        self._dirty_series.clear()
+        self._save_series(dirty)
+
+    def _ssh_transfer(self, target_files, hostname, event, channels=4, window=DEFAULT_WINDOW):
+        """
+        Pull target_files over several sftp channels of the pooled connection
+        to hostname, recording each file in the catalog as it finishes. Files
+        that fail, or that werent started before event was set, go back to
+        NOT_PRESENT to be tried again, resuming from their .part file
+        """
+        def reconnect():
+            return self._ssh_pool.get(hostname, prompt=False)
+
+        unfinished = target_files
+        sample = list()
+        try:
+            try:
+                succeeded, failed = ssh_parallel_transfer(
+                    client=reconnect(),
+                    file_list=target_files,
+                    channels=channels,
+                    event=event,
+                    callback=self._sftp_file_done,
+                    window=window,
+                    reconnect=reconnect,
+                    limit=self._limits.get(hostname))
+                unfinished = [x for x in failed if not x.get('attempted')]
+                # the sampled files arent recorded until they're verified
+                sample = [x for x in succeeded if x.get('verify')]
+            except Exception as e:
+                print_debug(e)
+            finally:
+                if unfinished:
+                    self._record_transfer(unfinished, FileStatus.NOT_PRESENT.value)
+            if sample:
+                self._verify_sftp(reconnect, sample, event)
         finally:
-            if self._mutex.locked():
-                self._mutex.release()
+            self._verifying.difference_update(x['local_path'] for x in target_files)
 
-    def _ssh_transfer(self, target_files, client, event):
-        sftp_client = client.open_sftp()
-        for file in target_files:
-            if event.is_set():
-                return
-            _, filename = os.path.split(file['local_path'])
-            msg = 'sftp transfer from {} to {}'.format(
-                file['remote_path'], file['local_path'])
-            logging.info(msg)
+    def _local_copy(self, target_files, event, methods, threads=8):
+        """
+        Stage target_files from an archive on this machine, see local_copy.parallel_copy.
+        Files that fail, or that werent started before event was set, go back to NOT_PRESENT
+        """
+        unfinished = target_files
+        try:
+            succeeded, failed, counts = local_parallel_copy(
+                target_files,
+                threads=threads,
+                event=event,
+                callback=self._local_file_done,
+                methods=methods)
+            unfinished = [x for x in failed if not x.get('attempted')]
+            if succeeded:
+                msg = 'Local copy complete for {} files, {}'.format(
+                    len(succeeded),
+                    ', '.join('{} by {}'.format(counts[x], x) for x in methods if x in counts))
+                print_line(msg, self._event_list)
+                msg = self.report_files_local()
+                print_line(msg, self._event_list)
+        except Exception as e:
+            print_debug(e)
+        finally:
+            if unfinished:
+                self._record_transfer(unfinished, FileStatus.NOT_PRESENT.value)
 
-            msg = 'starting sftp transfer for {}'.format(filename)
+    def _local_file_done(self, file, success):
+        """
+        Called from the local copy after each file
+        """
+        file['attempted'] = True
+        self._record_transfer([file], FileStatus.PRESENT.value if success else FileStatus.NOT_PRESENT.value)
+        _, filename = os.path.split(file['local_path'])
+        if success:
+            logging.info('local copy complete for {}'.format(filename))
+        else:
+            msg = 'local copy failed for {}'.format(filename)
             print_line(msg, self._event_list)
 
-            ssh_transfer(sftp_client, file)
-            
-            msg = 'sftp transfer complete for {}'.format(filename)
+    def _verify_sftp(self, connect, sample, event):
+        """
+        Compare the checksums of transferred files with the remote copies, then
+        record them in the catalog. Files that dont match are deleted to be
+        transferred again, files the remote couldnt checksum are kept unverified
+
+        Parameters:
+            connect (function): returns a connected paramiko.SSHClient
+            sample (list): the transferred files to verify
+            event (threading.Event): the kill event, nothing is checked once its set
+        """
+        command = self._config['global'].get('checksum_command', 'md5sum')
+        algorithm = checksum_algorithm(command)
+        checksums = dict()
+        if algorithm is None:
+            msg = 'Unable to verify sftp transfers with {}, see checksum_command'.format(command)
+            logging.error(msg)
+        elif not event.is_set():
+            try:
+                checksums = remote_checksums(
+                    connect(), [x['remote_path'] for x in sample], command=command)
+            except Exception as e:
+                logging.error(format_debug(e))
+        verified, mismatched, unverified = compare_checksums(
+            sample, checksums, algorithm or 'md5')
+        if verified or unverified:
+            self._record_transfer(verified + unverified, FileStatus.PRESENT.value)
+        for datafile in mismatched:
+            if os.path.exists(datafile['local_path']):
+                os.remove(datafile['local_path'])
+            msg = 'checksum mismatch for {}, it will be transferred again'.format(
+                os.path.basename(datafile['local_path']))
             print_line(msg, self._event_list)
+        if mismatched:
+            self._record_transfer(mismatched, FileStatus.NOT_PRESENT.value)
+        msg = 'verified {} of {} sampled sftp files'.format(len(verified), len(sample))
+        if unverified:
+            msg += ', {} couldnt be checksummed on the remote'.format(len(unverified))
+        print_line(msg, self._event_list)
+        msg = self.report_files_local()
+        print_line(msg, self._event_list)
 
+    def _sftp_file_done(self, file, success):
+        """
+        Called from the sftp channel threads after each file
+        """
+        file['attempted'] = True
+        _, filename = os.path.split(file['local_path'])
+        if success and file.get('verify'):
+            # recorded by _verify_sftp, so no job uses it before its checked
+            logging.info('sftp transfer complete for {}, waiting to verify it'.format(filename))
+        elif success:
+            self._record_transfer([file], FileStatus.PRESENT.value)
+            msg = 'sftp transfer complete for {}'.format(filename)
+            print_line(msg, self._event_list)
             msg = self.report_files_local()
             print_line(msg, self._event_list)
+        else:
+            self._record_transfer([file], FileStatus.NOT_PRESENT.value)
+            msg = 'sftp transfer failed for {}'.format(filename)
+            print_line(msg, self._event_list)
+
+    def _globus_file_done(self, file, success):
+        """
+        Called from the globus task monitor for each file of a task, the files
+        sampled for verification are recorded by _verify_globus instead
+        """
+        if not (success and file.get('verify')):
+            self._record_transfer([file], FileStatus.PRESENT.value if success else FileStatus.NOT_PRESENT.value)
+        _, filename = os.path.split(file['local_path'])
+        if success:
+            file['transferred'] = True
+            logging.info('globus transfer complete for {}'.format(filename))
+        else:
+            msg = 'globus transfer failed for {}'.format(filename)
+            print_line(msg, self._event_list)
+
+    def _globus_task_finished(self, limit, target_files, verify, status):
+        """
+        Free the endpoints task slot once a task has finished, then start its verification
+        """
+        limit.release(len([x for x in target_files if x.get('transferred')]))
+        if verify is not None:
+            verify(status)
+
+    def _globus_task_done(self, client, remote_uuid, local_uuid, target_files, status):
+        """
+        Once a task that wasnt synced by checksum has finished, verify the files
+        sampled from it that arrived, see _verify_globus
+        """
+        sample = [x for x in target_files if x.get('verify') and x.get('transferred')]
+        sampled = set(id(x) for x in sample)
+        self._verifying.difference_update(x['local_path'] for x in target_files if id(x) not in sampled)
+        if not sample:
+            return
+        if self.kill_event.is_set():
+            self._verified_globus(sample)
+            return
+        self._verify_globus(client, remote_uuid, local_uuid, sample)
+
+    def _verified_globus(self, files):
+        """
+        Record sampled globus files that are done being verified, or that wont be
+        """
+        self._record_transfer(files, FileStatus.PRESENT.value)
+        self._verifying.difference_update(x['local_path'] for x in files)
+
+    def _verify_globus(self, client, remote_uuid, local_uuid, sample, attempt=1):
+        """
+        Submit the sample again with the checksum sync level. Globus checksums both
+        copies and only transfers the files that differ. If the verification task
+        fails the files it didnt get to are verified again, up to GLOBUS_VERIFY_ATTEMPTS
+        times, only the ones no longer there locally are transferred again
+        """
+        task_id = globus_submit_transfer(
+            client, remote_uuid, local_uuid, sample,
+            sync_level='checksum',
+            label='Processflow verification')
+        if task_id is None:
+            msg = 'Unable to verify {} sampled globus files'.format(len(sample))
+            logging.error(msg)
+            self._verified_globus(sample)
+            return
+        repaired = list()
+        unchecked = list()
+
+        def mismatch(datafile, success):
+            if success:
+                repaired.append(datafile)
+                self._verified_globus([datafile])
+                msg = 'checksum mismatch for {}, it was transferred again'.format(
+                    os.path.basename(datafile['local_path']))
+                print_line(msg, self._event_list)
+            else:
+                # the task failed before getting to it, which says nothing about the file
+                unchecked.append(datafile)
+
+        def verified(status):
+            if status == 'SUCCEEDED':
+                # the files the checksum sync skipped matched
+                self._verified_globus(sample)
+                msg = 'verified {} sampled globus files, {} were transferred again'.format(
+                    len(sample), len(repaired))
+                print_line(msg, self._event_list)
+                return
+            missing = [x for x in unchecked if not os.path.exists(x['local_path'])]
+            if missing:
+                self._record_transfer(missing, FileStatus.NOT_PRESENT.value)
+                self._verifying.difference_update(x['local_path'] for x in missing)
+            retry = [x for x in unchecked if x not in missing]
+            msg = 'globus verification task {} ended {}, {} of {} sampled files werent verified'.format(
+                task_id, status, len(retry), len(sample))
+            logging.error(msg)
+            if not retry:
+                return
+            if attempt < GLOBUS_VERIFY_ATTEMPTS and not self.kill_event.is_set():
+                msg = 'Verifying {} sampled globus files again'.format(len(retry))
+                print_line(msg, self._event_list)
+                self._verify_globus(client, remote_uuid, local_uuid, retry, attempt + 1)
+            else:
+                # theyre there, just not verified
+                self._verified_globus(retry)
+
+        self._globus_monitor.add(
+            client, task_id, sample, mismatch, done=verified, report_skipped=False)
+
+    def _record_transfer(self, target_files, status):
+        """
+        Queue setting the local status of transfer target files, see transfer_needed.
+        Files that didnt arrive are checked for on the remote again before they're retried
+        """
+        ids = [x['id'] for x in target_files if 'id' in x]
+        if ids:
+            self._writer.update_status(DataFile, ids, status)
+        series_offsets = [(x['series'], [x['offset']]) for x in target_files if 'series' in x]
+        if series_offsets:
+            self._writer.submit(self._set_series_status, (series_offsets, status, True))
+            self._writer.submit_once(self._save_dirty_series)
+        if status == FileStatus.NOT_PRESENT.value:
+            rows = [(status, None, x) for x in ids]
+            series_updates = [(x[0], x[1][0], status, None) for x in series_offsets]
+            self._writer.submit(self._set_remote_status, (rows, series_updates))
 
     def years_ready(self, data_type, start_year, end_year):
         """
@@ -580,7 +1720,7 @@ class FileManager(object):
         data_ready = True
         non_zero_data = False
 
-        self._mutex.acquire()
+        self._acquire_read()
         try:
             query = (DataFile
                      .select()
@@ -593,11 +1733,17 @@ class FileManager(object):
                     data_ready = False
                 else:
                     non_zero_data = True
+            for series in self._series.values():
+                if series.datatype != data_type:
+                    continue
+                if not series.all(FileStatus.NOT_PRESENT.value, start_year, end_year):
+                    data_ready = False
+                if series.count(FileStatus.NOT_PRESENT.value, start_year, end_year):
+                    non_zero_data = True
         except Exception as e:
             print_debug(e)
         finally:
-            if self._mutex.locked():
-                self._mutex.release()
+            self._release_read()
 
         if data_ready:
             return 1
@@ -610,16 +1756,12 @@ class FileManager(object):
         """
         Return a string in the format 'X of Y files availabe locally' where X is the number here, and Y is the total
         """
-        q = (DataFile
-             .select(DataFile.local_status)
-             .where(DataFile.local_status == FileStatus.PRESENT.value))
-        local = len([x.local_status for x in q.execute()])
-
-        q = (DataFile.select(DataFile.local_status))
-        total = len([x.local_status for x in q.execute()])
-
+        progress = self.progress().values()
+        local = sum(x.present for x in progress)
+        total = sum(x.total for x in progress)
+        prec = ((local*1.0)/total)*100 if total else 100.0
         msg = '{local}/{total} files available locally or {prec:.2f}%'.format(
-            local=local, total=total, prec=((local*1.0)/total)*100)
+            local=local, total=total, prec=prec)
         return msg
 
     def get_file_paths_by_year(self, datatype, case, start_year=None, end_year=None):
@@ -633,8 +1775,14 @@ class FileManager(object):
             start_year (int): the first year to return data for
             end_year (int): the last year to return data for
         """
-        self._mutex.acquire()
+        self._acquire_read()
         try:
+            series = self._series.get((case, datatype))
+            if series is not None:
+                offsets = series.find(FileStatus.PRESENT.value, start_year, end_year)
+                if not offsets:
+                    return None
+                return [os.path.join(series.local_path, series.name(x)) for x in offsets]
             if start_year and end_year:
                 query = (DataFile
                          .select()
@@ -658,6 +1806,5 @@ class FileManager(object):
         except Exception as e:
             print_debug(e)
         finally:
-            if self._mutex.locked():
-                self._mutex.release()
+            self._release_read()
 
@@ -1,84 +1,318 @@
 import logging
-from time import sleep
+import calendar
+import threading
+from datetime import datetime
+from time import sleep, time
 from lib.util import print_debug, format_debug, print_line
 
 from globus_sdk import TransferData
-from globus_cli.commands.ls import _get_ls_res as get_ls
+from globus_sdk import TransferAPIError
 from globus_cli.commands.login import do_link_login_flow, check_logged_in
 from globus_cli.services.transfer import get_client
 
-def get_ls(client, path, endpoint):
-    for fail_count in xrange(10):
+def get_ls(client, path, endpoint, retries=10):
+    """
+    List a directory on an endpoint
+
+    Parameters:
+        client (TransferClient): the globus client
+        path (str): the directory to list
+        endpoint (str): the globus uuid of the endpoint
+        retries (int): how many times to try before giving up
+    Returns:
+        a list of entries with keys name, type, size and last_modified, an empty
+        list if the directory doesnt exist, or None if it couldnt be listed
+    """
+    for fail_count in xrange(retries):
         try:
-            res = get_ls(
-                client,
-                path,
-                endpoint,
-                False, 0, False)
+            return list(client.operation_ls(endpoint, path=path))
+        except TransferAPIError as e:
+            if e.code == 'ClientError.NotFound':
+                return list()
+            error = e
         except Exception as e:
+            error = e
+        if fail_count < retries - 1:
             sleep(fail_count)
-            if fail_count >= 9:
-                print_debug(e)
-        else:
-            return res
+    print_debug(error)
+    return None
 
-def transfer(client, remote_uuid, local_uuid, file_list, event=None):
+def list_directory(client, endpoint, path, retries=2):
     """
-    Setup a file transfer between two endpoints
-    
+    List the files in a directory on an endpoint with a single request
+
+    Returns:
+        a dict mapping each file name to its (size, mtime), empty if the directory
+        doesnt exist, or None if it couldnt be listed
+    """
+    entries = get_ls(client, path, endpoint, retries)
+    if entries is None:
+        return None
+    files = dict()
+    for entry in entries:
+        if entry.get('type') != 'file':
+            continue
+        # last_modified looks like 2018-01-29 16:45:07+00:00
+        modified = datetime.strptime(entry['last_modified'][:19], '%Y-%m-%d %H:%M:%S')
+        files[entry['name']] = (entry['size'], calendar.timegm(modified.timetuple()))
+    return files
+
+def submit_transfer(client, remote_uuid, local_uuid, file_list, sync_level='checksum',
+                    label='Processflow auto transfer'):
+    """
+    Submit one transfer task for a list of files between two endpoints
+
     Parameters:
+        client (TransferClient): the globus transfer client
         remote_uuid (str): the globus uuid of the source endpoint
         local_uuid (str): the globus uuid of the destination endpoint
         file_list (list): a list of dictionaries with keys remote_path, local_path
-        event (Threadding.Event): a kill event for running inside a thread
+        sync_level (str): the globus sync_level of the task, exists, size, mtime or checksum
+        label (str): the task label shown on globus.org
+    Returns:
+        the task id, or None if the task couldnt be submitted
     """
 
     # create the transfer object
     try:
-        task_label = 'Processflow auto transfer'
         transfer_task = TransferData(
             client,
             remote_uuid,
             local_uuid,
-            sync_level='checksum',
-            label=task_label)
+            sync_level=sync_level,
+            label=label)
     except Exception as e:
         logging.error('Error creating transfer task')
         logging.error(format_debug(e))
-        return
-    
+        return None
+
     # add in our transfer items
     for datafile in file_list:
         transfer_task.add_item(
             source_path=datafile['remote_path'],
             destination_path=datafile['local_path'],
             recursive=False)
-    
+
     # Start the transfer
-    task_id = None
     result = None
     try:
         result = client.submit_transfer(transfer_task)
         task_id = result["task_id"]
-        logging.info('starting transfer with task id %s', task_id)
+        logging.info('starting transfer of %d files with task id %s', len(file_list), task_id)
     except Exception as e:
         if result:
             logging.error("result: %s", str(result))
         logging.error("Could not submit the transfer")
         logging.error(format_debug(e))
-        return
-    
-    # loop until transfer is complete
+        return None
+    return task_id
+
+def get_successful_transfers(client, task_id, marker=None):
+    """
+    Page through the files a task has finished so far
+
+    Parameters:
+        client (TransferClient): the globus transfer client
+        task_id (str): the task to list
+        marker (int): the page to start from, None for the first
+    Returns:
+        the destination paths, and the marker of the last page read
+    """
+    paths = list()
     while True:
-        status = client.get_task(task_id)
+        params = {'marker': marker} if marker else {}
+        page = client.get(client.qjoin_path('task', task_id, 'successful_transfers'), params=params)
+        paths.extend(x['destination_path'] for x in page['DATA'])
+        if not page.get('next_marker'):
+            return paths, marker
+        marker = page['next_marker']
+
+
+class _Task(object):
+
+    def __init__(self, client, task_id, file_list, callback, done, report_skipped, progress):
+        self.client = client
+        self.task_id = task_id
+        self.pending = {x['local_path']: x for x in file_list}
+        self.callback = callback
+        self.done = done
+        self.report_skipped = report_skipped
+        self.progress = progress
+        self.bytes_transferred = 0
+        self.marker = None
+        self.transferred = 0
+        self.interval = None
+        self.due = 0
+
+
+class TaskMonitor(object):
+    """
+    Polls the status of every submitted globus task from one thread
+
+    Each file is reported with callback(file, success) as soon as the task
+    lists it as transferred, rather than when the whole task finishes. A
+    task thats making no progress is polled less and less often, from
+    min_interval up to max_interval seconds, and back to min_interval as
+    soon as more files arrive
+    """
+
+    def __init__(self, event=None, min_interval=2, max_interval=60):
+        """
+        Parameters:
+            event (threading.Event): cancel every task and stop once this is set
+            min_interval (float): seconds between the first polls of a task
+            max_interval (float): the most seconds between polls of a task
+        """
+        self._event = event
+        self._min_interval = min_interval
+        self._max_interval = max_interval
+        self._tasks = list()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def add(self, client, task_id, file_list, callback, done=None, report_skipped=True,
+            progress=None):
+        """
+        Start monitoring a submitted task
+
+        Parameters:
+            client (TransferClient): the client the task was submitted with
+            task_id (str): the task id
+            file_list (list): the files in the task, dicts with a local_path
+            callback (function): called as callback(file, success) for each file
+            done (function): called as done(status) once the task has finished
+            report_skipped (bool): when the task succeeds, report the files the
+                sync level skipped as successful too
+            progress (function): called with the number of bytes the task moved
+                since it was last polled
+        """
+        task = _Task(client, task_id, file_list, callback, done, report_skipped, progress)
+        task.interval = self._min_interval
+        task.due = time() + self._min_interval
+        with self._cond:
+            self._tasks.append(task)
+            if self._thread is None:
+                self._stopped = False
+                self._thread = threading.Thread(target=self._run, name='globus_monitor')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify()
+
+    def active(self):
+        with self._cond:
+            return len(self._tasks)
+
+    def stop(self):
+        """
+        Stop polling, tasks are left running
+        """
+        with self._cond:
+            self._stopped = True
+            thread = self._thread
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not (self._event and self._event.is_set()):
+                    if not self._tasks:
+                        self._thread = None
+                        return
+                    wait = min(x.due for x in self._tasks) - time()
+                    if wait <= 0:
+                        break
+                    # wake now and then to notice the kill event
+                    self._cond.wait(min(wait, 1))
+                if self._stopped:
+                    return
+                if self._event and self._event.is_set():
+                    tasks, self._tasks = self._tasks, list()
+                    self._thread = None
+                    for task in tasks:
+                        self._cancel(task)
+                        self._finish(task, 'CANCELED')
+                    return
+                now = time()
+                due = [x for x in self._tasks if x.due <= now]
+            for task in due:
+                try:
+                    finished = self._poll(task)
+                except Exception as e:
+                    logging.error(format_debug(e))
+                    finished = None
+                    task.interval = min(task.interval * 2, self._max_interval)
+                task.due = time() + task.interval
+                if finished:
+                    with self._cond:
+                        self._tasks.remove(task)
+                    self._finish(task, finished)
+
+    def _report(self, task, paths, success):
+        for path in paths:
+            datafile = task.pending.pop(path, None)
+            if datafile is None:
+                continue
+            try:
+                task.callback(datafile, success)
+            except Exception as e:
+                logging.error(format_debug(e))
+
+    def _finish(self, task, status):
+        if task.done is None:
+            return
+        try:
+            task.done(status)
+        except Exception as e:
+            logging.error(format_debug(e))
+
+    def _poll(self, task):
+        """
+        Check a task, reporting any newly transferred files
+
+        Returns the final status once the task is finished, None otherwise
+        """
+        status = task.client.get_task(task.task_id)
+        transferred = status.get('files_transferred', 0)
+        moved = status.get('bytes_transferred', 0) - task.bytes_transferred
+        if moved > 0:
+            task.bytes_transferred += moved
+            if task.progress is not None:
+                try:
+                    task.progress(moved)
+                except Exception as e:
+                    logging.error(format_debug(e))
+        if transferred != task.transferred or status['status'] != 'ACTIVE':
+            paths, task.marker = get_successful_transfers(task.client, task.task_id, task.marker)
+            self._report(task, paths, True)
+        if transferred != task.transferred:
+            task.transferred = transferred
+            task.interval = self._min_interval
+        else:
+            task.interval = min(task.interval * 2, self._max_interval)
+
         if status['status'] == 'SUCCEEDED':
-            return True, None
+            # files skipped by the sync level are already there
+            if task.report_skipped:
+                self._report(task, list(task.pending.keys()), True)
+            logging.info('globus task %s succeeded', task.task_id)
+            return 'SUCCEEDED'
         elif status['status'] == 'FAILED':
-            return False, status.get('nice_status_details')
-        if event and event.is_set():
-            client.cancel_task(task_id)
-            return None, None
-        sleep(10)
+            msg = 'globus task {} failed: {}'.format(task.task_id, status.get('nice_status_details'))
+            logging.error(msg)
+            self._report(task, list(task.pending.keys()), False)
+            return 'FAILED'
+        return None
+
+    def _cancel(self, task):
+        try:
+            task.client.cancel_task(task.task_id)
+        except Exception as e:
+            logging.error(format_debug(e))
+        self._report(task, list(task.pending.keys()), False)
 
 def transfer_directory(src_uuid, dst_uuid, src_path, dst_path, event_list=None, killevent=None):
     """
@@ -222,11 +456,8 @@ def check_globus(src_uuid, dst_uuid, src_path, dst_path):
     client = get_client()
     try:
         for endpoint in endpoints:
-            _ = get_ls(
-                client,
-                endpoint['path'],
-                endpoint['id'],
-                False, 0, False)
+            if get_ls(client, endpoint['path'], endpoint['id'], retries=3) is None:
+                return False, endpoint
             hostname = client.endpoint_server_list(endpoint)['DATA']['hostname']
             print "Access confirmed for {}".format(hostname)
     except Exception as e:
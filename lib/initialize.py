@@ -60,6 +60,14 @@ def parse_args(argv=None, print_help=None):
         '-m', '--max-jobs',
         help='maximum number of running jobs',
         type=int)
+    parser.add_argument(
+        '--resume',
+        help='Reuse the file catalog from a previous run instead of rebuilding it, only directories that have changed are checked again',
+        action='store_true')
+    parser.add_argument(
+        '-w', '--watch',
+        help='Use inotify to notice new input files and job output as soon as they are written, directories on filesystems like Lustre or GPFS are still polled',
+        action='store_true')
     if print_help:
         parser.print_help()
         return
@@ -73,7 +81,7 @@ def initialize(argv, **kwargs):
     Parameters:
         argv (list): a list of arguments
         event_list (EventList): The main list of events
-        mutex (threading.Lock): A mutex to handle db access
+        mutex (RWLock): A lock to handle db access
         kill_event (threading.Event): An event used to kill all running threads
         __version__ (str): the current version number for processflow
         __branch__ (str): the branch this version was built from
@@ -154,6 +162,8 @@ Please add a space and run again.'''.format(num=line_index)
     config['global']['dryrun'] = True if pargs.dryrun else False
     config['global']['debug'] = True if pargs.debug else False
     config['global']['max_jobs'] = pargs.max_jobs if pargs.max_jobs else False
+    config['global']['resume'] = True if pargs.resume else False
+    config['global']['watch'] = True if pargs.watch else False
 
      # setup logging
     if pargs.log:
@@ -0,0 +1,233 @@
+"""
+Watch directories for new files with the Linux inotify API, through ctypes
+"""
+import os
+import sys
+import errno
+import select
+import struct
+import logging
+import threading
+import ctypes
+import ctypes.util
+
+from time import time
+
+from lib.util import format_debug
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+_EVENT = struct.Struct('iIII')
+
+# filesystems where changes made on other nodes never generate local events
+UNRELIABLE_FILESYSTEMS = ['lustre', 'gpfs', 'nfs', 'nfs4', 'cifs', 'smbfs', 'panfs', 'beegfs', 'fuse']
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        _libc = libc
+    return _libc
+
+
+def available():
+    """
+    Returns True if inotify can be used on this system
+    """
+    try:
+        _get_libc()
+    except (OSError, AttributeError):
+        return False
+    return True
+
+
+def filesystem_type(path):
+    """
+    Return the type of the filesystem holding path as listed in /proc/mounts,
+    or None if it cant be found
+    """
+    path = os.path.realpath(path)
+    best = ''
+    fstype = None
+    try:
+        with open('/proc/mounts', 'r') as fp:
+            for line in fp:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount = fields[1].replace('\\040', ' ')
+                if path == mount or path.startswith(mount.rstrip('/') + '/'):
+                    if len(mount) >= len(best):
+                        best = mount
+                        fstype = fields[2]
+    except IOError:
+        return None
+    return fstype
+
+
+def reliable(path):
+    """
+    Returns True if inotify events can be trusted for the given path
+    """
+    fstype = filesystem_type(path)
+    if fstype is None:
+        return False
+    return not any(fstype == x or fstype.startswith(x + '.') for x in UNRELIABLE_FILESYSTEMS)
+
+
+class InotifyWatcher(object):
+    """
+    Watches a set of directories from a background thread and calls
+    callback(paths) with the full paths of files that were closed after
+    writing or moved into them. Events arriving within settle seconds of
+    each other are delivered together
+
+    Directories created under a directory watched with recursive=True are
+    watched as well. If the kernel event queue overflows callback is
+    called with None, and the caller should fall back to a full scan
+    """
+
+    def __init__(self, callback, settle=0.02):
+        """
+        Parameters:
+            callback (function): called with a list of paths, or None after an overflow
+            settle (float): how long to wait for more events before calling callback
+        """
+        self._callback = callback
+        self._settle = settle
+        self._fd = _get_libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._watches = dict()
+        self._recursive = set()
+        self._lock = threading.Lock()
+        self._stop_r, self._stop_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, name='inotify')
+        self._thread.daemon = True
+
+    def add_watch(self, path, recursive=False):
+        """
+        Start watching a directory
+
+        Returns True if the watch was added, False if path isnt a directory
+        """
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR
+        if recursive:
+            mask |= IN_CREATE
+        if isinstance(path, unicode):
+            path = path.encode(sys.getfilesystemencoding())
+        wd = _get_libc().inotify_add_watch(self._fd, path, mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in [errno.ENOENT, errno.ENOTDIR]:
+                return False
+            raise OSError(err, '{}: {}'.format(os.strerror(err), path))
+        with self._lock:
+            self._watches[wd] = path
+            if recursive:
+                self._recursive.add(wd)
+        if recursive:
+            for name in os.listdir(path):
+                child = os.path.join(path, name)
+                if os.path.isdir(child):
+                    self.add_watch(child, recursive=True)
+        return True
+
+    def watched(self):
+        with self._lock:
+            return sorted(self._watches.values())
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        os.write(self._stop_w, 'x')
+        self._thread.join()
+        os.close(self._fd)
+        os.close(self._stop_r)
+        os.close(self._stop_w)
+
+    def _read_events(self):
+        """
+        Read the queued events
+
+        Returns:
+            the new file paths, and True if the kernel queue overflowed
+        """
+        paths = list()
+        overflow = False
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    break
+                raise
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, pos)
+                name = data[pos + _EVENT.size: pos + _EVENT.size + length].rstrip('\0')
+                pos += _EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                with self._lock:
+                    if mask & IN_IGNORED:
+                        self._watches.pop(wd, None)
+                        self._recursive.discard(wd)
+                        continue
+                    directory = self._watches.get(wd)
+                    recursive = wd in self._recursive
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                        self.add_watch(path, recursive=True)
+                    continue
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    paths.append(path)
+        return paths, overflow
+
+    def _run(self):
+        pending = list()
+        overflow = False
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time(), 0)
+            readable, _, _ = select.select([self._fd, self._stop_r], [], [], timeout)
+            if self._stop_r in readable:
+                return
+            if self._fd in readable:
+                try:
+                    paths, lost = self._read_events()
+                except Exception as e:
+                    logging.error(format_debug(e))
+                    paths, lost = list(), True
+                pending.extend(paths)
+                overflow = overflow or lost
+                if deadline is None and (pending or overflow):
+                    deadline = time() + self._settle
+            if deadline is not None and time() >= deadline:
+                try:
+                    self._callback(None if overflow else pending)
+                except Exception as e:
+                    logging.error(format_debug(e))
+                pending = list()
+                overflow = False
+                deadline = None
@@ -0,0 +1,109 @@
+"""
+Submitting many jobs of one type and case as a single slurm job array
+"""
+import os
+import pipes
+import logging
+
+from lib.util import format_debug
+
+
+class JobArray(object):
+    """
+    Collects the run scripts of jobs as they're executed, then submits them
+    as slurm job arrays with one task per job. Each task runs the jobs own
+    run script, with its output going to the jobs own console output file,
+    so the tasks can be tracked and reported like separately submitted jobs
+
+    Parameters:
+        scripts_path (str): the directory to write the array scripts to
+        name (str): the start of the array script names, such as climo_piControl
+        max_size (int): the most tasks to put in one array, see MaxArraySize in slurm.conf
+    """
+
+    def __init__(self, scripts_path, name, max_size=1000):
+        self.scripts_path = scripts_path
+        self.name = name
+        self.max_size = max_size
+        # (job, run_script, slurm_args) in the order they were added
+        self._tasks = list()
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def add(self, job, run_script, slurm_args):
+        """
+        Add a job whose run script has been written, see Job._submit_cmd_to_slurm
+
+        Parameters:
+            job (Job): the job
+            run_script (str): the path to its run script
+            slurm_args (list): its #SBATCH arguments, other than the output file
+        """
+        self._tasks.append((job, run_script, sorted(slurm_args)))
+
+    def submit(self, executor):
+        """
+        Submit every job added, the jobs with the same slurm arguments go in one
+        array, a job with nothing to share an array with is submitted on its own
+
+        Parameters:
+            executor (Executor): the slurm interface, or the executor the jobs run with
+        Returns:
+            a list of (job, slurm_id) tuples, the slurm_id of an array task is
+            a string such as 1234_5 as squeue and sacct show it. The jobs of a
+            group that couldnt be submitted are left out
+        """
+        groups = list()
+        for job, run_script, slurm_args in self._tasks:
+            for args, tasks in groups:
+                if args == slurm_args and len(tasks) < self.max_size:
+                    tasks.append((job, run_script))
+                    break
+            else:
+                groups.append((slurm_args, [(job, run_script)]))
+        self._tasks = list()
+
+        submitted = list()
+        for slurm_args, tasks in groups:
+            try:
+                if len(tasks) == 1:
+                    job, run_script = tasks[0]
+                    job_ids = [executor.batch(run_script)]
+                else:
+                    array_script = self._write_script(slurm_args, tasks)
+                    array_id = executor.batch(array_script)
+                    job_ids = ['{}_{}'.format(array_id, idx) for idx in range(len(tasks))]
+                    msg = 'submitted {} {} jobs as array {}'.format(len(tasks), self.name, array_id)
+                    logging.info(msg)
+            except Exception as e:
+                # the groups already submitted are running, so carry on with the rest
+                logging.error(format_debug(e))
+                logging.error('Unable to submit {} {} jobs'.format(len(tasks), self.name))
+                continue
+            for (job, _), job_id in zip(tasks, job_ids):
+                job._job_id = job_id
+                job._has_been_executed = True
+                submitted.append((job, job_id))
+        return submitted
+
+    def _write_script(self, slurm_args, tasks):
+        """
+        Write the batch script of one array, each task runs the run script at
+        its index and writes to that jobs console output
+        """
+        first, last = tasks[0][0], tasks[-1][0]
+        array_script = os.path.join(self.scripts_path, '{}_{:04d}_{:04d}_array'.format(
+            self.name, first.start_year, last.end_year))
+        lines = ['#!/bin/bash']
+        lines.extend('#SBATCH {}'.format(x) for x in slurm_args)
+        lines.append('#SBATCH --array=0-{}'.format(len(tasks) - 1))
+        lines.append('#SBATCH -o {}_%a.out'.format(array_script))
+        lines.append('scripts=({})'.format(' '.join(pipes.quote(x[1]) for x in tasks)))
+        lines.append('outputs=({})'.format(' '.join(
+            pipes.quote(x[0]._console_output_path) for x in tasks)))
+        lines.append(
+            'bash "${scripts[$SLURM_ARRAY_TASK_ID]}" > "${outputs[$SLURM_ARRAY_TASK_ID]}" 2>&1')
+        with open(array_script, 'w') as fp:
+            fp.write('\n'.join(lines) + '\n')
+        return array_script
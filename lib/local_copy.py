@@ -0,0 +1,215 @@
+"""
+Staging files from an archive on the same machine, for the local_copy transfer type
+"""
+import os
+import stat
+import errno
+import fcntl
+import ctypes
+import ctypes.util
+import shutil
+import logging
+
+from multiprocessing.pool import ThreadPool
+
+from lib.util import print_debug
+
+# the methods copy_file can use, cheapest first
+METHODS = ['hardlink', 'reflink', 'copy_file_range', 'sendfile', 'copy']
+
+# from linux/fs.h
+FICLONE = 0x40049409
+
+# the errors that mean a method doesnt work between two filesystems,
+# rather than that the file itself couldnt be copied
+_UNSUPPORTED = set([errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EINVAL, errno.ENOSYS,
+                    errno.EOPNOTSUPP, errno.ENOTTY, errno.EBADF, errno.ETXTBSY])
+
+_CHUNK = 2**30
+
+_libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+for _name in ['copy_file_range', 'sendfile']:
+    if hasattr(_libc, _name):
+        getattr(_libc, _name).restype = ctypes.c_ssize_t
+if hasattr(_libc, 'copy_file_range'):
+    _libc.copy_file_range.argtypes = [
+        ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t, ctypes.c_uint]
+if hasattr(_libc, 'sendfile'):
+    _libc.sendfile.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t]
+
+
+def list_directory(path):
+    """
+    Return the size and modification time of every file in a local directory
+
+    Parameters:
+        path (str): the directory to list
+    Returns:
+        a dict mapping file name to a (size, mtime) tuple, empty if the
+        directory doesnt exist, see ssh_interface.list_directory
+    """
+    contents = dict()
+    try:
+        names = os.listdir(path)
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return contents
+        raise
+    for name in names:
+        try:
+            info = os.stat(os.path.join(path, name))
+        except OSError:
+            continue
+        if stat.S_ISREG(info.st_mode):
+            contents[name] = (info.st_size, info.st_mtime)
+    return contents
+
+
+def _kernel_copy(function, source, destination, size):
+    """
+    Copy with copy_file_range or sendfile, which move the data inside the kernel
+    """
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        remaining = size
+        while remaining > 0:
+            if function == 'copy_file_range':
+                copied = _libc.copy_file_range(
+                    src.fileno(), None, dst.fileno(), None, min(remaining, _CHUNK), 0)
+            else:
+                copied = _libc.sendfile(dst.fileno(), src.fileno(), None, min(remaining, _CHUNK))
+            if copied < 0:
+                error = ctypes.get_errno()
+                raise OSError(error, os.strerror(error))
+            if copied == 0:
+                break
+            remaining -= copied
+
+
+def _copy_with(method, source, destination, size):
+    if method == 'hardlink':
+        os.link(source, destination)
+    elif method == 'reflink':
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+    elif method in ['copy_file_range', 'sendfile']:
+        if not hasattr(_libc, method):
+            raise OSError(errno.ENOSYS, '{} is not available'.format(method))
+        _kernel_copy(method, source, destination, size)
+    else:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 2**24)
+
+
+def copy_file(source, destination, methods=None, unsupported=None):
+    """
+    Copy source to destination + '.part' with the first method that works,
+    then rename it to destination once it is complete
+
+    Parameters:
+        source (str): the archive file
+        destination (str): where to stage it
+        methods (list): the methods to try, in order, from METHODS
+        unsupported (set): (method, source device, destination device) tuples
+            that have already failed, shared between calls so a method that
+            doesnt work between two filesystems is only tried once
+    Returns:
+        the name of the method that was used
+    """
+    methods = methods or METHODS
+    if unsupported is None:
+        unsupported = set()
+    directory = os.path.dirname(destination)
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    info = os.stat(source)
+    devices = (info.st_dev, os.stat(directory).st_dev)
+    part_path = destination + '.part'
+    error = None
+    for method in methods:
+        if (method,) + devices in unsupported:
+            continue
+        if os.path.lexists(part_path):
+            os.remove(part_path)
+        try:
+            _copy_with(method, source, part_path, info.st_size)
+            received = os.path.getsize(part_path)
+            if received != info.st_size:
+                # some filesystems end kernel copies early instead of failing them
+                raise IOError(errno.EINVAL, '{} is {} bytes, expected {}'.format(
+                    part_path, received, info.st_size))
+        except (IOError, OSError) as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+            unsupported.add((method,) + devices)
+            logging.info('%s is not supported from %s, %s', method, source, e)
+            error = e
+            continue
+        if method != 'hardlink':
+            shutil.copystat(source, part_path)
+        os.rename(part_path, destination)
+        return method
+    if os.path.lexists(part_path):
+        os.remove(part_path)
+    raise error or IOError('no copy method left to try for {}'.format(source))
+
+
+def parallel_copy(file_list, threads=8, event=None, callback=None, methods=None):
+    """
+    Stage files from a local archive with a pool of threads, see copy_file.
+    Hardlinks and reflinks only touch metadata, and the kernel copies dont
+    pass the data through python, so most of the time is spent waiting on
+    the filesystem, which threads can overlap
+
+    Parameters:
+        file_list (list): dicts with keys remote_path, the archive file, and local_path
+        threads (int): how many files to copy at once
+        event (threading.Event): stop starting new files once this is set
+        callback (function): called as callback(file, success) after each file
+        methods (list): the methods to try, in order, from METHODS
+    Returns:
+        the list of files that were copied, the list of those that werent,
+        including any that were never started, and a dict of how many files
+        each method copied
+    """
+    unsupported = set()
+
+    def copy(file):
+        if event is not None and event.is_set():
+            return file, None
+        try:
+            method = copy_file(file['remote_path'], file['local_path'], methods, unsupported)
+        except Exception as e:
+            print_debug(e)
+            msg = '{} copy failed'.format(os.path.basename(file['remote_path']))
+            logging.error(msg)
+            return file, False
+        return file, method
+
+    succeeded = list()
+    failed = list()
+    counts = dict()
+    pool = ThreadPool(max(min(threads, len(file_list)), 1))
+    try:
+        for file, method in pool.imap_unordered(copy, file_list):
+            if method is None:
+                failed.append(file)
+                continue
+            success = method is not False
+            if success:
+                succeeded.append(file)
+                counts[method] = counts.get(method, 0) + 1
+            else:
+                failed.append(file)
+            if callback:
+                try:
+                    callback(file, success)
+                except Exception as e:
+                    print_debug(e)
+    finally:
+        pool.close()
+        pool.join()
+    return succeeded, failed, counts
@@ -0,0 +1,234 @@
+"""
+Running the batch scripts of jobs as local processes, for small projects
+and tests on one machine without slurm
+"""
+import os
+import shlex
+import signal
+import logging
+import threading
+import multiprocessing
+
+from time import time
+from subprocess import Popen, STDOUT
+
+from lib.executor import Executor
+
+FINISHED = ['COMPLETED', 'FAILED', 'CANCELLED']
+
+
+class LocalExecutor(Executor):
+    """
+    Runs batch scripts with bash, as many at once as there are cores for.
+    Each job takes the cores it asks for with #SBATCH -n, and writes to its
+    #SBATCH -o file. Job arrays are run as one job per task, and a job with
+    --dependency=afterok waits until every job it names has completed,
+    staying pending with the DependencyNeverSatisfied reason if one doesnt
+
+    Parameters:
+        cores (int): the number of cores to share between jobs, all of the
+            machines cores by default
+    """
+
+    def __init__(self, cores=None):
+        self.cores = int(cores) if cores else multiprocessing.cpu_count()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        # job id to its state, in the order they were submitted
+        self._jobs = dict()
+        self._order = list()
+
+    def batch(self, cmd, sargs=None):
+        """
+        Queue a batch script, its job is started as soon as its cores are free
+
+        Parameters:
+            cmd (str): The path to the run script
+            sargs (str): Additional #SBATCH style arguments
+        Returns:
+            job id of the new job (int)
+        """
+        with open(cmd) as fp:
+            args = list()
+            for line in fp:
+                if line.startswith('#SBATCH'):
+                    args.extend(shlex.split(line)[1:])
+        if sargs:
+            args.extend(shlex.split(sargs))
+        options = self._parse_args(args)
+
+        with self._lock:
+            dependencies = list()
+            for dependency in options['dependency']:
+                found = [x for x in self._order if x == dependency or x.startswith(dependency + '_')]
+                if not found:
+                    raise Exception('Unable to submit {}, no job {} to depend on'.format(cmd, dependency))
+                dependencies.extend(found)
+
+            self._next_id += 1
+            job_id = str(self._next_id)
+            if options['array'] is None:
+                tasks = [(job_id, None)]
+            else:
+                tasks = [('{}_{}'.format(job_id, x), x) for x in options['array']]
+            for task_id, task in tasks:
+                output = options['output'] or os.path.join(
+                    os.path.dirname(cmd), 'slurm-%j.out')
+                output = output.replace('%a', str(task)).replace('%A', job_id).replace('%j', job_id)
+                self._jobs[task_id] = {
+                    'script': cmd,
+                    'task': task,
+                    'output': output,
+                    'cores': min(options['cores'], self.cores),
+                    'dependencies': dependencies,
+                    'state': 'PENDING',
+                    'reason': 'Dependency' if dependencies else 'Resources',
+                    'process': None,
+                    'start': None
+                }
+                self._order.append(task_id)
+            self._schedule()
+        return int(job_id)
+
+    def _parse_args(self, args):
+        options = {'cores': 1, 'output': None, 'array': None, 'dependency': list()}
+        idx = 0
+        while idx < len(args):
+            arg = args[idx]
+            if '=' in arg and arg.startswith('--'):
+                flag, value = arg.split('=', 1)
+            elif idx + 1 < len(args):
+                flag, value = arg, args[idx + 1]
+                idx += 1
+            else:
+                flag, value = arg, ''
+            idx += 1
+            if flag in ['-n', '--ntasks']:
+                options['cores'] = max(int(value), 1)
+            elif flag in ['-o', '--output']:
+                options['output'] = value
+            elif flag in ['-a', '--array']:
+                first, last = value.split('%')[0].split('-')
+                options['array'] = range(int(first), int(last) + 1)
+            elif flag in ['-d', '--dependency']:
+                kind, _, ids = value.partition(':')
+                if kind != 'afterok':
+                    raise Exception('Only afterok dependencies can be run locally, not {}'.format(value))
+                options['dependency'] = ids.split(':')
+        return options
+
+    def _schedule(self):
+        """
+        Start every pending job whose dependencies have completed and that there
+        are free cores for, in the order they were submitted. Called with the lock held
+        """
+        free = self.cores - sum(x['cores'] for x in self._jobs.values() if x['state'] == 'RUNNING')
+        for job_id in self._order:
+            job = self._jobs[job_id]
+            if job['state'] != 'PENDING':
+                continue
+            states = [self._jobs[x]['state'] for x in job['dependencies']]
+            if any(x in FINISHED and x != 'COMPLETED' for x in states):
+                job['reason'] = 'DependencyNeverSatisfied'
+                continue
+            if any(x != 'COMPLETED' for x in states):
+                continue
+            if job['cores'] > free:
+                job['reason'] = 'Resources'
+                continue
+            self._start(job_id, job)
+            free -= job['cores']
+
+    def _start(self, job_id, job):
+        env = dict(os.environ)
+        env['SLURM_JOB_ID'] = job_id.split('_')[0]
+        env['SLURM_NTASKS'] = str(job['cores'])
+        if job['task'] is not None:
+            env['SLURM_ARRAY_TASK_ID'] = str(job['task'])
+        try:
+            with open(job['output'], 'w') as output:
+                job['process'] = Popen(
+                    ['bash', job['script']], stdout=output, stderr=STDOUT,
+                    env=env, preexec_fn=os.setsid)
+        except (IOError, OSError) as e:
+            logging.error('Unable to start {}: {}'.format(job['script'], e))
+            job['state'] = 'FAILED'
+            return
+        job['state'] = 'RUNNING'
+        job['reason'] = 'None'
+        job['start'] = time()
+        thread = threading.Thread(target=self._wait, args=(job,))
+        thread.daemon = True
+        thread.start()
+
+    def _wait(self, job):
+        """
+        Wait for the process of a job to exit, then start what can run in its place
+        """
+        returncode = job['process'].wait()
+        with self._lock:
+            if job['state'] == 'RUNNING':
+                job['state'] = 'COMPLETED' if returncode == 0 else 'FAILED'
+            self._schedule()
+
+    def showjobs(self, jobids):
+        jobinfo = dict()
+        with self._lock:
+            for job_id in [str(x) for x in jobids]:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                runtime = int(time() - job['start']) if job['state'] == 'RUNNING' else 0
+                jobinfo[job_id] = {
+                    'JobId': job_id,
+                    'JobState': job['state'],
+                    'RunTime': '{}:{:02d}'.format(runtime // 60, runtime % 60),
+                    'NodeList': 'localhost' if job['state'] == 'RUNNING' else '',
+                    'Reason': job['reason']
+                }
+        return jobinfo
+
+    def showjob(self, jobid):
+        return self.showjobs([jobid]).get(str(jobid), dict())
+
+    def queue(self):
+        queueinfo = list()
+        with self._lock:
+            for job_id in self._order:
+                job = self._jobs[job_id]
+                if job['state'] not in ['PENDING', 'RUNNING']:
+                    continue
+                queueinfo.append({
+                    'JOBID': job_id,
+                    'NAME': os.path.basename(job['script']),
+                    'STATE': 'R' if job['state'] == 'RUNNING' else 'PD',
+                    'NODELIST(REASON)': 'localhost' if job['state'] == 'RUNNING' else '({})'.format(job['reason'])
+                })
+        return queueinfo
+
+    def cancel(self, jobid):
+        jobid = str(jobid)
+        with self._lock:
+            cancelled = False
+            for job_id in self._order:
+                if job_id != jobid and not job_id.startswith(jobid + '_'):
+                    continue
+                job = self._jobs[job_id]
+                if job['state'] == 'RUNNING':
+                    try:
+                        os.killpg(job['process'].pid, signal.SIGTERM)
+                    except OSError:
+                        pass
+                if job['state'] in ['PENDING', 'RUNNING']:
+                    job['state'] = 'CANCELLED'
+                    job['reason'] = 'None'
+                cancelled = cancelled or job['state'] == 'CANCELLED'
+            self._schedule()
+        return cancelled
+
+    def max_running_jobs(self):
+        """
+        One job for every core, the cores each job asks for decide how many
+        of them actually run at once
+        """
+        return self.cores
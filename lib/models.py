@@ -1,6 +1,15 @@
 from peewee import *
+from playhouse.migrate import SqliteMigrator, migrate
 
-database = SqliteDatabase(None)  # Defer initialization
+# Defer initialization. Each thread gets its own connection, and with the
+# write-ahead log readers dont block on a writer or each other
+database = SqliteDatabase(None, pragmas=[
+    ('journal_mode', 'wal'),
+    ('synchronous', 'normal'),
+])
+
+# Bump this and add an entry to MIGRATIONS whenever the catalog tables change
+SCHEMA_VERSION = 5
 
 
 class DataFile(Model):
@@ -10,6 +19,8 @@ class DataFile(Model):
     local_status = IntegerField()
     remote_path = CharField()
     remote_status = IntegerField()
+    # the size of the remote copy at the last inventory, if it was found
+    remote_size = IntegerField(null=True, default=None)
     year = IntegerField()
     month = IntegerField()
     datatype = CharField()
@@ -20,3 +31,188 @@ class DataFile(Model):
 
     class Meta:
         database = database
+        indexes = (
+            # check_data_ready and get_file_paths_by_year
+            (('case', 'datatype', 'year', 'local_status'), False),
+            # years_ready
+            (('datatype', 'year'), False),
+            # update_local_status, all_data_local and transfer_needed
+            (('local_status', 'case'), False),
+        )
+
+
+class DataDirectory(Model):
+    """
+    The last observed modification time of a directory holding DataFiles,
+    used to skip re-checking directories that havent changed
+    """
+    path = CharField(unique=True)
+    mtime = FloatField()
+
+    class Meta:
+        database = database
+
+
+class SeriesStatus(Model):
+    """
+    The per-file local status of a DataSeries, one byte per file
+    """
+    case = CharField()
+    datatype = CharField()
+    start_year = IntegerField()
+    frequency = CharField(default='monthly')
+    local_status = BlobField()
+
+    class Meta:
+        database = database
+        indexes = (
+            (('case', 'datatype'), True),
+        )
+
+
+CATALOG_MODELS = [DataFile, DataDirectory, SeriesStatus]
+
+
+def insert_rows(model, rows):
+    """
+    Insert a list of dicts keyed by field name using a single prepared statement,
+    which is much faster than insert_many for large catalogs
+
+    Parameters:
+        model (Model): the model class to insert into
+        rows (list): the dicts to insert, each must have every non-primary-key field
+            that doesnt have a default
+    """
+    if not rows:
+        return
+    fields = [x for x in model._meta.sorted_fields if not x.primary_key]
+    quote = model._meta.database.quote_char
+    sql = 'INSERT INTO {quote}{table}{quote} ({columns}) VALUES ({params})'.format(
+        quote=quote,
+        table=model._meta.db_table,
+        columns=', '.join(quote + x.db_column + quote for x in fields),
+        params=', '.join(model._meta.database.interpolation for _ in fields))
+    names = [x.name for x in fields]
+    defaults = {x.name: x.default for x in fields if x.null or x.default is not None}
+    with model._meta.database.atomic():
+        model._meta.database.get_cursor().executemany(
+            sql, [tuple(row[x] if x in row else defaults[x] for x in names) for row in rows])
+
+
+def update_rows(model, fields, rows):
+    """
+    Set different values on many rows using a single prepared statement
+
+    Parameters:
+        model (Model): the model class to update
+        fields (list): the names of the fields to set
+        rows (list): tuples of the new field values followed by the rows id
+    """
+    if not rows:
+        return
+    quote = model._meta.database.quote_char
+    param = model._meta.database.interpolation
+    sql = 'UPDATE {quote}{table}{quote} SET {columns} WHERE {quote}{key}{quote} = {param}'.format(
+        quote=quote,
+        table=model._meta.db_table,
+        columns=', '.join('{0}{1}{0} = {2}'.format(quote, model._meta.fields[x].db_column, param)
+                          for x in fields),
+        key=model._meta.primary_key.db_column,
+        param=param)
+    with model._meta.database.atomic():
+        model._meta.database.get_cursor().executemany(sql, rows)
+
+
+def get_schema_version():
+    """
+    Return the schema version stored in the database, catalogs created
+    before versioning was added report version 1
+    """
+    version = database.execute_sql('PRAGMA user_version').fetchone()[0]
+    return version if version else 1
+
+
+def set_schema_version(version):
+    database.execute_sql('PRAGMA user_version = {:d}'.format(version))
+
+
+def _create_missing_indexes(model):
+    """
+    Create any of the models Meta.indexes that dont exist in the database yet
+    """
+    table = model._meta.db_table
+    existing = [sorted(x.columns) for x in database.get_indexes(table)]
+    for fields, unique in model._meta.indexes:
+        columns = [model._meta.fields[x].db_column for x in fields]
+        if sorted(columns) in existing:
+            continue
+        database.create_index(model, list(fields), unique)
+
+
+def _migrate_to_2():
+    """
+    Add the composite DataFile indexes
+    """
+    _create_missing_indexes(DataFile)
+
+
+def _migrate_to_3():
+    """
+    Add the SeriesStatus table used by the series catalog backend
+    """
+    SeriesStatus.create_table(fail_silently=True)
+
+
+def _migrate_to_4():
+    """
+    Record the frequency of each SeriesStatus
+    """
+    table = SeriesStatus._meta.db_table
+    if 'frequency' in [x.name for x in database.get_columns(table)]:
+        return
+    migrate(SqliteMigrator(database).add_column(table, 'frequency', SeriesStatus.frequency))
+
+
+def _migrate_to_5():
+    """
+    Record the size of the remote copy of each DataFile
+    """
+    table = DataFile._meta.db_table
+    if 'remote_size' in [x.name for x in database.get_columns(table)]:
+        return
+    migrate(SqliteMigrator(database).add_column(table, 'remote_size', DataFile.remote_size))
+
+
+# Maps a schema version to the function that upgrades the previous version to it
+MIGRATIONS = {
+    2: _migrate_to_2,
+    3: _migrate_to_3,
+    4: _migrate_to_4,
+    5: _migrate_to_5,
+}
+
+
+def setup_catalog():
+    """
+    Create the catalog tables if they dont exist, otherwise bring an existing
+    catalog up to the current SCHEMA_VERSION without dropping any data
+    """
+    if not any(x.table_exists() for x in CATALOG_MODELS):
+        with database.atomic():
+            for model in CATALOG_MODELS:
+                model.create_table()
+            set_schema_version(SCHEMA_VERSION)
+        return
+
+    version = get_schema_version()
+    if version > SCHEMA_VERSION:
+        msg = 'Catalog schema version {} is newer than the supported version {}'.format(
+            version, SCHEMA_VERSION)
+        raise Exception(msg)
+    with database.atomic():
+        # tables added since the catalog was created
+        for model in CATALOG_MODELS:
+            model.create_table(fail_silently=True)
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[target]()
+        set_schema_version(SCHEMA_VERSION)
@@ -7,6 +7,8 @@ from subprocess import Popen
 from time import sleep
 
 from lib.slurm import Slurm
+from lib.local_executor import LocalExecutor
+from lib.job_array import JobArray
 from lib.util import get_climo_output_files
 from lib.util import create_symlink_dir
 from lib.util import print_line
@@ -58,15 +60,22 @@ class RunManager(object):
         self._job_total = 0
         self._job_complete = 0
 
-        self.slurm = Slurm()
+        if config['global'].get('executor', 'slurm') == 'local':
+            self.executor = LocalExecutor(cores=config['global'].get('local_cores'))
+        else:
+            self.executor = Slurm()
         max_jobs = config['global']['max_jobs']
-        self.max_running_jobs = max_jobs if max_jobs else self.slurm.get_node_number() * 6
+        self.max_running_jobs = max_jobs if max_jobs else self.executor.max_running_jobs()
+        tries = 0
         while self.max_running_jobs == 0:
+            tries += 1
+            if tries == 10:
+                raise Exception('Unable to find how many nodes are up, set max_jobs to run anyway')
             sleep(1)
             msg = 'Unable to communication with scontrol, checking again'
             print_line(msg, event_list)
             logging.error(msg)
-            self.max_running_jobs = self.slurm.get_node_number() * 6
+            self.max_running_jobs = self.executor.max_running_jobs()
 
     def check_max_running_jobs(self):
         """
@@ -75,7 +84,7 @@ class RunManager(object):
         Returns True if the max or more are running, false otherwise
         """
         try:
-            job_info = self.slurm.queue()
+            job_info = self.executor.queue()
         except:
             return True
         else:
@@ -249,81 +258,183 @@ class RunManager(object):
     
     def check_data_ready(self):
         """
-        Loop over all jobs, checking if their data is ready, and setting
+        Check if the data is ready for every job that isnt ready yet, and set
         the internal job.data_ready variable
+
+        The requirements of all the pending jobs are evaluated together
+        in one pass through the filemanager
         """
-        for case in self.cases:
-            for job in case['jobs']:
-                job.check_data_ready(self.filemanager)
+        pending = [job for case in self.cases for job in case['jobs'] if not job.data_ready]
+        if not pending:
+            return
+        requirements = list()
+        for job in pending:
+            requirements.extend(job.get_data_requirements())
+        ready_map = self.filemanager.data_ready_map(requirements)
+        for job in pending:
+            job.data_ready = all(ready_map[x] for x in job.get_data_requirements())
     
+    def transfer_priorities(self):
+        """
+        Rank the jobs that are still waiting on data, so the filemanager can
+        transfer the files for the jobs that can run soonest first
+
+        Jobs are ordered by their start year, then by how many other jobs are
+        waiting on them, then by how many of their own dependencies havent finished
+
+        Returns:
+            a list of (rank, requirements) tuples best first, where requirements
+            is the jobs get_data_requirements
+        """
+        jobs = {job.id: job for case in self.cases for job in case['jobs']}
+        dependents = dict()
+        for job in jobs.values():
+            for depid in job.depends_on:
+                dependents.setdefault(depid, list()).append(job.id)
+
+        def count_dependents(job_id, seen):
+            for depid in dependents.get(job_id, []):
+                if depid not in seen:
+                    seen.add(depid)
+                    count_dependents(depid, seen)
+            return len(seen)
+
+        priorities = list()
+        for job in jobs.values():
+            if job.data_ready or job.status != JobStatus.VALID:
+                continue
+            unfinished = len([x for x in job.depends_on
+                              if x in jobs and jobs[x].status != JobStatus.COMPLETED])
+            rank = (job.start_year, -count_dependents(job.id, set()), unfinished)
+            priorities.append((rank, job.get_data_requirements()))
+        priorities.sort(key=lambda x: x[0])
+        return priorities
+
     def start_ready_jobs(self):
         """
         Loop over the list of jobs for each case, first setting up the data for, and then
-        submitting each job to the queue
+        submitting each job to the queue. Unless job_arrays is turned off, the ready jobs
+        of a type that allows it are submitted as one slurm job array per type and case
         """
+        arrays = dict()
+        try:
+            self._start_ready_jobs(arrays)
+        finally:
+            self._submit_arrays(arrays)
 
+    def _submit_arrays(self, arrays):
+        """
+        Submit the job arrays filled by _start_ready_jobs, and track each task as its own job
+        """
+        for array in arrays.values():
+            if not len(array):
+                continue
+            total = len(array)
+            try:
+                submitted = array.submit(self.executor)
+            except Exception as e:
+                logging.error(format_debug(e))
+                submitted = list()
+            if len(submitted) < total:
+                msg = 'Unable to submit {} of the {} jobs in the {} job array, they will be submitted again'.format(
+                    total - len(submitted), total, array.name)
+                print_line(msg, self.event_list)
+            submitted_jobs = [x[0] for x in submitted]
+            for case in self.cases:
+                for job in case['jobs']:
+                    if job.array is not array:
+                        continue
+                    job.array = None
+                    if job not in submitted_jobs:
+                        job.status = JobStatus.VALID
+            for job, slurmid in submitted:
+                self.running_jobs.append({
+                    'slurm_id': slurmid,
+                    'job_id': job.id
+                })
+
+    def _start_ready_jobs(self, arrays):
+        use_arrays = self.config['global'].get('job_arrays', True)
+        max_array_size = int(self.config['global'].get('max_array_size', 1000))
+        use_dependencies = self.config['global'].get('slurm_dependencies', False)
+        scripts_path = os.path.join(self.config['global']['project_path'], 'output', 'scripts')
         for case in self.cases:
             for job in case['jobs']:
                 if job.status != JobStatus.VALID:
                     continue
-                if len(self.running_jobs) >= self.max_running_jobs:
+                queued = len(self.running_jobs) + sum(len(x) for x in arrays.values())
+                if queued >= self.max_running_jobs:
                     msg = 'running {} of {} jobs, waiting for queue to shrink'.format(
-                        len(self.running_jobs), self.max_running_jobs)
+                        queued, self.max_running_jobs)
                     if self.debug: 
                         print_line(msg, self.event_list)
                     return
-                deps_ready = True
-                for depjobid in job.depends_on:
-                    depjob = self.get_job_by_id(depjobid)
-                    if depjob.status != JobStatus.COMPLETED:
-                        deps_ready = False
-                        break
-                if deps_ready and job.data_ready:
-                    
-                    # if the job was finished by a previous run of the processflow
-                    valid = job.postvalidate(self.config, event_list=self.event_list)
-                    if valid:
-                        job.status = JobStatus.COMPLETED
-                        self._job_complete += 1
-                        job.handle_completion(
-                            self.filemanager,
-                            self.event_list,
-                            self.config)
-                        self.report_completed_job()
-                        if isinstance(job, Diag):
-                            msg = '{job}-{start:04d}-{end:04d}-{case}-vs-{comp}: Job previously computed, skipping'.format(
-                                job=job.job_type, start=job.start_year, end=job.end_year, case=job.short_name, comp=job._short_comp_name)
-                        else:
-                            msg = '{job}-{start:04d}-{end:04d}-{case}: Job previously computed, skipping'.format(
-                                job=job.job_type, start=job.start_year, end=job.end_year, case=job.short_name)
-                        print_line(msg, self.event_list)
+                dependencies = [self.get_job_by_id(x) for x in job.depends_on]
+                waiting = [x for x in dependencies if x.status != JobStatus.COMPLETED]
+                if waiting:
+                    # with slurm_dependencies the job can wait in the queue behind
+                    # the slurm jobs of its dependencies instead of here
+                    if not use_dependencies or self.dryrun:
+                        continue
+                    slurm_ids = self._queued_slurm_ids(waiting)
+                    if slurm_ids is None:
                         continue
+                    if not job.stage_inputs(self.config, dependencies):
+                        continue
+                elif not job.data_ready:
+                    continue
 
-                    # the job is ready for submission
-                    if job.run_type is not None:
-                        msg = '{job}-{run_type}-{start:04d}-{end:04d}-{case}: Job ready, submitting to queue'.format(
-                            job=job.job_type,
-                            start=job.start_year,
-                            end=job.end_year,
-                            case=job.short_name,
-                            run_type=job.run_type)
-                    elif isinstance(job, Diag):
-                        msg = '{job}-{start:04d}-{end:04d}-{case}-vs-{comp}: Job ready, submitting to queue'.format(
-                            job=job.job_type, 
-                            start=job.start_year, 
-                            end=job.end_year, 
-                            case=job.short_name, 
-                            comp=job._short_comp_name)
+                # if the job was finished by a previous run of the processflow
+                valid = job.postvalidate(self.config, event_list=self.event_list)
+                if valid:
+                    job.status = JobStatus.COMPLETED
+                    self._job_complete += 1
+                    job.handle_completion(
+                        self.filemanager,
+                        self.event_list,
+                        self.config)
+                    self.report_completed_job()
+                    if isinstance(job, Diag):
+                        msg = '{job}-{start:04d}-{end:04d}-{case}-vs-{comp}: Job previously computed, skipping'.format(
+                            job=job.job_type, start=job.start_year, end=job.end_year, case=job.short_name, comp=job._short_comp_name)
                     else:
-                        msg = '{job}-{start:04d}-{end:04d}-{case}: Job ready, submitting to queue'.format(
-                            job=job.job_type, 
-                            start=job.start_year, 
-                            end=job.end_year, 
-                            case=job.short_name)
+                        msg = '{job}-{start:04d}-{end:04d}-{case}: Job previously computed, skipping'.format(
+                            job=job.job_type, start=job.start_year, end=job.end_year, case=job.short_name)
                     print_line(msg, self.event_list)
+                    continue
 
-                    # set to pending before data setup so we dont double submit
-                    job.status = JobStatus.PENDING
+                # the job is ready for submission
+                if job.run_type is not None:
+                    msg = '{job}-{run_type}-{start:04d}-{end:04d}-{case}: Job ready, submitting to queue'.format(
+                        job=job.job_type,
+                        start=job.start_year,
+                        end=job.end_year,
+                        case=job.short_name,
+                        run_type=job.run_type)
+                elif isinstance(job, Diag):
+                    msg = '{job}-{start:04d}-{end:04d}-{case}-vs-{comp}: Job ready, submitting to queue'.format(
+                        job=job.job_type, 
+                        start=job.start_year, 
+                        end=job.end_year, 
+                        case=job.short_name, 
+                        comp=job._short_comp_name)
+                else:
+                    msg = '{job}-{start:04d}-{end:04d}-{case}: Job ready, submitting to queue'.format(
+                        job=job.job_type, 
+                        start=job.start_year, 
+                        end=job.end_year, 
+                        case=job.short_name)
+                print_line(msg, self.event_list)
+
+                # set to pending before data setup so we dont double submit
+                job.status = JobStatus.PENDING
+                if waiting:
+                    job.set_dependencies(slurm_ids)
+                    msg = '{prefix}: Waiting in the queue for slurm jobs {ids}'.format(
+                        prefix=job.msg_prefix(),
+                        ids=', '.join(str(x) for x in slurm_ids))
+                    print_line(msg, self.event_list)
+                else:
                     job.setup_data(
                         config=self.config,
                         filemanager=self.filemanager,
@@ -334,24 +445,51 @@ class RunManager(object):
                                 config=self.config,
                                 filemanager=self.filemanager,
                                 case=job.comparison)
-                    slurmid = job.execute(
-                        config=self.config,
-                        dryrun=self.dryrun)
-
-                    if slurmid is False:
-                        msg = '{job}-{start:04d}-{end:04d}-{case}: Prevalidation FAILED'.format(
-                            job=job.job_type,
-                            start=job.start_year,
-                            end=job.end_year,
-                            case=job.short_name)
-                        print_line(msg, self.event_list)
-                        job.status = JobStatus.FAILED
-                    else:
-                        self.running_jobs.append({
-                            'slurm_id': slurmid,
-                            'job_id': job.id
-                        })
-    
+                if use_arrays and job.array_capable:
+                    key = (job.case, job.job_type, job.run_type)
+                    if key not in arrays:
+                        name = '_'.join(str(x) for x in [job.job_type, job.run_type, job.short_name]
+                                        if x is not None)
+                        arrays[key] = JobArray(scripts_path, name, max_array_size)
+                    job.array = arrays[key]
+                job.executor = self.executor
+                slurmid = job.execute(
+                    config=self.config,
+                    dryrun=self.dryrun)
+
+                if isinstance(slurmid, JobArray):
+                    # tracked once the array is submitted
+                    continue
+                job.array = None
+                if slurmid is False:
+                    msg = '{job}-{start:04d}-{end:04d}-{case}: Prevalidation FAILED'.format(
+                        job=job.job_type,
+                        start=job.start_year,
+                        end=job.end_year,
+                        case=job.short_name)
+                    print_line(msg, self.event_list)
+                    job.status = JobStatus.FAILED
+                else:
+                    self.running_jobs.append({
+                        'slurm_id': slurmid,
+                        'job_id': job.id
+                    })
+
+    def _queued_slurm_ids(self, jobs):
+        """
+        Returns the slurm ids of the given jobs, or None if any of them isnt
+        waiting or running in the slurm queue
+        """
+        slurm_ids = dict()
+        for item in self.running_jobs:
+            if item['slurm_id']:
+                slurm_ids[item['job_id']] = item['slurm_id']
+        if any(x.id not in slurm_ids for x in jobs):
+            return None
+        if any(x.status not in [JobStatus.SUBMITTED, JobStatus.PENDING, JobStatus.RUNNING] for x in jobs):
+            return None
+        return [slurm_ids[x.id] for x in jobs]
+
     def get_job_by_id(self, jobid):
         for case in self.cases:
             for job in case['jobs']:
@@ -359,9 +497,31 @@ class RunManager(object):
                     return job
         raise Exception("no job with id {} found".format(jobid))
 
-    def write_job_sets(self, path):
+    def write_job_sets(self, path, data_progress=None, transfer_stats=None):
+        """
+        Write the status of every job to the state file
+
+        Parameters:
+            path (str): the path to the state file
+            data_progress (dict): optional FileManager.progress() output, written as a table of
+                how many files of each case and datatype are local
+            transfer_stats (dict): optional FileManager.transfer_stats() output, written as a
+                table of the transfers active and the throughput of each host or endpoint
+        """
         out_str = ''
         with open(path, 'w') as fp:
+            if data_progress:
+                out_str += '\n==========\n# data #\n==========\n'
+                for (case, datatype), progress in sorted(data_progress.items()):
+                    out_str += '\t{:<40} {}/{} local, {} in transit\n'.format(
+                        '{} {}:'.format(case, datatype),
+                        progress.present, progress.total, progress.in_transit)
+            if transfer_stats:
+                out_str += '\n==============\n# transfers #\n==============\n'
+                for endpoint, stats in sorted(transfer_stats.items()):
+                    out_str += '\t{:<40} {} active, {} files, {:.1f} MB, {:.2f} MB/s\n'.format(
+                        '{}:'.format(endpoint), stats.active, stats.files,
+                        stats.bytes / float(2**20), stats.rate / float(2**20))
             for case in self.cases:
                 out_str += '\n==' + '='*len(case['case']) + '==\n'
                 out_str += '# {} #\n'.format(case['case'])
@@ -415,9 +575,22 @@ class RunManager(object):
         print_line(msg, self.event_list)
 
     def monitor_running_jobs(self):
-        slurm = Slurm()
+        """
+        Update the status of every running job from one batched slurm lookup,
+        and handle the jobs that have finished
+        """
         for_removal = list()
+        slurm_ids = [x['slurm_id'] for x in self.running_jobs if x['slurm_id'] != 0]
+        try:
+            jobs_info = self.executor.showjobs(slurm_ids) if slurm_ids else dict()
+        except Exception as e:
+            # slurm isnt answering, check again next time
+            logging.error(format_debug(e))
+            return
         for item in self.running_jobs:
+            if item in for_removal:
+                # taken out of the queue after a dependency failed
+                continue
             job = self.get_job_by_id(item['job_id'])
             if item['slurm_id'] == 0:
                 self._job_complete += 1
@@ -428,13 +601,9 @@ class RunManager(object):
                     self.config)
                 self.report_completed_job()
                 continue
-            try:
-                job_info = slurm.showjob(item['slurm_id'])
-                if not job_info or job_info.get('JobState') is None:
-                    continue
-            except Exception as e:
-                # if the job is old enough it wont be in the slurm list anymore
-                # which will throw an exception
+            job_info = jobs_info.get(str(item['slurm_id']))
+            if job_info is None:
+                # if the job is old enough slurm wont know about it anymore
                 self._job_complete += 1
                 for_removal.append(item)
                 
@@ -454,7 +623,14 @@ class RunManager(object):
                         line=line,
                         event_list=self.event_list)
                 continue
-            status = StatusMap[job_info.get('JobState')]
+            status = StatusMap.get(job_info['JobState'])
+            if status is None:
+                logging.info('unknown slurm state %s for job %s', job_info['JobState'], item['slurm_id'])
+                continue
+            if job_info.get('Reason') == 'DependencyNeverSatisfied':
+                # a job it was queued behind failed, so it will never start
+                self._cancel(item['slurm_id'])
+                status = JobStatus.FAILED
             if status != job.status:
                 if job.run_type is not None:
                     msg = '{job}-{run_type}-{start:04d}-{end:04d}-{case}: Job changed from {s1} to {s2}'.format(
@@ -485,7 +661,7 @@ class RunManager(object):
                 print_line(msg, self.event_list)
                 job.status = status
 
-                if status in [JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED]:
+                if status in [JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED, JobStatus.TIMEOUT]:
                     self._job_complete += 1
                     valid = job.postvalidate(self.config, event_list=self.event_list)
                     if not valid:
@@ -496,15 +672,37 @@ class RunManager(object):
                         self.config)
                     for_removal.append(item)
                     self.report_completed_job()
-                    if status in [JobStatus.FAILED, JobStatus.CANCELLED]:
+                    if job.status in [JobStatus.FAILED, JobStatus.CANCELLED, JobStatus.TIMEOUT]:
                         for depjob in self.get_jobs_that_depend(job.id):
                             depjob.status = JobStatus.FAILED
+                            self._remove_queued_job(depjob, for_removal)
         if not for_removal:
             return
         else:
             self.running_jobs = [x for x in self.running_jobs if x not in for_removal]
         return
 
+    def _remove_queued_job(self, job, for_removal):
+        """
+        Cancel a job that was submitted with slurm_dependencies behind a job
+        that has failed, slurm would otherwise leave it pending forever
+        """
+        for item in self.running_jobs:
+            if item['job_id'] != job.id or item in for_removal or not item['slurm_id']:
+                continue
+            self._cancel(item['slurm_id'])
+            self._job_complete += 1
+            for_removal.append(item)
+            msg = '{prefix}: A dependency failed, removing the job from the queue'.format(
+                prefix=job.msg_prefix())
+            print_line(msg, self.event_list)
+
+    def _cancel(self, slurm_id):
+        try:
+            self.executor.cancel(slurm_id)
+        except Exception as e:
+            logging.error(format_debug(e))
+
     def get_jobs_that_depend(self, job_id):
         """
         returns a list of all jobs that depend on the give job
@@ -533,7 +731,7 @@ class RunManager(object):
             for job in case['jobs']:
                 if job.status in [JobStatus.VALID, JobStatus.PENDING, JobStatus.RUNNING]:
                     return -1
-                if job.status in [JobStatus.FAILED, JobStatus.CANCELLED]:
+                if job.status in [JobStatus.FAILED, JobStatus.CANCELLED, JobStatus.TIMEOUT]:
                     failed = True
         if failed:
             return 0
@@ -0,0 +1,51 @@
+"""
+A reader/writer lock for the file catalog
+"""
+import threading
+
+
+class RWLock(object):
+    """
+    Any number of readers can hold the lock at once, a writer holds it alone.
+    A waiting writer stops new readers from getting the lock so a steady
+    stream of readers cant starve it
+
+    acquire, release and locked work on the write side, so an RWLock
+    can be used anywhere a threading.Lock was
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+
+    def release(self):
+        with self._cond:
+            if not self._writing:
+                raise RuntimeError('release unlocked RWLock')
+            self._writing = False
+            self._cond.notify_all()
+
+    def locked(self):
+        return self._writing
@@ -0,0 +1,173 @@
+"""
+A compact catalog representation for periodic data streams
+"""
+import os
+from collections import namedtuple
+
+from lib.cadence import Cadence
+
+# A single file of a series rendered out, using the same
+# attribute names as the DataFile model
+SeriesFile = namedtuple('SeriesFile', [
+    'case', 'datatype', 'name', 'local_path', 'remote_path', 'year', 'month',
+    'local_status', 'transfer_type', 'remote_uuid', 'remote_hostname'])
+
+
+class DataSeries(object):
+    """
+    All the files of a (case, datatype) stream that only differ by their date,
+    stored as a pair of compiled templates and one status byte per file
+
+    Files are indexed by their offset in the series, there are cadence.slots_per_year
+    files per year, and are only rendered into names and paths when they're needed
+    """
+
+    def __init__(self, case, datatype, start_year, end_year, name_format, remote_format,
+                 local_path, status, transfer_type='local', remote_uuid='', remote_hostname='',
+                 frequency='monthly', remote_status=None):
+        """
+        Parameters:
+            case (str): the case the files belong to
+            datatype (str): the data_type of the files
+            start_year (int): the first year of the series
+            end_year (int): the last year of the series
+            name_format (str): a compiled template for the file name with {year}, {month},
+                {day} and {seconds} fields
+            remote_format (str): a compiled template for the remote directory
+            local_path (str): the local directory holding the files
+            status (int): the FileStatus value every file starts with
+            frequency (str): how often a file is written, see Cadence
+            remote_status (int): the FileStatus value every remote copy starts with,
+                the same as status by default
+        """
+        self.case = case
+        self.datatype = datatype
+        self.start_year = start_year
+        self.end_year = end_year
+        self.local_path = local_path
+        self.transfer_type = transfer_type
+        self.remote_uuid = remote_uuid
+        self.remote_hostname = remote_hostname
+        self._name_format = name_format.format
+        self._remote_format = remote_format.format
+        self.cadence = Cadence(frequency)
+        self._per_year = self.cadence.slots_per_year
+        self.local_status = bytearray([status]) * ((end_year - start_year + 1) * self._per_year)
+        # the remote copies as of the last inventory, these arent saved
+        self.remote_status = bytearray([status if remote_status is None else remote_status]) * len(self)
+        self.remote_size = dict()
+
+    def __len__(self):
+        return len(self.local_status)
+
+    @property
+    def frequency(self):
+        return self.cadence.frequency
+
+    def offset(self, year, month=1, day=1, seconds=0):
+        """
+        Return the offset of the file holding the given date
+        """
+        return (year - self.start_year) * self._per_year + self.cadence.slot(month, day, seconds)
+
+    def date(self, offset):
+        """
+        Return the (year, month, day, seconds) of the first sample in the file at the given offset
+        """
+        year, slot = divmod(offset, self._per_year)
+        return (self.start_year + year,) + self.cadence.dates[slot]
+
+    def span(self, start_year=None, end_year=None):
+        """
+        Return the first offset and one past the last offset covering the
+        given years, clipped to the series. If either year is missing the whole
+        series is covered
+        """
+        if not start_year or not end_year:
+            return 0, len(self)
+        first = min(max(self.offset(start_year), 0), len(self))
+        last = min(self.offset(end_year + 1), len(self))
+        return first, max(first, last)
+
+    def name(self, offset):
+        year, slot = divmod(offset, self._per_year)
+        month, day, seconds = self.cadence.fields[slot]
+        return self._name_format(
+            year='{:04d}'.format(self.start_year + year),
+            month=month,
+            day=day,
+            seconds=seconds)
+
+    def file(self, offset):
+        """
+        Render the file at the given offset
+        """
+        year, slot = divmod(offset, self._per_year)
+        year += self.start_year
+        month, day, seconds = self.cadence.fields[slot]
+        fields = {
+            'year': '{:04d}'.format(year),
+            'month': month,
+            'day': day,
+            'seconds': seconds
+        }
+        name = self._name_format(**fields)
+        return SeriesFile(
+            case=self.case,
+            datatype=self.datatype,
+            name=name,
+            local_path=os.path.join(self.local_path, name),
+            remote_path=os.path.join(self._remote_format(**fields), name),
+            year=year,
+            month=self.cadence.dates[slot][0],
+            local_status=self.local_status[offset],
+            transfer_type=self.transfer_type,
+            remote_uuid=self.remote_uuid,
+            remote_hostname=self.remote_hostname)
+
+    def count(self, status, start_year=None, end_year=None):
+        """
+        Return the number of files with the given status inside the years
+        """
+        first, last = self.span(start_year, end_year)
+        return self.local_status.count(bytearray([status]), first, last)
+
+    def all(self, status, start_year=None, end_year=None):
+        """
+        Return True if every file inside the years has the given status
+        """
+        first, last = self.span(start_year, end_year)
+        return self.local_status.count(bytearray([status]), first, last) == last - first
+
+    def find(self, status, start_year=None, end_year=None):
+        """
+        Return the offsets of the files with the given status inside the years
+        """
+        first, last = self.span(start_year, end_year)
+        needle = bytearray([status])
+        offsets = list()
+        idx = self.local_status.find(needle, first, last)
+        while idx != -1:
+            offsets.append(idx)
+            idx = self.local_status.find(needle, idx + 1, last)
+        return offsets
+
+    def set_status(self, offsets, status):
+        for offset in offsets:
+            self.local_status[offset] = status
+
+    def restore(self, start_year, local_status):
+        """
+        Copy the statuses saved from a series that started in start_year
+        onto the years this series shares with it
+
+        Parameters:
+            start_year (int): the first year of the saved series
+            local_status (bytearray): the saved statuses, with the same frequency as this series
+        """
+        shift = (start_year - self.start_year) * self._per_year
+        src = max(-shift, 0)
+        dst = max(shift, 0)
+        length = min(len(local_status) - src, len(self) - dst)
+        if length > 0:
+            self.local_status[dst: dst + length] = local_status[src: src + length]
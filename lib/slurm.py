@@ -3,8 +3,10 @@ import logging
 from time import sleep
 from subprocess import Popen, PIPE
 
+from lib.executor import Executor
 
-class Slurm(object):
+
+class Slurm(Executor):
     """
     A python interface for slurm using subprocesses
     """
@@ -133,6 +135,81 @@ class Slurm(object):
                 jobinfo[j[:index]] = j[index + 1:]
         return jobinfo
 
+    def showjobs(self, jobids, batch_size=500):
+        """
+        Look up the state of many jobs at once, with one squeue call for the
+        jobs still in the queue and one sacct call for any that have left it
+
+        Parameters:
+            jobids (list): the job ids to get information about
+            batch_size (int): the most job ids to pass to each call
+        Returns:
+            A dictionary mapping each job id (str), or array task id such as 1234_5,
+            slurm knows about to a dict with JobId, JobState, and for queued jobs
+            RunTime, NodeList and Reason, like showjob. Jobs neither squeue or sacct
+            know about are left out
+        """
+        jobids = [str(x) for x in jobids]
+        jobinfo = dict()
+        for idx in range(0, len(jobids), batch_size):
+            out, err = self._query([
+                'squeue', '--noheader', '--states=all', '--array',
+                '--jobs={}'.format(','.join(jobids[idx: idx + batch_size])),
+                '--format=%i|%T|%M|%N|%r'])
+            for line in out.split('\n'):
+                fields = line.strip().split('|')
+                if len(fields) < 5:
+                    continue
+                jobinfo[fields[0]] = {
+                    'JobId': fields[0],
+                    'JobState': fields[1],
+                    'RunTime': fields[2],
+                    'NodeList': fields[3],
+                    'Reason': fields[4]
+                }
+        missing = [x for x in jobids if x not in jobinfo]
+        for idx in range(0, len(missing), batch_size):
+            try:
+                out, err = self._query([
+                    'sacct', '--noheader', '--parsable2', '--allocations',
+                    '--jobs={}'.format(','.join(missing[idx: idx + batch_size])),
+                    '--format=JobID,State'])
+            except OSError as e:
+                # no accounting on this system
+                logging.error('Unable to run sacct: {}'.format(e))
+                break
+            for line in out.split('\n'):
+                fields = line.strip().split('|')
+                if len(fields) < 2 or fields[0] not in missing:
+                    continue
+                # such as CANCELLED by 1234
+                jobinfo[fields[0]] = {
+                    'JobId': fields[0],
+                    'JobState': fields[1].split(' ')[0]
+                }
+        return jobinfo
+
+    def _query(self, cmd):
+        """
+        Run a slurm command that only reads state, trying again if slurmctld
+        doesnt answer
+
+        Parameters:
+            cmd (list): the command and its arguments
+        Returns:
+            the output and error of the command
+        """
+        tries = 0
+        while tries != 10:
+            proc = Popen(cmd, shell=False, stderr=PIPE, stdout=PIPE)
+            out, err = proc.communicate()
+            if 'Transport endpoint is not connected' in err or 'Socket timed out' in err:
+                tries += 1
+                sleep(tries)
+            else:
+                return out, err
+        raise Exception('SLURM ERROR: Transport endpoint is not connected')
+
     def shownode(self, nodeid):
         """
         A wrapper around scontrol show node
@@ -181,6 +258,12 @@ class Slurm(object):
             err, out = p.communicate()
         return int(out)
 
+    def max_running_jobs(self):
+        """
+        Six jobs for every node that's up
+        """
+        return self.get_node_number() * 6
+
     def queue(self):
         """
         Get job queue status
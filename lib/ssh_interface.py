@@ -1,9 +1,16 @@
-import sys
 import os
+import stat
+import errno
 import logging
+import threading
+import itertools
+import functools
+import pipes
 import paramiko
 
-from getpass import getpass
+from Queue import Queue, Empty
+
+from getpass import getpass, getuser
 from lib.util import print_debug
 
 def get_ls(client, remote_path):
@@ -44,19 +51,96 @@ def get_ll(client, remote_path):
         })
     return ll
 
-def transfer(sftp_client, file):
+def list_directory(sftp_client, remote_path):
+    """
+    List the files in a remote directory with a single request
+
+    Parameters:
+        sftp_client (paramiko.SFTPClient): an open sftp session
+        remote_path (str): the directory to list
+    Returns:
+        a dict mapping each file name to its (size, mtime), empty if the directory doesnt exist
+    """
+    try:
+        attributes = sftp_client.listdir_attr(remote_path)
+    except IOError as e:
+        if e.errno == errno.ENOENT:
+            return dict()
+        raise
+    return {x.filename: (x.st_size, x.st_mtime) for x in attributes
+            if not stat.S_ISDIR(x.st_mode or 0)}
+
+# bytes of read requests kept in flight for each file
+DEFAULT_WINDOW = 4 * 2**20
+
+
+def download(sftp_client, remote_path, local_path, window=DEFAULT_WINDOW, progress=None):
+    """
+    Download remote_path to local_path + '.part' with pipelined reads, then
+    rename it to local_path once it is complete. A .part file left by an
+    interrupted download is picked up from where it stopped
+
+    Parameters:
+        sftp_client (paramiko.SFTPClient): the client to use for transport
+        remote_path (str): the file to download
+        local_path (str): where to put it
+        window (int): how many bytes of reads to keep requested at once
+        progress (function): called with the number of bytes after each block is written
+    Returns:
+        the number of bytes downloaded, not counting any resumed from
+    """
+    part_path = local_path + '.part'
+    size = sftp_client.stat(remote_path).st_size
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    if offset > size:
+        # the remote file was replaced by a smaller one, start over
+        offset = 0
+    chunk_size = paramiko.SFTPFile.MAX_REQUEST_SIZE
+    window = max(window, chunk_size)
+    windows = list()
+    for start in range(offset, size, window):
+        end = min(start + window, size)
+        windows.append([(x, min(chunk_size, end - x)) for x in range(start, end, chunk_size)])
+
+    def request(chunks):
+        # readv sends every request of the window as soon as it is started
+        blocks = remote_file.readv(chunks)
+        return itertools.chain([next(blocks)], blocks)
+
+    with sftp_client.open(remote_path, 'rb') as remote_file:
+        with open(part_path, 'r+b' if offset else 'wb') as local_file:
+            local_file.truncate(offset)
+            local_file.seek(offset)
+            # keep the next window requested while this one is written out
+            current = request(windows[0]) if windows else []
+            for idx in range(len(windows)):
+                following = request(windows[idx + 1]) if idx + 1 < len(windows) else []
+                for data in current:
+                    local_file.write(data)
+                    if progress is not None:
+                        progress(len(data))
+                current = following
+    received = os.path.getsize(part_path)
+    if received != size:
+        raise IOError('{} is {} bytes, expected {}'.format(part_path, received, size))
+    os.rename(part_path, local_path)
+    return size - offset
+
+
+def transfer(sftp_client, file, window=DEFAULT_WINDOW, progress=None):
     """
-    Use a paramiko ssh client to transfer the files in 
-    file_list one at a time
+    Use a paramiko ssh client to transfer one file, see download
 
     Parameters:
         sftp_client (paramiko.SFTPClient): the client to use for transport
         file (dict): a dict with keys remote_path, and local_path
+        window (int): how many bytes of reads to keep requested at once
+        progress (function): called with the number of bytes as they arrive
     """
 
     _, f_name = os.path.split(file['remote_path'])
     try:
-        sftp_client.get(file['remote_path'], file['local_path'])
+        download(sftp_client, file['remote_path'], file['local_path'], window, progress)
     except Exception as e:
         print_debug(e)
         msg = '{} transfer failed'.format(f_name)
@@ -67,32 +151,212 @@ def transfer(sftp_client, file):
         logging.info(msg)
     return True
 
-def get_ssh_client(hostname):    
+def parallel_transfer(client, file_list, channels=4, event=None, callback=None,
+                      window=DEFAULT_WINDOW, reconnect=None, retries=2, limit=None):
     """
-    Get user credentials and use them to log in to the remote host
+    Transfer files over several sftp channels that share the one
+    authenticated connection of client. Each channel takes the next
+    file from a shared queue, so a slow file doesnt hold up the rest
 
     Parameters:
-        hostname (str): the hostname of the remote host
+        client (paramiko.SSHClient): a connected client
+        file_list (list): dicts with keys remote_path, and local_path
+        channels (int): the number of sftp channels to open
+        event (threading.Event): stop taking new files once this is set
+        callback (function): called as callback(file, success) after each file,
+            from the channel threads
+        window (int): how many bytes of reads to keep requested for each file
+        reconnect (function): returns a new connected client if the connection
+            is lost, see SSHConnectionPool.get
+        retries (int): how many times to reconnect and resume a file whose
+            connection was lost
+        limit (EndpointLimit): the hosts limits, each file takes one of its
+            transfer slots and the bytes are counted against its bandwidth
     Returns:
-        Paramiko.Transport client if login successful,
-        None otherwise
+        the list of files that were transferred, and the list of those that
+        werent, including any that were never started
     """
-    username = raw_input('Username for {}: '.format(hostname))
+    queue = Queue()
+    for file in file_list:
+        queue.put(file)
+    done = list()
+    lock = threading.Lock()
+    connection = {'transport': client.get_transport()}
 
-    client = paramiko.SSHClient()
-    client.load_system_host_keys()
-    client.set_missing_host_key_policy(paramiko.WarningPolicy)
-    connected = False
-    for _ in range(3):
+    def open_channel():
+        with lock:
+            if not connection['transport'].is_active() and reconnect is not None:
+                connection['transport'] = reconnect().get_transport()
+            transport = connection['transport']
+        return paramiko.SFTPClient.from_transport(transport)
+
+    def channel():
+        sftp_client = None
         try:
-            password = getpass(prompt='Password for {}: '.format(hostname))
-            client.connect(hostname, port=22, username=username, password=password)
-        except Exception as e:
-            print 'Invalid password'
+            while event is None or not event.is_set():
+                try:
+                    file = queue.get_nowait()
+                except Empty:
+                    return
+                progress = None
+                if limit is not None:
+                    if not limit.acquire(event):
+                        queue.put(file)
+                        return
+                    progress = functools.partial(limit.transferred, event=event)
+                for _ in range(retries + 1):
+                    try:
+                        if sftp_client is None:
+                            sftp_client = open_channel()
+                    except Exception as e:
+                        print_debug(e)
+                        logging.error('Unable to open sftp channel')
+                        success = False
+                    else:
+                        success = transfer(sftp_client, file, window, progress)
+                    if success or reconnect is None:
+                        break
+                    # only a lost connection is worth another try
+                    if sftp_client is not None:
+                        if sftp_client.get_channel().get_transport().is_active():
+                            break
+                        sftp_client.close()
+                        sftp_client = None
+                if limit is not None:
+                    limit.release(1 if success else 0)
+                with lock:
+                    done.append((file, success))
+                if callback:
+                    try:
+                        callback(file, success)
+                    except Exception as e:
+                        print_debug(e)
+        finally:
+            if sftp_client is not None:
+                sftp_client.close()
+
+    threads = [threading.Thread(target=channel, name='sftp_channel_{}'.format(idx))
+               for idx in range(max(min(channels, len(file_list)), 1))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    succeeded = [x for x, success in done if success]
+    failed = [x for x, success in done if not success]
+    while not queue.empty():
+        failed.append(queue.get_nowait())
+    return succeeded, failed
+
+def remote_checksums(client, paths, command='md5sum', batch_size=200):
+    """
+    Checksum files on the remote host
+
+    Parameters:
+        client (paramiko.SSHClient): a connected client
+        paths (list): the remote paths to checksum
+        command (str): the remote command, it must print 'digest  path' lines like md5sum
+        batch_size (int): how many paths to pass to each command
+    Returns:
+        a dict mapping each path that could be read to its hex digest
+    """
+    checksums = dict()
+    for idx in range(0, len(paths), batch_size):
+        cmd = '{} {}'.format(command, ' '.join(pipes.quote(x) for x in paths[idx: idx + batch_size]))
+        _, stdout, _ = client.exec_command(cmd)
+        for line in stdout.read().splitlines():
+            digest, _, path = line.partition('  ')
+            if path:
+                checksums[path] = digest
+    return checksums
+
+class SSHConnectionPool(object):
+    """
+    One authenticated ssh connection per host, shared by every transfer
+    thread for that host
+
+    Connections authenticate with the ssh agent or a key first and only ask
+    for a password if that fails. A password that worked is kept so a dropped
+    connection can be reopened without asking again. Keepalives are sent so
+    idle connections between transfers arent closed by the remote side
+    """
+
+    def __init__(self, usernames=None, key_filename=None, keepalive=30):
+        """
+        Parameters:
+            usernames (dict): maps hostnames to the username to log in with,
+                default is the local username
+            key_filename (str): a private key to try along with the agent and ~/.ssh keys
+            keepalive (int): seconds between keepalive packets, 0 to turn them off
+        """
+        self._usernames = usernames if usernames else dict()
+        self._key_filename = key_filename
+        self._keepalive = keepalive
+        self._clients = dict()
+        self._passwords = dict()
+        self._lock = threading.Lock()
+
+    def get(self, hostname, prompt=True):
+        """
+        Return a connected paramiko.SSHClient for hostname, connecting or
+        reconnecting if there isnt an active one
+
+        Parameters:
+            hostname (str): the host, optionally as hostname:port
+            prompt (bool): ask for a password if there isnt a working one saved
+        """
+        with self._lock:
+            client = self._clients.get(hostname)
+            if client is not None:
+                transport = client.get_transport()
+                if transport is not None and transport.is_active():
+                    return client
+                client.close()
+                msg = 'ssh connection to {} was lost, reconnecting'.format(hostname)
+                logging.info(msg)
+            client = self._connect(hostname, prompt)
+            self._clients[hostname] = client
+            return client
+
+    def _connect(self, hostname, prompt):
+        host, _, port = hostname.partition(':')
+        port = int(port) if port else 22
+        username = self._usernames.get(hostname) or getuser()
+
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        client.set_missing_host_key_policy(paramiko.WarningPolicy())
+        password = self._passwords.get(hostname)
+        if password is None:
+            try:
+                client.connect(host, port=port, username=username,
+                               key_filename=self._key_filename)
+            except paramiko.SSHException as e:
+                msg = 'key authentication to {} failed: {}'.format(hostname, e)
+                logging.info(msg)
+                if not prompt:
+                    raise
+                for _ in range(3):
+                    password = getpass(prompt='Password for {}@{}: '.format(username, hostname))
+                    try:
+                        client.connect(host, port=port, username=username, password=password,
+                                       allow_agent=False, look_for_keys=False)
+                    except paramiko.AuthenticationException:
+                        print 'Invalid password'
+                    else:
+                        self._passwords[hostname] = password
+                        break
+                else:
+                    raise Exception('Unable to open ssh connection for {}'.format(hostname))
         else:
-            connected = True
-            break
-    if not connected:
-        print 'Unable to open ssh connection for {}'.format(hostname)
-        sys.exit(1)
-    return client
+            client.connect(host, port=port, username=username, password=password,
+                           allow_agent=False, look_for_keys=False)
+        if self._keepalive:
+            client.get_transport().set_keepalive(self._keepalive)
+        return client
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients = dict()
@@ -0,0 +1,199 @@
+"""
+Per host and per endpoint limits on how much is transferred at once, and the
+throughput each one is seeing
+"""
+import threading
+from collections import deque, namedtuple
+from time import sleep, time
+
+# A snapshot of one endpoint, rate is in bytes per second over the last RATE_WINDOW seconds
+TransferStats = namedtuple('TransferStats', ['active', 'files', 'bytes', 'rate'])
+
+RATE_WINDOW = 60
+
+
+class TokenBucket(object):
+    """
+    Limit a rate shared between threads. Tokens refill at rate per second up to
+    burst, and a consumer that takes more than are left waits off the debt, so
+    any amount can be taken at once and the average stays at rate
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else rate)
+        self._tokens = self.burst
+        self._stamp = time()
+        self._lock = threading.Lock()
+
+    def consume(self, amount, event=None):
+        """
+        Take amount tokens, waiting until the rate allows it
+
+        Parameters:
+            amount (int): how many tokens to take
+            event (threading.Event): stop waiting early if this is set
+        Returns:
+            the number of seconds waited
+        """
+        with self._lock:
+            now = time()
+            self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._tokens -= amount
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            if event is not None:
+                event.wait(wait)
+            else:
+                sleep(wait)
+        return wait
+
+
+class EndpointLimit(object):
+    """
+    The concurrency cap, bandwidth limit and throughput counters of one sftp
+    host or globus endpoint
+
+    Parameters:
+        max_transfers (int): the most transfers at once, no limit if None
+        max_bandwidth (float): the most bytes per second, no limit if None
+    """
+
+    def __init__(self, max_transfers=None, max_bandwidth=None):
+        self.max_transfers = max_transfers
+        self.max_bandwidth = max_bandwidth
+        self._bucket = TokenBucket(max_bandwidth) if max_bandwidth else None
+        self._cond = threading.Condition(threading.Lock())
+        self._active = 0
+        self._files = 0
+        self._bytes = 0
+        # (time, bytes) for the last RATE_WINDOW seconds
+        self._samples = deque()
+
+    def acquire(self, event=None, block=True):
+        """
+        Take a transfer slot, waiting for one to free up if block is set
+
+        Returns:
+            True if a slot was taken, False if none was free or event was set first
+        """
+        with self._cond:
+            while self.max_transfers and self._active >= self.max_transfers:
+                if not block or (event is not None and event.is_set()):
+                    return False
+                self._cond.wait(0.5)
+            self._active += 1
+            return True
+
+    def release(self, files=0):
+        """
+        Give back a transfer slot
+
+        Parameters:
+            files (int): how many files the transfer completed
+        """
+        with self._cond:
+            self._active -= 1
+            self._files += files
+            self._cond.notify()
+
+    def transferred(self, nbytes, event=None):
+        """
+        Count bytes that were just transferred, waiting as long as the bandwidth
+        limit needs before the transfer goes on
+        """
+        now = time()
+        with self._cond:
+            self._bytes += nbytes
+            self._samples.append((now, nbytes))
+            while self._samples and self._samples[0][0] < now - RATE_WINDOW:
+                self._samples.popleft()
+        if self._bucket is not None:
+            self._bucket.consume(nbytes, event)
+
+    def stats(self):
+        now = time()
+        with self._cond:
+            while self._samples and self._samples[0][0] < now - RATE_WINDOW:
+                self._samples.popleft()
+            recent = sum(x[1] for x in self._samples)
+            if self._samples:
+                # until a full window has passed, average over what there is
+                span = max(min(now - self._samples[0][0], RATE_WINDOW), 1)
+            else:
+                span = RATE_WINDOW
+            return TransferStats(
+                active=self._active,
+                files=self._files,
+                bytes=self._bytes,
+                rate=recent / float(span))
+
+
+class TransferLimits(object):
+    """
+    The EndpointLimit of every sftp host and globus endpoint in the config
+
+    max_transfers and max_bandwidth (in MB/s) can be set in the global section or
+    for a simulation, when several simulations use the same host or endpoint
+    the lowest value applies. For sftp max_transfers caps the files being pulled
+    from a host at once, across every transfer started. For globus it caps the
+    tasks active on an endpoint, and max_bandwidth isnt used since globus
+    manages the bandwidth of its own tasks
+
+    Parameters:
+        config (dict): the run config
+        defaults (dict): the max_transfers to use for each transfer_type when
+            the config doesnt set one
+    """
+
+    def __init__(self, config, defaults=None):
+        defaults = defaults or dict()
+        self._options = dict()
+        for case, options in config['simulations'].items():
+            if not isinstance(options, dict):
+                continue
+            transfer_type = options.get('transfer_type')
+            if transfer_type == 'sftp':
+                endpoint = options.get('remote_hostname')
+            elif transfer_type == 'globus':
+                endpoint = options.get('remote_uuid')
+            else:
+                continue
+            current = self._options.setdefault(endpoint, dict())
+            options_used = [('max_transfers', defaults.get(transfer_type))]
+            if transfer_type == 'sftp':
+                options_used.append(('max_bandwidth', None))
+            for option, default in options_used:
+                value = options.get(option, config['global'].get(option, default))
+                if value is None or value == '':
+                    continue
+                value = float(value)
+                if current.get(option) is None or value < current[option]:
+                    current[option] = value
+        self._limits = dict()
+        self._lock = threading.Lock()
+
+    def get(self, endpoint):
+        """
+        Return the EndpointLimit for a host or endpoint
+        """
+        with self._lock:
+            limit = self._limits.get(endpoint)
+            if limit is None:
+                options = self._options.get(endpoint, dict())
+                max_transfers = options.get('max_transfers')
+                max_bandwidth = options.get('max_bandwidth')
+                limit = self._limits[endpoint] = EndpointLimit(
+                    max_transfers=int(max_transfers) if max_transfers else None,
+                    max_bandwidth=max_bandwidth * 2**20 if max_bandwidth else None)
+            return limit
+
+    def stats(self):
+        """
+        Returns:
+            a dict mapping each host or endpoint used so far to its TransferStats
+        """
+        with self._lock:
+            limits = dict(self._limits)
+        return {x: y.stats() for x, y in limits.items()}
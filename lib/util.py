@@ -13,6 +13,7 @@ from string import Formatter
 from lib.jobstatus import ReverseMap, JobStatus
 from mailer import Mailer
 from models import DataFile
+from lib.cadence import Cadence
 
 
 def print_line(line, event_list, ignore_text=False):
@@ -83,19 +84,39 @@ def get_ts_output_files(input_path, var_list, start_year, end_year):
                 break
     return ts_list
 
-def get_data_output_files(input_path, case, start_year, end_year):
+def get_data_output_files(input_path, case, start_year, end_year, frequency='monthly'):
+    """
+    Return a list of the files for a case from start_year to end_year, in date order
+
+    The date stamp of each file in the directory is parsed once and
+    the expected dates are looked up in the result
+
+    Parameters:
+        input_path (str): the directory to look in
+        case (str): the case the files belong to
+        start_year (int): the first year
+        end_year (int): the last year
+        frequency (str): the cadence of the files, see lib.cadence.Cadence
+    Returns:
+        data_list (list(str)): the names of the files found
+    """
     if not os.path.exists(input_path):
         return None
     contents = [s for s in os.listdir(input_path) if not os.path.isdir(s)]
     contents.sort()
+    pattern = re.compile(r'%s.*\.(\d{4}(?:-\d{2}(?:-\d{2}(?:-\d{5})?)?)?)\.nc$' % re.escape(case))
+    by_date = dict()
+    for item in contents:
+        match = pattern.match(item)
+        if match:
+            by_date.setdefault(match.group(1), item)
+    cadence = Cadence(frequency)
     data_list = list()
     for year in range(start_year, end_year + 1):
-        for month in range(1, 13):
-            pattern = r'%s.*\.%04d-%02d.nc' % (case, year, month)
-            for item in contents:
-                if re.match(pattern, item):
-                    data_list.append(item)
-                    break
+        for slot in range(cadence.slots_per_year):
+            item = by_date.get(cadence.date_string(year, slot))
+            if item is not None:
+                data_list.append(item)
     return data_list
 
 def print_debug(e):
@@ -0,0 +1,98 @@
+"""
+Sync levels and post-transfer checksum verification of transferred files
+"""
+import os
+import hashlib
+
+# the globus sync levels, from cheapest to most thorough
+SYNC_LEVELS = ['exists', 'size', 'mtime', 'checksum']
+
+# how many of the transferred files to checksum afterwards
+VERIFY_POLICIES = ['none', 'sample', 'all']
+
+# the remote commands sftp transfers can be checksummed with, and the hashlib
+# algorithm that makes the same digest locally
+CHECKSUM_COMMANDS = {
+    'md5sum': 'md5',
+    'sha1sum': 'sha1',
+    'sha224sum': 'sha224',
+    'sha256sum': 'sha256',
+    'sha384sum': 'sha384',
+    'sha512sum': 'sha512'
+}
+
+
+def checksum_algorithm(command):
+    """
+    Return the hashlib algorithm for a checksum command such as sha256sum or
+    /usr/bin/md5sum, or None if it isnt one of CHECKSUM_COMMANDS
+    """
+    words = str(command).split()
+    if len(words) != 1:
+        return None
+    return CHECKSUM_COMMANDS.get(os.path.basename(words[0]))
+
+
+def selected(path, policy, fraction):
+    """
+    Returns True if the file at path should be verified under the given policy.
+    Sampling is by a hash of the path, so the same files are picked on every
+    run and the choice doesnt depend on what else is being transferred
+
+    Parameters:
+        path (str): the local path of the file
+        policy (str): one of VERIFY_POLICIES
+        fraction (float): the share of files to sample under the sample policy
+    """
+    if policy == 'all':
+        return True
+    if policy != 'sample' or fraction <= 0:
+        return False
+    bucket = int(hashlib.md5(path.encode('utf-8')).hexdigest()[:8], 16)
+    return bucket < fraction * 2**32
+
+
+def file_checksum(path, algorithm='md5', block_size=2**20):
+    """
+    Return the hex digest of a local file
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fp:
+        while True:
+            block = fp.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def compare_checksums(file_list, remote_checksums, algorithm='md5'):
+    """
+    Compare the local checksum of each file with the one from the remote host
+
+    Parameters:
+        file_list (list): dicts with keys remote_path, and local_path
+        remote_checksums (dict): maps remote paths to hex digests
+        algorithm (str): the hashlib algorithm the remote digests were made with
+    Returns:
+        the list of files that matched, the list of those that didnt or that
+        are missing locally, and the list of those the remote had no digest for
+    """
+    verified = list()
+    mismatched = list()
+    unverified = list()
+    for datafile in file_list:
+        remote = remote_checksums.get(datafile['remote_path'])
+        try:
+            local = file_checksum(datafile['local_path'], algorithm)
+        except (IOError, OSError):
+            local = None
+        if local is None:
+            mismatched.append(datafile)
+        elif remote is None:
+            unverified.append(datafile)
+        elif local == remote:
+            verified.append(datafile)
+        else:
+            mismatched.append(datafile)
+    return verified, mismatched, unverified
@@ -1,6 +1,9 @@
 """
 A module to varify that the user config is valid
 """
+from lib.cadence import Cadence
+from lib.verification import SYNC_LEVELS, VERIFY_POLICIES, CHECKSUM_COMMANDS, checksum_algorithm
+from lib.local_copy import METHODS as LOCAL_COPY_METHODS
 
 def verify_config(config):
     messages = list()
@@ -17,6 +20,33 @@ def verify_config(config):
         if not config['global'].get('project_path'):
             msg = 'no project_path in global options'
             messages.append(msg)
+        if config['global'].get('catalog_backend', 'table') not in ['table', 'series']:
+            msg = 'catalog_backend must be either table or series'
+            messages.append(msg)
+        if config['global'].get('executor', 'slurm') not in ['slurm', 'local']:
+            msg = 'executor must be either slurm or local'
+            messages.append(msg)
+        if not checksum_algorithm(config['global'].get('checksum_command', 'md5sum')):
+            msg = 'checksum_command must be one of {}'.format(', '.join(sorted(CHECKSUM_COMMANDS)))
+            messages.append(msg)
+        for option in ['remote_inventory', 'job_arrays', 'slurm_dependencies']:
+            if config['global'].get(option) in ['True', 'False']:
+                config['global'][option] = config['global'][option] == 'True'
+        for option in ['remote_inventory_interval', 'remote_settle', 'loop_delay']:
+            try:
+                if float(config['global'].get(option, 0)) < 0:
+                    raise ValueError
+            except ValueError:
+                msg = '{} must be a number of seconds'.format(option)
+                messages.append(msg)
+        for option in ['sftp_channels', 'sftp_window', 'transfer_wave_size', 'local_copy_threads',
+                       'max_array_size', 'local_cores']:
+            try:
+                if int(config['global'].get(option, 1)) < 1:
+                    raise ValueError
+            except ValueError:
+                msg = '{} must be a positive integer'.format(option)
+                messages.append(msg)
     if not config.get('data_types'):
         msg = 'No data_types section found in config'
         messages.append(msg)
@@ -113,6 +143,62 @@ def verify_config(config):
             config['data_types'][ftype]['monthly'] = True
         if config['data_types'][ftype].get('monthly') == 'False':
             config['data_types'][ftype]['monthly'] = False
+        if config['data_types'][ftype].get('frequency'):
+            try:
+                Cadence(config['data_types'][ftype]['frequency'])
+            except ValueError as e:
+                msg = '{} has an invalid frequency, {}'.format(ftype, e)
+                messages.append(msg)
+    # ------------------------------------------------------------------------
+    # check the transfer sync levels, verification and local copy methods,
+    # set globally, per simulation or per data_type
+    # ------------------------------------------------------------------------
+    sections = [('global', config['global'])]
+    sections += [(x, y) for x, y in config['simulations'].items()
+                 if x not in ['comparisons', 'start_year', 'end_year']]
+    sections += list(config['data_types'].items())
+    for name, options in sections:
+        if options.get('sync_level') and options['sync_level'] not in SYNC_LEVELS:
+            msg = '{} has an invalid sync_level, it must be one of {}'.format(
+                name, ', '.join(SYNC_LEVELS))
+            messages.append(msg)
+        if options.get('verify') and options['verify'] not in VERIFY_POLICIES:
+            msg = '{} has an invalid verify policy, it must be one of {}'.format(
+                name, ', '.join(VERIFY_POLICIES))
+            messages.append(msg)
+        if options.get('verify_fraction') is not None:
+            try:
+                if not 0 <= float(options['verify_fraction']) <= 1:
+                    raise ValueError
+            except ValueError:
+                msg = '{} verify_fraction must be a number between 0 and 1'.format(name)
+                messages.append(msg)
+        if options.get('local_copy_methods'):
+            if not isinstance(options['local_copy_methods'], list):
+                options['local_copy_methods'] = [options['local_copy_methods']]
+            for method in options['local_copy_methods']:
+                if method not in LOCAL_COPY_METHODS:
+                    msg = '{} has an invalid local_copy_methods entry {}, they must be from {}'.format(
+                        name, method, ', '.join(LOCAL_COPY_METHODS))
+                    messages.append(msg)
+    # ------------------------------------------------------------------------
+    # check the per host and endpoint transfer limits, set globally or per simulation
+    # ------------------------------------------------------------------------
+    for name, options in sections[:len(sections) - len(config['data_types'])]:
+        if options.get('max_transfers') not in [None, '']:
+            try:
+                if int(options['max_transfers']) < 1:
+                    raise ValueError
+            except ValueError:
+                msg = '{} max_transfers must be a positive integer'.format(name)
+                messages.append(msg)
+        if options.get('max_bandwidth') not in [None, '']:
+            try:
+                if float(options['max_bandwidth']) <= 0:
+                    raise ValueError
+            except ValueError:
+                msg = '{} max_bandwidth must be a positive number of MB/s'.format(name)
+                messages.append(msg)
     # ------------------------------------------------------------------------
     # check img_hosting
     # ------------------------------------------------------------------------
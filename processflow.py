@@ -8,7 +8,6 @@ import json
 import threading
 import logging
 
-from time import sleep
 from globus_cli.services.transfer import get_client
 
 from lib.events import EventList
@@ -16,6 +15,7 @@ from lib.initialize import initialize
 from lib.finalize import finalize
 from lib.filemanager import FileManager
 from lib.runmanager import RunManager
+from lib.rwlock import RWLock
 from lib.util import print_line
 from lib.util import print_message
 from lib.util import print_debug
@@ -41,7 +41,7 @@ def main(test=False, **kwargs):
 
     # An event to kill the threads on terminal exception
     thread_kill_event = threading.Event()
-    mutex = threading.Lock()
+    mutex = RWLock()
 
     # A flag to tell if we have all the data locally
     all_data = False
@@ -86,9 +86,11 @@ def main(test=False, **kwargs):
     filemanager.update_local_status()
     all_data_local = filemanager.all_data_local()
     if not all_data_local:
+        runmanager.check_data_ready()
         filemanager.transfer_needed(
             event_list=event_list,
-            event=thread_kill_event)
+            event=thread_kill_event,
+            priorities=runmanager.transfer_priorities())
     
     # msg = "Writing human readable state to file"
     # print_line(msg, event_list)
@@ -132,7 +134,15 @@ def main(test=False, **kwargs):
 
     # Main loop
     printed = False
-    loop_delay = 10
+    loop_delay = float(config['global'].get('loop_delay', 10))
+    # set by the inotify watcher to cut the loop_delay short when files arrive
+    wake_event = threading.Event()
+    if config['global'].get('watch'):
+        watched = filemanager.watch(
+            wake_event=wake_event,
+            output_path=config['global'].get('pp_path'))
+        msg = 'Watching {} directories for new files'.format(len(watched))
+        print_line(msg, event_list)
     state_path = os.path.join(
         config['global']['project_path'],
         'output',
@@ -143,6 +153,9 @@ def main(test=False, **kwargs):
         print " Status file: {}".format(state_path)
         print "--------------------------"
         while True:
+            # cleared before the catalog is read, so files that arrive while this
+            # pass runs cut the next wait short instead of being lost
+            wake_event.clear()
             if not all_data_local:
                 if debug: print_line(' -- Updating local status --', event_list)    
 
@@ -155,7 +168,8 @@ def main(test=False, **kwargs):
                 if debug: print_line(' -- Additional data needed --', event_list)
                 filemanager.transfer_needed(
                     event_list,
-                    thread_kill_event)
+                    thread_kill_event,
+                    priorities=runmanager.transfer_priorities())
 
             if debug: print_line(' -- checking data -- ', event_list)
             runmanager.check_data_ready()
@@ -165,7 +179,8 @@ def main(test=False, **kwargs):
             runmanager.monitor_running_jobs()
 
             if debug: print_line(' -- writing out state -- ', event_list)
-            runmanager.write_job_sets(state_path)
+            runmanager.write_job_sets(
+                state_path, filemanager.progress(), filemanager.transfer_stats())
             
             status = runmanager.is_all_done()
             # return -1 if still running
@@ -177,6 +192,7 @@ def main(test=False, **kwargs):
 
                 printed = False
                 while not filemanager.all_data_local():
+                    wake_event.clear()
                     if not printed:
                         printed = True
                         msg = 'Jobs are complete, but additional data is being transfered'
@@ -186,7 +202,7 @@ def main(test=False, **kwargs):
                         filemanager.transfer_needed(
                             event_list=event_list,
                             event=thread_kill_event)
-                    sleep(10)
+                    wake_event.wait(loop_delay)
                 filemanager.write_database()
                 finalize(
                     config=config,
@@ -197,7 +213,7 @@ def main(test=False, **kwargs):
                 # SUCCESS EXIT
                 return 0
             if debug: print_line(' -- sleeping', event_list)
-            sleep(loop_delay)
+            wake_event.wait(loop_delay)
     except KeyboardInterrupt as e:
         print_message('\n----- KEYBOARD INTERRUPT -----')
         runmanager.write_job_sets(state_path)
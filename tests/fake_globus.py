@@ -0,0 +1,148 @@
+"""
+An offline stand-in for the globus TransferClient used by the globus
+transfer tests and benchmarks. Tasks copy files from a local directory,
+a few files each time the task is polled. Files the sync level finds
+already in place are skipped, and arent listed as successful transfers.
+Directory listings are of the same local directory
+"""
+import os
+import filecmp
+import shutil
+import threading
+import uuid
+from datetime import datetime
+
+from globus_sdk import TransferAPIError
+
+
+class _Response(object):
+    """
+    Just enough of a requests response to build a TransferAPIError from
+    """
+
+    def __init__(self, status_code, code, message):
+        self.status_code = status_code
+        self.headers = {'Content-Type': 'application/json'}
+        self._data = {'code': code, 'message': message, 'request_id': 'fake'}
+        self.text = message
+
+    def json(self):
+        return self._data
+
+
+class FakeTransferClient(object):
+    """
+    Parameters:
+        root (str): source paths are read from under this directory
+        files_per_poll (int): how many files each task moves per get_task call
+        page_size (int): how many successful transfers each page lists
+    """
+
+    def __init__(self, root, files_per_poll=5, page_size=100):
+        self.root = root
+        self.files_per_poll = files_per_poll
+        self.page_size = page_size
+        self.tasks = dict()
+        self.calls = list()
+        self.sync_levels = list()
+        self._lock = threading.Lock()
+
+    def get_submission_id(self):
+        return {'value': str(uuid.uuid4())}
+
+    def qjoin_path(self, *parts):
+        return '/' + '/'.join(parts)
+
+    def submit_transfer(self, data):
+        task_id = str(uuid.uuid4())
+        with self._lock:
+            self.calls.append(('submit_transfer', task_id))
+            self.sync_levels.append(data.get('sync_level'))
+            self.tasks[task_id] = {
+                'source_endpoint': data['source_endpoint'],
+                'destination_endpoint': data['destination_endpoint'],
+                'sync_level': data.get('sync_level'),
+                'items': list(data['DATA']),
+                'done': list(),
+                'failed': list(),
+                'status': 'ACTIVE'
+            }
+        return {'task_id': task_id}
+
+    def get_task(self, task_id):
+        with self._lock:
+            self.calls.append(('get_task', task_id))
+            task = self.tasks[task_id]
+            if task['status'] == 'ACTIVE':
+                for _ in range(self.files_per_poll):
+                    if not task['items']:
+                        break
+                    item = task['items'].pop(0)
+                    source = os.path.join(self.root, item['source_path'].lstrip('/'))
+                    if self._in_sync(task['sync_level'], source, item['destination_path']):
+                        continue
+                    if os.path.exists(source):
+                        shutil.copy(source, item['destination_path'])
+                        task['done'].append(item)
+                    else:
+                        task['failed'].append(item)
+                if not task['items']:
+                    task['status'] = 'FAILED' if task['failed'] else 'SUCCEEDED'
+            return {
+                'task_id': task_id,
+                'status': task['status'],
+                'files': len(task['done']) + len(task['failed']) + len(task['items']),
+                'files_transferred': len(task['done']),
+                'bytes_transferred': sum(os.path.getsize(x['destination_path']) for x in task['done']
+                                         if os.path.exists(x['destination_path'])),
+                'nice_status_details': '{} files not found'.format(len(task['failed'])) if task['failed'] else None
+            }
+
+    def _in_sync(self, sync_level, source, destination):
+        if sync_level is None or not os.path.exists(source) or not os.path.exists(destination):
+            return False
+        # TransferData sends the levels exists, size, mtime and checksum as 0 to 3
+        if sync_level == 0:
+            return True
+        if sync_level == 3:
+            return filecmp.cmp(source, destination, shallow=False)
+        return os.path.getsize(source) == os.path.getsize(destination)
+
+    def get(self, path, params=None):
+        _, _, task_id, resource = path.split('/')
+        assert resource == 'successful_transfers'
+        marker = int((params or {}).get('marker', 0))
+        with self._lock:
+            self.calls.append(('successful_transfers', task_id))
+            done = self.tasks[task_id]['done']
+            page = done[marker: marker + self.page_size]
+            next_marker = marker + self.page_size if marker + self.page_size < len(done) else None
+        return {
+            'DATA': [{'source_path': x['source_path'], 'destination_path': x['destination_path']}
+                     for x in page],
+            'next_marker': next_marker
+        }
+
+    def operation_ls(self, endpoint_id, path=None):
+        with self._lock:
+            self.calls.append(('operation_ls', path))
+        directory = os.path.join(self.root, path.lstrip('/'))
+        if not os.path.isdir(directory):
+            raise TransferAPIError(_Response(404, 'ClientError.NotFound', '{} not found'.format(path)))
+        entries = list()
+        for name in sorted(os.listdir(directory)):
+            info = os.stat(os.path.join(directory, name))
+            entries.append({
+                'name': name,
+                'type': 'dir' if os.path.isdir(os.path.join(directory, name)) else 'file',
+                'size': info.st_size,
+                'last_modified': datetime.utcfromtimestamp(info.st_mtime).strftime(
+                    '%Y-%m-%d %H:%M:%S+00:00')
+            })
+        return entries
+
+    def cancel_task(self, task_id):
+        with self._lock:
+            self.calls.append(('cancel_task', task_id))
+            self.tasks[task_id]['status'] = 'FAILED'
+        return {'code': 'Canceled'}
@@ -0,0 +1,355 @@
+"""
+Fake slurm commands for tests and benchmarks, installed into a directory
+that is put on the PATH. Every call is logged so tests can count how many
+times slurm was forked, and the jobs are kept in a json file the test edits.
+
+With simulate set the jobs run themselves instead, each submitted job waits
+in the queue and runs for times drawn at random, then completes, fails or
+times out, so the run manager can be load tested without a cluster
+
+    python tests/fake_slurm.py --runtime 30 --failure-rate 0.01 /tmp/fake_slurm
+    export PATH=/tmp/fake_slurm/bin:$PATH
+"""
+import os
+import sys
+import json
+import stat
+import shutil
+import argparse
+import tempfile
+
+from contextlib import contextmanager
+
+COMMANDS = ['squeue', 'sacct', 'scontrol', 'sinfo', 'sbatch', 'scancel']
+
+# the simulation settings, times are in seconds
+SIMULATION = {
+    # the mean time a job waits in the queue, exponentially distributed
+    'queue_wait': 0.0,
+    # the median time a job runs, log-normally distributed with runtime_sigma
+    'runtime': 1.0,
+    'runtime_sigma': 0.5,
+    # the chance of a job failing, or running out of time
+    'failure_rate': 0.0,
+    'timeout_rate': 0.0,
+    # the chance of any command failing with Transport endpoint is not connected
+    'transport_error_rate': 0.0,
+    # how long finished jobs stay in squeue, see MinJobAge in slurm.conf
+    'linger': 5.0,
+    'seed': 0
+}
+
+_SCRIPT = r'''#!{python}
+import os
+import sys
+import json
+import math
+import time
+import fcntl
+import random
+
+root = {root!r}
+name = os.path.basename(sys.argv[0])
+FINISHED = ['COMPLETED', 'FAILED', 'TIMEOUT', 'CANCELLED']
+
+lock = open(os.path.join(root, 'lock'), 'w')
+fcntl.flock(lock, fcntl.LOCK_EX)
+with open(os.path.join(root, 'calls.log'), 'a') as fp:
+    fp.write(json.dumps([name] + sys.argv[1:]) + '\n')
+with open(os.path.join(root, 'jobs.json')) as fp:
+    state = json.load(fp)
+time.sleep(state['latency'])
+jobs = state['jobs']
+simulate = state.get('simulate')
+now = time.time()
+
+
+def save():
+    # dumps uses the c encoder, dump to a file doesnt
+    with open(os.path.join(root, 'jobs.json'), 'w') as fp:
+        fp.write(json.dumps(state))
+
+
+def option(flag):
+    for arg in sys.argv[1:]:
+        if arg.startswith(flag + '='):
+            return arg.split('=', 1)[1]
+
+
+def invalid():
+    sys.stderr.write('slurm_load_jobs error: Invalid job id specified\n')
+    sys.exit(1)
+
+
+def ordered(ids):
+    return sorted(ids, key=lambda x: [int(y) for y in x.split('_')])
+
+
+def run(job):
+    """
+    Move a simulated job along to where it would be by now
+    """
+    sim = job['sim']
+    ready = sim['submit']
+    if job.get('dependency'):
+        names = job['dependency'].split(':')[1:]
+        depends = [x for x in jobs if any(x == y or x.startswith(y + '_') for y in names)]
+        if any(jobs[x]['state'] in FINISHED and jobs[x]['state'] != 'COMPLETED' for x in depends):
+            job['reason'] = 'DependencyNeverSatisfied'
+            return
+        if any(jobs[x]['state'] != 'COMPLETED' for x in depends):
+            job['reason'] = 'Dependency'
+            return
+        ready = max([ready] + [jobs[x].get('end', ready) for x in depends])
+    start = ready + sim['wait']
+    if now < start:
+        job['reason'] = 'Priority'
+    elif now < start + sim['runtime']:
+        job.update(state='RUNNING', reason='None')
+    else:
+        job.update(state=sim['outcome'], reason='None', end=start + sim['runtime'])
+
+
+if simulate:
+    state['calls'] = state.get('calls', 0) + 1
+    roll = random.Random('{{}}-{{}}'.format(simulate['seed'], state['calls'])).random()
+    if roll < simulate['transport_error_rate']:
+        save()
+        sys.stderr.write('slurm_load_jobs error: Transport endpoint is not connected\n')
+        sys.exit(1)
+    for x in ordered(jobs):
+        job = jobs[x]
+        if 'sim' not in job:
+            continue
+        if job['state'] not in FINISHED:
+            run(job)
+        if job['state'] in FINISHED:
+            job['queued'] = now < job.get('end', now) + simulate['linger']
+
+
+if name == 'squeue':
+    ids = option('--jobs')
+    queued = [x for x in ordered(jobs) if jobs[x]['queued']]
+    if ids is None:
+        print('JOBID PARTITION NAME USER ST TIME NODES NODELIST(REASON)')
+        for x in queued:
+            print('{{}} debug job user {{}} 0:01 1 node1'.format(
+                x, 'R' if jobs[x]['state'] == 'RUNNING' else 'PD'))
+    else:
+        ids = ids.split(',')
+        found = [x for x in ids if x in queued]
+        if len(ids) == 1 and not found:
+            invalid()
+        for x in found:
+            print('{{}}|{{}}|0:01|node1|{{}}'.format(
+                x, jobs[x]['state'], jobs[x].get('reason', 'None')))
+elif name == 'sacct':
+    for x in option('--jobs').split(','):
+        if x in jobs:
+            print('{{}}|{{}}'.format(x, jobs[x]['state']))
+            if '--allocations' not in sys.argv:
+                print('{{}}.batch|{{}}'.format(x, jobs[x]['state']))
+elif name == 'scontrol':
+    if sys.argv[2] == 'jobs':
+        # every queued job, as the submit retry looks for its script in
+        for x in ordered(jobs):
+            if jobs[x]['queued']:
+                print('JobId={{}} JobName=job'.format(x))
+                print('   JobState={{}} Reason=None'.format(jobs[x]['state']))
+                print('   Command={{}}'.format(jobs[x].get('script', '')))
+                print('')
+    else:
+        x = sys.argv[3]
+        if x not in jobs or not jobs[x]['queued']:
+            invalid()
+        print('JobId={{}} JobName=job'.format(x))
+        print('   UserId=user JobState={{}} Reason=None'.format(jobs[x]['state']))
+elif name == 'sinfo':
+    for _ in range(state['nodes']):
+        print('debug up infinite 1 idle node1')
+elif name == 'sbatch':
+    state['next_id'] += 1
+    job_id = str(state['next_id'])
+    script = [x for x in sys.argv[1:] if not x.startswith('-')][0]
+    with open(script) as fp:
+        options = [x.split()[1:] for x in fp if x.startswith('#SBATCH')]
+    tasks = [x[0].split('=')[1] for x in options if x[0].startswith('--array=')]
+    depends = [x[0].split('=')[1] for x in options if x[0].startswith('--dependency=')]
+    task_ids = [job_id]
+    if tasks:
+        first, last = tasks[0].split('-')
+        task_ids = ['{{}}_{{}}'.format(job_id, x) for x in range(int(first), int(last) + 1)]
+    for task_id in task_ids:
+        job = {{'state': 'PENDING', 'queued': True, 'script': script}}
+        if depends:
+            job['dependency'] = depends[0]
+            job['reason'] = 'Dependency'
+        if simulate:
+            rng = random.Random('{{}}-{{}}'.format(simulate['seed'], task_id))
+            roll = rng.random()
+            if roll < simulate['failure_rate']:
+                outcome = 'FAILED'
+            elif roll < simulate['failure_rate'] + simulate['timeout_rate']:
+                outcome = 'TIMEOUT'
+            else:
+                outcome = 'COMPLETED'
+            job['sim'] = {{
+                'submit': now,
+                'wait': rng.expovariate(1.0 / simulate['queue_wait']) if simulate['queue_wait'] else 0,
+                'runtime': rng.lognormvariate(
+                    math.log(simulate['runtime']), simulate['runtime_sigma']) if simulate['runtime'] else 0,
+                'outcome': outcome
+            }}
+            job.setdefault('reason', 'Priority')
+        jobs[task_id] = job
+    state['submitted'].append([job_id, script])
+    print('Submitted batch job {{}}'.format(job_id))
+elif name == 'scancel':
+    x = sys.argv[1]
+    if x in jobs:
+        jobs[x].update(state='CANCELLED', reason='None', end=now)
+if simulate or name in ['sbatch', 'scancel']:
+    save()
+'''
+
+
+class FakeSlurm(object):
+    """
+    Parameters:
+        latency (float): seconds each command waits before answering,
+            standing in for slurmctld
+        nodes (int): how many nodes sinfo reports
+        simulate (dict): have submitted jobs run by themselves, with any of
+            the SIMULATION settings changed
+        root (str): the directory to install to, a new temporary one by default
+    """
+
+    def __init__(self, latency=0, nodes=2, simulate=None, root=None):
+        self.root = root if root else tempfile.mkdtemp()
+        self.bin = os.path.join(self.root, 'bin')
+        if not os.path.exists(self.bin):
+            os.makedirs(self.bin)
+        self._state = {'latency': latency, 'nodes': nodes, 'jobs': dict(),
+                       'next_id': 1000, 'submitted': list()}
+        if simulate is not None:
+            self._state['simulate'] = dict(SIMULATION, **simulate)
+        self._save()
+        script = _SCRIPT.format(python=sys.executable, root=self.root)
+        for command in COMMANDS:
+            path = os.path.join(self.bin, command)
+            with open(path, 'w') as fp:
+                fp.write(script)
+            os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+    def _load(self):
+        with open(os.path.join(self.root, 'jobs.json')) as fp:
+            return json.load(fp)
+
+    def _save(self):
+        with open(os.path.join(self.root, 'jobs.json'), 'w') as fp:
+            json.dump(self._state, fp)
+
+    def add_job(self, state='PENDING', queued=True):
+        """
+        Returns:
+            the id of a new job
+        """
+        self._state = self._load()
+        self._state['next_id'] += 1
+        self._state['jobs'][str(self._state['next_id'])] = {'state': state, 'queued': queued}
+        self._save()
+        return self._state['next_id']
+
+    def set_state(self, job_id, state, queued=None, reason=None):
+        """
+        Change the state of a job or array task, queued=False makes it leave
+        the queue so only sacct knows about it, reason is what squeue shows
+        as the reason a pending job is waiting, such as DependencyNeverSatisfied
+        """
+        self._state = self._load()
+        job = self._state['jobs'][str(job_id)]
+        job['state'] = state
+        if queued is not None:
+            job['queued'] = queued
+        if reason is not None:
+            job['reason'] = reason
+        self._save()
+
+    def set_simulation(self, **settings):
+        """
+        Change any of the SIMULATION settings, for the jobs submitted from now on
+        """
+        self._state = self._load()
+        self._state['simulate'].update(settings)
+        self._save()
+
+    def job(self, job_id):
+        """
+        Returns:
+            the state, queued flag, and for jobs submitted with one, the
+            dependency and reason of a job
+        """
+        return self._load()['jobs'][str(job_id)]
+
+    def jobs(self):
+        """
+        Returns:
+            every job and array task by id, as of the last command run
+        """
+        return self._load()['jobs']
+
+    def submitted(self):
+        """
+        Returns:
+            (job id, batch script) of every sbatch call so far
+        """
+        return [tuple(x) for x in self._load()['submitted']]
+
+    def calls(self):
+        """
+        Returns:
+            every command run so far, as lists of the command and its arguments
+        """
+        path = os.path.join(self.root, 'calls.log')
+        if not os.path.exists(path):
+            return list()
+        with open(path) as fp:
+            return [json.loads(x) for x in fp if x.strip()]
+
+    def reset_calls(self):
+        path = os.path.join(self.root, 'calls.log')
+        if os.path.exists(path):
+            os.remove(path)
+
+    @contextmanager
+    def on_path(self):
+        """
+        Put the fake commands first on the PATH
+        """
+        path = os.environ.get('PATH', '')
+        os.environ['PATH'] = self.bin + os.pathsep + path
+        try:
+            yield self
+        finally:
+            os.environ['PATH'] = path
+
+    def remove(self):
+        shutil.rmtree(self.root)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Install simulated slurm commands into a directory, then put its bin on the PATH')
+    parser.add_argument('root', help='the directory to install to')
+    parser.add_argument('--nodes', type=int, default=2)
+    parser.add_argument('--latency', type=float, default=0)
+    for key, value in sorted(SIMULATION.items()):
+        parser.add_argument('--' + key.replace('_', '-'), type=type(value), default=value)
+    args = parser.parse_args()
+    simulate = {x: getattr(args, x) for x in SIMULATION}
+    fake = FakeSlurm(latency=args.latency, nodes=args.nodes, simulate=simulate, root=args.root)
+    print 'export PATH={}:$PATH'.format(fake.bin)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""
+A paramiko SFTP server on loopback for the sftp transfer tests and benchmarks,
+serving files from a local directory to any username with the right password
+or key. The only commands it runs are md5sum, sha256sum and the other
+checksum commands named after a hashlib algorithm
+"""
+import os
+import shlex
+import socket
+import hashlib
+import threading
+import paramiko
+
+from time import sleep
+
+
+class _Server(paramiko.ServerInterface):
+
+    def __init__(self, password, authorized_key, root):
+        self.password = password
+        self.authorized_key = authorized_key
+        self.root = root
+
+    def check_auth_password(self, username, password):
+        if password == self.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_auth_publickey(self, username, key):
+        if self.authorized_key is not None and key == self.authorized_key:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return 'publickey,password'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        args = shlex.split(command)
+        if not args or not args[0].endswith('sum') or args[0][:-3] not in hashlib.algorithms:
+            return False
+        thread = threading.Thread(target=self._checksum, args=(channel, args[0][:-3], args[1:]))
+        thread.daemon = True
+        thread.start()
+        return True
+
+    def _checksum(self, channel, algorithm, paths):
+        status = 0
+        for path in paths:
+            try:
+                with open(os.path.join(self.root, path.lstrip('/')), 'rb') as fp:
+                    digest = hashlib.new(algorithm, fp.read()).hexdigest()
+            except (IOError, OSError):
+                status = 1
+                continue
+            channel.sendall('{}  {}\n'.format(digest, path))
+        channel.send_exit_status(status)
+        # closing could beat paramiko's reply to the exec request
+        channel.shutdown_write()
+
+
+class _Handle(paramiko.SFTPHandle):
+
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+
+class _SFTPServer(paramiko.SFTPServerInterface):
+    """
+    Read only access to the servers root directory. Each request waits
+    latency seconds first to stand in for the round trip to a remote site
+    """
+    root = None
+    latency = 0
+
+    def _path(self, path):
+        sleep(self.latency)
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def list_folder(self, path):
+        path = self._path(path)
+        try:
+            return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, x)), x)
+                    for x in os.listdir(path)]
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            fp = open(self._path(path), 'rb')
+        except (IOError, OSError) as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = _Handle(flags)
+        handle.filename = path
+        handle.readfile = fp
+        return handle
+
+
+class SFTPServer(object):
+    """
+    Serve root over sftp on a free loopback port until stop is called
+
+    Parameters:
+        root (str): the directory to serve
+        latency (float): seconds to wait before answering each open, stat or listdir
+        password (str): the password to accept
+        authorized_key (paramiko.PKey): a key to accept, default is none
+    """
+
+    def __init__(self, root, latency=0, password='test', authorized_key=None):
+        self.root = root
+        self.password = password
+        self.authorized_key = authorized_key
+        self.host_key = paramiko.RSAKey.generate(1024)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.server_class = type('SFTPServer', (_SFTPServer,), {'root': root, 'latency': latency})
+        self.transports = list()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._accept)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _accept(self):
+        while not self._stopped:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', paramiko.SFTPServer, self.server_class)
+            transport.start_server(server=_Server(self.password, self.authorized_key, self.root))
+            self.transports.append(transport)
+
+    def client(self):
+        """
+        Return a paramiko.SSHClient connected to the server
+        """
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect('127.0.0.1', port=self.port, username='test', password=self.password,
+                       look_for_keys=False, allow_agent=False)
+        return client
+
+    def stop(self):
+        self._stopped = True
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
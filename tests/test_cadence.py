@@ -0,0 +1,115 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.cadence import Cadence, get_frequency
+from lib.util import get_data_output_files
+from lib.util import print_message
+from lib.jobstatus import JobStatus
+from jobs.Regrid import Regrid
+
+
+class TestCadence(unittest.TestCase):
+
+    def test_cadence_slots(self):
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        self.assertEqual(Cadence('yearly').slots_per_year, 1)
+        self.assertEqual(Cadence('monthly').slots_per_year, 12)
+        self.assertEqual(Cadence('3monthly').slots_per_year, 4)
+        self.assertEqual(Cadence('daily').slots_per_year, 365)
+        self.assertEqual(Cadence('6hourly').slots_per_year, 365 * 4)
+        for frequency in ['weekly', '5monthly', '7hourly', '2yearly', '0daily']:
+            with self.assertRaises(ValueError):
+                Cadence(frequency)
+
+    def test_cadence_dates(self):
+        """
+        slots and dates round trip on the no-leap calendar
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        cadence = Cadence('6hourly')
+        slot = cadence.slot(month=3, day=1, seconds=21600)
+        self.assertEqual(slot, (31 + 28) * 4 + 1)
+        self.assertEqual(cadence.dates[slot], (3, 1, 21600))
+        self.assertEqual(cadence.date_string(12, slot), '0012-03-01-21600')
+        self.assertEqual(cadence.dates[-1], (12, 31, 64800))
+
+        cadence = Cadence('daily')
+        self.assertEqual(cadence.slot(month=12, day=31), 364)
+        self.assertEqual(cadence.date_string(1, 364), '0001-12-31')
+
+        cadence = Cadence('3monthly')
+        self.assertEqual([x[0] for x in cadence.dates], [1, 4, 7, 10])
+        self.assertEqual(cadence.slot(month=6), 1)
+        self.assertEqual(Cadence('yearly').date_string(5, 0), '0005')
+
+    def test_get_frequency(self):
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        self.assertEqual(get_frequency({'monthly': True}), 'monthly')
+        self.assertEqual(get_frequency({'monthly': 'True'}), 'monthly')
+        self.assertEqual(get_frequency({'monthly': True, 'frequency': 'daily'}), 'daily')
+        self.assertIsNone(get_frequency({'monthly': False}))
+        self.assertIsNone(get_frequency({}))
+
+    def test_get_data_output_files(self):
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        tempdir = tempfile.mkdtemp()
+        try:
+            case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+            names = ['{}.cam.h0.{:04d}-{:02d}.nc'.format(case, 1, x) for x in range(1, 13)]
+            names += ['{}.cam.h1.0001-01-{:02d}.nc'.format(case, x) for x in range(1, 3)]
+            names += ['other.cam.h0.0001-01.nc', '{}.cam.h0.0002-01.nc'.format(case)]
+            for name in names:
+                open(os.path.join(tempdir, name), 'w').close()
+
+            found = get_data_output_files(tempdir, case, 1, 1)
+            self.assertEqual(found, names[:12])
+            found = get_data_output_files(tempdir, case, 1, 1, frequency='daily')
+            self.assertEqual(found, names[12:14])
+            self.assertIsNone(get_data_output_files(os.path.join(tempdir, 'nope'), case, 1, 1))
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_regrid_frequency(self):
+        """
+        regrid jobs look for and register output at the frequency of the data they regrid
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        tempdir = tempfile.mkdtemp()
+        try:
+            case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+            config = {
+                'global': {'project_path': tempdir},
+                'post-processing': {'regrid': {'atm': {'destination_grid_name': 'fv129x256'}}},
+                'data_types': {'atm': {'frequency': '3monthly'}}
+            }
+            job = Regrid(1, 1, case, 'case', run_type='atm')
+            output_path = os.path.join(tempdir, 'output', 'pp', 'fv129x256', 'case', 'regrid', 'atm')
+            os.makedirs(output_path)
+            names = ['{}.cam.h0.0001-{:02d}.nc'.format(case, x) for x in [1, 4, 7, 10]]
+            for name in names[:3]:
+                open(os.path.join(output_path, name), 'w').close()
+            self.assertFalse(job.postvalidate(config))
+            open(os.path.join(output_path, names[3]), 'w').close()
+            self.assertTrue(job.postvalidate(config))
+
+            class _FileManager(object):
+                def add_files(self, data_type, file_list):
+                    self.added = (data_type, [x['name'] for x in file_list])
+            filemanager = _FileManager()
+            job.status = JobStatus.COMPLETED
+            job.handle_completion(filemanager, None, config)
+            self.assertEqual(filemanager.added, ('regrid', names))
+            self.assertEqual(config['data_types']['regrid'], {'frequency': '3monthly'})
+        finally:
+            shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.catalog_writer import CatalogWriter
+from lib.models import DataFile, database, setup_catalog
+from lib.rwlock import RWLock
+from lib.util import print_message
+
+
+def make_row(idx):
+    return {
+        'case': 'case', 'name': 'file{}'.format(idx), 'local_path': '/a/file{}'.format(idx),
+        'local_status': 1, 'remote_path': '', 'remote_status': 1, 'year': 1, 'month': 1,
+        'datatype': 'atm', 'local_size': 0, 'transfer_type': 'local', 'remote_uuid': '',
+        'remote_hostname': ''
+    }
+
+
+class TestCatalogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        database.init(os.path.join(self.tempdir, 'catalog.db'))
+        setup_catalog()
+        self.lock = RWLock()
+        self.writer = CatalogWriter(
+            mutex=self.lock,
+            database=database,
+            flush_interval=0.05)
+        self.writer.start()
+
+    def tearDown(self):
+        self.writer.stop()
+        database.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_catalog_writer_batches(self):
+        """
+        inserts and status updates queued together land in one commit,
+        and the last status queued for a row wins
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        commits = list()
+        self.writer.insert(DataFile, [make_row(x) for x in range(10)])
+        self.writer.insert(DataFile, [make_row(x) for x in range(10, 20)])
+        self.writer.submit(lambda: commits.append(DataFile.select().count()))
+        self.writer.update_status(DataFile, range(1, 6), 0)
+        self.writer.update_status(DataFile, [5], 2)
+        future = self.writer.submit(lambda: 'done', wait=True)
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(), 'done')
+        # the call sees the inserts queued before it
+        self.assertEqual(commits, [20])
+        statuses = [x.local_status for x in DataFile.select().order_by(DataFile.id)]
+        self.assertEqual(statuses[:6], [0, 0, 0, 0, 2, 1])
+
+    def test_catalog_writer_errors(self):
+        """
+        a failing call raises from its future without losing the rest of the batch
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+
+        def fail():
+            raise ValueError('bad write')
+
+        future = self.writer.submit(fail)
+        self.writer.insert(DataFile, [make_row(0)])
+        self.writer.flush()
+        with self.assertRaises(ValueError):
+            future.result()
+        self.assertEqual(DataFile.select().count(), 1)
+        self.assertFalse(self.lock.locked())
+
+    def test_catalog_writer_once(self):
+        """
+        a call queued with submit_once many times in a batch runs once, after
+        everything else in the batch
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        dirty = list()
+        saves = list()
+
+        def save():
+            saves.append(list(dirty))
+            del dirty[:]
+            return len(saves)
+
+        futures = list()
+        for idx in range(5):
+            self.writer.submit(dirty.append, (idx,))
+            futures.append(self.writer.submit_once(save))
+        self.writer.flush()
+        self.assertEqual(saves, [range(5)])
+        self.assertEqual([x.result() for x in futures], [1] * 5)
+        self.writer.submit_once(save, wait=True)
+        self.assertEqual(saves, [range(5), []])
+
+    def test_catalog_writer_restart(self):
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        self.writer.insert(DataFile, [make_row(0)])
+        self.writer.stop()
+        self.assertEqual(DataFile.select().count(), 1)
+        self.writer.start()
+        self.writer.insert(DataFile, [make_row(1)], wait=True)
+        self.assertEqual(DataFile.select().count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,345 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.filemanager import FileManager, FileStatus
+from lib.models import DataFile, SeriesStatus
+from lib.events import EventList
+from lib.util import print_message
+
+
+def make_config(project_path, start_year=1, end_year=2, resume=False, catalog_backend='table'):
+    """
+    Build a minimal config with one local case and one monthly data type
+    """
+    case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+    return {
+        'global': {
+            'project_path': project_path,
+            'resume': resume,
+            'catalog_backend': catalog_backend
+        },
+        'simulations': {
+            'start_year': start_year,
+            'end_year': end_year,
+            case: {
+                'transfer_type': 'local',
+                'local_path': os.path.join(project_path, 'input', case),
+                'short_name': 'piControl',
+                'native_grid_name': 'ne30',
+                'data_types': ['all']
+            }
+        },
+        'data_types': {
+            'atm': {
+                'remote_path': 'REMOTE_PATH/archive/atm/hist',
+                'file_format': 'CASEID.cam.h0.YEAR-MONTH.nc',
+                'local_path': 'PROJECT_PATH/input/CASEID/atm',
+                'monthly': True
+            }
+        }
+    }
+
+
+class TestFileManagerCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.project_path, 'output'))
+        self.database = os.path.join(self.project_path, 'output', 'processflow.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.project_path)
+
+    def test_filemanager_resume(self):
+        """
+        populate a catalog, mark some files present, then resume it with
+        an extra year and check the old statuses are kept
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=1)
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+        filemanager.populate_file_list()
+        self.assertEqual(DataFile.select().count(), 12)
+
+        datafile = DataFile.select().where(DataFile.month == 1).get()
+        with open(datafile.local_path, 'w') as fp:
+            fp.write('test')
+        filemanager.update_local_status()
+        self.assertEqual(
+            DataFile.get(DataFile.id == datafile.id).local_status,
+            FileStatus.PRESENT.value)
+
+        config = make_config(self.project_path, end_year=2, resume=True)
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+        filemanager.populate_file_list()
+        self.assertEqual(DataFile.select().count(), 24)
+        self.assertEqual(
+            DataFile.get(DataFile.local_path == datafile.local_path).local_status,
+            FileStatus.PRESENT.value)
+
+        # a file that was removed between runs is noticed on resume
+        os.remove(datafile.local_path)
+        filemanager.update_local_status()
+        self.assertEqual(
+            DataFile.get(DataFile.local_path == datafile.local_path).local_status,
+            FileStatus.NOT_PRESENT.value)
+
+        # shrinking the run drops the extra years
+        config = make_config(self.project_path, end_year=1, resume=True)
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+        filemanager.populate_file_list()
+        self.assertEqual(DataFile.select().count(), 12)
+
+    def test_filemanager_update_local_status(self):
+        """
+        write out half a year of files and check that a single update
+        marks exactly those as present, and that a second pass finds nothing new
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=2)
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+        filemanager.populate_file_list()
+        for datafile in DataFile.select().where((DataFile.year == 1) & (DataFile.month <= 6)):
+            with open(datafile.local_path, 'w') as fp:
+                fp.write('test')
+        self.assertTrue(filemanager.update_local_status())
+        present = (DataFile
+                   .select()
+                   .where(DataFile.local_status == FileStatus.PRESENT.value)
+                   .count())
+        self.assertEqual(present, 6)
+        self.assertFalse(filemanager.update_local_status())
+
+    def test_filemanager_render_file_string(self):
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+        config = make_config(self.project_path, start_year=5, end_year=9)
+        config['simulations'][case]['remote_path'] = '/remote/{case}'
+        config['data_types']['ocn_restart'] = {
+            'remote_path': 'REMOTE_PATH/archive/rest/REST_YR-01-01-00000/',
+            'file_format': 'mpaso.rst.REST_YR-01-01_00000.nc',
+            'local_path': 'PROJECT_PATH/input/CASEID/rest',
+        }
+        config['data_types']['lnd'] = {
+            'remote_path': 'REMOTE_PATH/archive/lnd/hist',
+            'file_format': 'CASEID.clm2.h0.YEAR-MONTH.nc',
+            'local_path': 'PROJECT_PATH/input/CASEID/lnd',
+            case: {
+                'local_path': 'LOCAL_PATH/lnd'
+            }
+        }
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+
+        self.assertEqual(
+            filemanager.render_file_string('atm', 'file_format', case, year=12, month=3),
+            '{}.cam.h0.0012-03.nc'.format(case))
+        self.assertEqual(
+            filemanager.render_file_string('atm', 'file_format', case),
+            '{}.cam.h0.YEAR-MONTH.nc'.format(case))
+        self.assertEqual(
+            filemanager.render_file_string('atm', 'remote_path', case, year=1, month=1),
+            '/remote/{case}/archive/atm/hist')
+        self.assertEqual(
+            filemanager.render_file_string('ocn_restart', 'remote_path', case),
+            '/remote/{case}/archive/rest/0006-01-01-00000/')
+        self.assertEqual(
+            filemanager.render_file_string('lnd', 'local_path', case),
+            os.path.join(self.project_path, 'input', case, 'lnd'))
+
+    def test_filemanager_data_ready_map(self):
+        """
+        with the first year present, only requirements inside that year are ready
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=3)
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+        filemanager.populate_file_list()
+        for datafile in DataFile.select().where(DataFile.year == 1):
+            with open(datafile.local_path, 'w') as fp:
+                fp.write('test')
+        filemanager.update_local_status()
+
+        case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+        requirements = [
+            (case, 'atm', 1, 1),
+            (case, 'atm', 1, 2),
+            (case, 'atm', 3, 3),
+            (case, 'atm', None, None),
+            (case, 'climo_regrid', 1, 1)]
+        ready = filemanager.data_ready_map(requirements)
+        self.assertTrue(ready[(case, 'atm', 1, 1)])
+        self.assertFalse(ready[(case, 'atm', 1, 2)])
+        self.assertFalse(ready[(case, 'atm', 3, 3)])
+        self.assertFalse(ready[(case, 'atm', None, None)])
+        # nothing in the catalog for this type, same as check_data_ready
+        self.assertTrue(ready[(case, 'climo_regrid', 1, 1)])
+        for requirement in requirements:
+            self.assertEqual(
+                ready[requirement],
+                filemanager.check_data_ready(
+                    data_required=[requirement[1]],
+                    case=case,
+                    start_year=requirement[2],
+                    end_year=requirement[3]))
+
+    def test_filemanager_series_backend(self):
+        """
+        with the series backend monthly types dont get any rows, but readiness,
+        paths and statuses behave the same and survive a resume
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+        config = make_config(self.project_path, end_year=3, catalog_backend='series')
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+        filemanager.populate_file_list()
+        self.assertEqual(DataFile.select().count(), 0)
+        self.assertEqual(SeriesStatus.select().count(), 1)
+        self.assertEqual(filemanager.report_files_local()[:5], '0/36 ')
+
+        local_path = os.path.join(self.project_path, 'input', case, 'atm')
+        for month in range(1, 13):
+            name = '{}.cam.h0.0001-{:02d}.nc'.format(case, month)
+            with open(os.path.join(local_path, name), 'w') as fp:
+                fp.write('test')
+        self.assertTrue(filemanager.update_local_status())
+        self.assertFalse(filemanager.update_local_status())
+
+        ready = filemanager.data_ready_map([(case, 'atm', 1, 1), (case, 'atm', 1, 2)])
+        self.assertTrue(ready[(case, 'atm', 1, 1)])
+        self.assertFalse(ready[(case, 'atm', 1, 2)])
+        self.assertTrue(filemanager.check_data_ready(['atm'], case, 1, 1))
+        self.assertFalse(filemanager.all_data_local())
+        paths = filemanager.get_file_paths_by_year('atm', case, 1, 2)
+        self.assertEqual(len(paths), 12)
+        self.assertEqual(paths[0], os.path.join(local_path, '{}.cam.h0.0001-01.nc'.format(case)))
+        self.assertIsNone(filemanager.get_file_paths_by_year('atm', case, 2, 3))
+
+        # the statuses are saved, resuming with an extra year keeps them
+        config = make_config(self.project_path, end_year=4, resume=True, catalog_backend='series')
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+        filemanager.populate_file_list()
+        self.assertTrue(filemanager.check_data_ready(['atm'], case, 1, 1))
+        self.assertEqual(filemanager.report_files_local()[:6], '12/48 ')
+
+        # switching back to the table backend rebuilds the rows
+        config = make_config(self.project_path, end_year=4, resume=True)
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+        filemanager.populate_file_list()
+        self.assertEqual(DataFile.select().count(), 48)
+        self.assertEqual(SeriesStatus.select().count(), 0)
+        filemanager.update_local_status()
+        self.assertTrue(filemanager.check_data_ready(['atm'], case, 1, 1))
+
+    def test_filemanager_daily_stream(self):
+        """
+        a 6-hourly stream is kept as a series even with the table backend,
+        and its files are matched by day and seconds
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+        config = make_config(self.project_path, end_year=2)
+        config['data_types']['atm_h2'] = {
+            'remote_path': 'REMOTE_PATH/archive/atm/hist',
+            'file_format': 'CASEID.cam.h2.YEAR-MONTH-DAY-SECONDS.nc',
+            'local_path': 'PROJECT_PATH/input/CASEID/atm_h2',
+            'frequency': '6hourly'
+        }
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+        filemanager.populate_file_list()
+        self.assertEqual(DataFile.select().count(), 24)
+        self.assertEqual(filemanager.report_files_local()[:7], '0/2944 ')
+
+        local_path = os.path.join(self.project_path, 'input', case, 'atm_h2')
+        for day in range(1, 32):
+            for seconds in [0, 21600, 43200, 64800]:
+                name = '{}.cam.h2.0001-01-{:02d}-{:05d}.nc'.format(case, day, seconds)
+                open(os.path.join(local_path, name), 'w').close()
+        self.assertTrue(filemanager.update_local_status())
+        paths = filemanager.get_file_paths_by_year('atm_h2', case, 1, 1)
+        self.assertEqual(len(paths), 124)
+        self.assertTrue(paths[-1].endswith('0001-01-31-64800.nc'))
+        self.assertFalse(filemanager.check_data_ready(['atm_h2'], case, 1, 1))
+        self.assertEqual(
+            filemanager.render_file_string('atm_h2', 'file_format', case, 1, 2, 3, 21600),
+            '{}.cam.h2.0001-02-03-21600.nc'.format(case))
+
+        progress = filemanager.progress()
+        self.assertEqual(progress[(case, 'atm_h2')], (124, 2796, 0, 2920))
+        self.assertEqual(progress[(case, 'atm')], (0, 24, 0, 24))
+
+    def test_filemanager_progress(self):
+        """
+        the progress summary and report agree, and an empty catalog reports
+        everything local instead of dividing by zero
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+        config = make_config(self.project_path, end_year=1)
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=self.database)
+        self.assertEqual(filemanager.progress(), {})
+        self.assertEqual(filemanager.report_files_local(), '0/0 files available locally or 100.00%')
+        self.assertTrue(filemanager.all_data_local())
+
+        filemanager.populate_file_list()
+        datafile = DataFile.select().where(DataFile.month == 1).get()
+        open(datafile.local_path, 'w').close()
+        filemanager.update_local_status()
+        self.assertEqual(filemanager.progress(), {(case, 'atm'): (1, 11, 0, 12)})
+        self.assertEqual(filemanager.report_files_local()[:5], '1/12 ')
+        self.assertFalse(filemanager.all_data_local())
+
+
+if __name__ == '__main__':
+    unittest.main()
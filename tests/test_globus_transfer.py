@@ -0,0 +1,161 @@
+import os
+import sys
+import copy
+import shutil
+import tempfile
+import threading
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from time import sleep, time
+from mock import patch
+
+from lib.globus_interface import submit_transfer, TaskMonitor
+from lib.filemanager import FileManager, FileStatus
+from lib.models import DataFile
+from lib.events import EventList
+from lib.util import print_message
+from fake_globus import FakeTransferClient
+from test_filemanager_catalog import make_config
+
+
+def wait_for(condition, timeout=10):
+    end = time() + timeout
+    while not condition():
+        if time() > end:
+            return False
+        sleep(0.01)
+    return True
+
+
+class TestGlobusTransfer(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        self.remote = os.path.join(self.project_path, 'remote')
+        self.local = os.path.join(self.project_path, 'local')
+        os.makedirs(self.remote)
+        os.makedirs(self.local)
+
+    def tearDown(self):
+        shutil.rmtree(self.project_path)
+
+    def make_files(self, count, missing=()):
+        file_list = list()
+        for idx in range(count):
+            name = 'file{}.nc'.format(idx)
+            if idx not in missing:
+                with open(os.path.join(self.remote, name), 'w') as fp:
+                    fp.write(name)
+            file_list.append({
+                'remote_path': '/remote/' + name,
+                'local_path': os.path.join(self.local, name)
+            })
+        return file_list
+
+    def test_globus_task_monitor(self):
+        """
+        files are reported as the task lists them, paging through the
+        successful transfers, and the missing one fails with the task
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        client = FakeTransferClient(self.project_path, files_per_poll=4, page_size=3)
+        file_list = self.make_files(12, missing=[5])
+        task_id = submit_transfer(client, 'remote_uuid', 'local_uuid', file_list)
+        self.assertIsNotNone(task_id)
+
+        reported = list()
+        monitor = TaskMonitor(min_interval=0.01, max_interval=0.05)
+        monitor.add(client, task_id, file_list, lambda x, y: reported.append((x['local_path'], y)))
+        self.assertTrue(wait_for(lambda: not monitor.active()))
+        monitor.stop()
+
+        results = dict(reported)
+        self.assertEqual(len(reported), 12)
+        self.assertFalse(results.pop(os.path.join(self.local, 'file5.nc')))
+        self.assertTrue(all(results.values()))
+        # the first files were reported before the task finished
+        self.assertEqual(reported[0], (os.path.join(self.local, 'file0.nc'), True))
+        self.assertTrue(os.path.exists(os.path.join(self.local, 'file11.nc')))
+
+    def test_globus_monitor_backoff(self):
+        """
+        a stalled task is polled less and less often, and the kill event cancels it
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        client = FakeTransferClient(self.project_path, files_per_poll=0)
+        file_list = self.make_files(3)
+        task_id = submit_transfer(client, 'remote_uuid', 'local_uuid', file_list)
+        event = threading.Event()
+        reported = list()
+        monitor = TaskMonitor(event=event, min_interval=0.01, max_interval=0.08)
+        monitor.add(client, task_id, file_list, lambda x, y: reported.append(y))
+        sleep(0.6)
+        polls = len([x for x in client.calls if x[0] == 'get_task'])
+        # without backing off it would have been polled about 60 times
+        self.assertLess(polls, 15)
+        self.assertGreater(polls, 3)
+
+        event.set()
+        self.assertTrue(wait_for(lambda: not monitor.active()))
+        monitor.stop()
+        self.assertIn(('cancel_task', task_id), client.calls)
+        self.assertEqual(reported, [False, False, False])
+
+    def test_filemanager_globus_transfer(self):
+        """
+        the missing files of two cases on the same endpoint go in one task
+        and are marked present as it reports them
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        os.makedirs(os.path.join(self.project_path, 'output'))
+        config = make_config(self.project_path, end_year=1)
+        case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+        config['simulations'][case].update({
+            'transfer_type': 'globus',
+            'remote_path': '/remote/{}'.format(case),
+            'remote_uuid': 'remote_uuid'
+        })
+        other = case.replace('piControl', 'historical')
+        config['simulations'][other] = copy.deepcopy(config['simulations'][case])
+        config['simulations'][other].update({
+            'remote_path': '/remote/{}'.format(other),
+            'local_path': os.path.join(self.project_path, 'input', other)
+        })
+        config['global']['local_globus_uuid'] = 'local_uuid'
+        # the remote files were only just written
+        config['global']['remote_settle'] = 0
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(self.project_path, 'output', 'processflow.db'))
+        filemanager._globus_monitor = TaskMonitor(
+            event=filemanager.kill_event, min_interval=0.01, max_interval=0.05)
+        filemanager.populate_file_list()
+        self.assertEqual(DataFile.select().count(), 24)
+        for datafile in DataFile.select():
+            remote_path = os.path.join(self.project_path, datafile.remote_path.lstrip('/'))
+            if not os.path.exists(os.path.dirname(remote_path)):
+                os.makedirs(os.path.dirname(remote_path))
+            with open(remote_path, 'w') as fp:
+                fp.write('test')
+
+        client = FakeTransferClient(self.project_path, files_per_poll=5)
+        with patch('lib.filemanager.get_client', return_value=client):
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+        self.assertEqual(len([x for x in client.calls if x[0] == 'submit_transfer']), 1)
+        self.assertTrue(wait_for(lambda: not filemanager._globus_monitor.active()))
+        filemanager._writer.flush()
+        self.assertEqual(filemanager.report_files_local()[:6], '24/24 ')
+        self.assertEqual(
+            set(x.local_status for x in DataFile.select()),
+            set([FileStatus.PRESENT.value]))
+        filemanager.terminate_transfers()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib import inotify
+from lib.filemanager import FileManager, FileStatus
+from lib.models import DataFile
+from lib.events import EventList
+from lib.util import print_message
+from test_filemanager_catalog import make_config
+
+
+@unittest.skipUnless(inotify.available(), 'inotify is not available')
+class TestInotify(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.project_path)
+
+    def test_inotify_watcher(self):
+        """
+        written and moved in files are reported, including in new subdirectories
+        of a recursive watch, and partially written files are not
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        arrived = list()
+        event = threading.Event()
+
+        def callback(paths):
+            arrived.extend(paths)
+            event.set()
+
+        watcher = inotify.InotifyWatcher(callback=callback, settle=0.01)
+        self.assertTrue(watcher.add_watch(self.project_path, recursive=True))
+        self.assertFalse(watcher.add_watch(os.path.join(self.project_path, 'missing')))
+        watcher.start()
+        try:
+            fp = open(os.path.join(self.project_path, 'partial.nc'), 'w')
+            with open(os.path.join(self.project_path, 'a.nc'), 'w') as out:
+                out.write('test')
+            self.assertTrue(event.wait(5))
+            self.assertEqual(arrived, [os.path.join(self.project_path, 'a.nc')])
+
+            event.clear()
+            del arrived[:]
+            subdir = os.path.join(self.project_path, 'sub')
+            os.makedirs(subdir)
+            # give the watcher a chance to see the new directory
+            while subdir not in watcher.watched():
+                pass
+            open(os.path.join(subdir, 'b.nc.part'), 'w').close()
+            os.rename(os.path.join(subdir, 'b.nc.part'), os.path.join(subdir, 'b.nc'))
+            self.assertTrue(event.wait(5))
+            self.assertIn(os.path.join(subdir, 'b.nc'), arrived)
+            fp.close()
+        finally:
+            watcher.stop()
+
+    def test_filemanager_watch(self):
+        """
+        a file written to a watched input directory is marked present without
+        calling update_local_status, and the wake event is set
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        os.makedirs(os.path.join(self.project_path, 'output'))
+        config = make_config(self.project_path, end_year=1)
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(self.project_path, 'output', 'processflow.db'))
+        filemanager.populate_file_list()
+        wake_event = threading.Event()
+        watched = filemanager.watch(wake_event)
+        if not watched:
+            self.skipTest('the test directory is on a filesystem that is polled')
+        try:
+            datafile = DataFile.select().where(DataFile.month == 3).get()
+            with open(datafile.local_path, 'w') as fp:
+                fp.write('test')
+            self.assertTrue(wake_event.wait(5))
+            self.assertEqual(
+                DataFile.get(DataFile.id == datafile.id).local_status,
+                FileStatus.PRESENT.value)
+            # the next full check reports the new file
+            self.assertTrue(filemanager.update_local_status())
+            self.assertFalse(filemanager.update_local_status())
+        finally:
+            filemanager.terminate_transfers()
+
+    def test_inotify_filesystem_type(self):
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        self.assertIsNotNone(inotify.filesystem_type(self.project_path))
+        self.assertIsNotNone(inotify.filesystem_type('/'))
+
+
+if __name__ == '__main__':
+    unittest.main()
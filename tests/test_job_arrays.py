@@ -0,0 +1,182 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from subprocess import Popen
+from mock import MagicMock
+
+from lib.slurm import Slurm
+from lib.job_array import JobArray
+from lib.runmanager import RunManager
+from lib.jobstatus import JobStatus
+from lib.events import EventList
+from lib.util import print_message
+from jobs.job import Job
+from fake_slurm import FakeSlurm
+
+
+class _ChunkJob(Job):
+    """
+    A job for one chunk of years that only echoes its years
+    """
+    array_capable = True
+
+    def __init__(self, *args, **kwargs):
+        super(_ChunkJob, self).__init__(*args, **kwargs)
+        self._job_type = 'climo'
+        self._slurm_args = {'num_cores': '-n 2'}
+        self.data_ready = True
+
+    def setup_data(self, *args, **kwargs):
+        pass
+
+    def postvalidate(self, *args, **kwargs):
+        return self.status == JobStatus.COMPLETED
+
+    def handle_completion(self, *args, **kwargs):
+        pass
+
+    def execute(self, config, dryrun=False):
+        self._dryrun = dryrun
+        return self._submit_cmd_to_slurm(config, ['echo', 'years', str(self.start_year), str(self.end_year)])
+
+
+class TestJobArrays(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.project_path, 'output', 'scripts'))
+        self.fake = FakeSlurm()
+
+    def tearDown(self):
+        self.fake.remove()
+        shutil.rmtree(self.project_path)
+
+    def make_runmanager(self, cases):
+        runmanager = RunManager.__new__(RunManager)
+        runmanager.executor = Slurm()
+        runmanager.event_list = EventList()
+        runmanager.filemanager = None
+        runmanager.config = {'global': {'project_path': self.project_path}}
+        runmanager.debug = False
+        runmanager.dryrun = False
+        runmanager.max_running_jobs = 100
+        runmanager.running_jobs = list()
+        runmanager._job_complete = 0
+        runmanager._job_total = sum(len(x) for x in cases.values())
+        runmanager.cases = [{'case': x, 'jobs': y} for x, y in sorted(cases.items())]
+        return runmanager
+
+    def test_array_submission(self):
+        """
+        the ready chunks of a case go in one array, each task runs its own job
+        and is tracked as its own job
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        chunks = [_ChunkJob(x, x + 4, 'case', 'piControl') for x in [1, 6, 11]]
+        other = _ChunkJob(1, 5, 'other', 'abrupt')
+        with self.fake.on_path():
+            runmanager = self.make_runmanager({'case': chunks, 'other': [other]})
+            runmanager.start_ready_jobs()
+            submitted = self.fake.submitted()
+            self.assertEqual(len(submitted), 2)
+            array_id, array_script = submitted[0]
+            self.assertEqual(submitted[1][1], os.path.join(
+                self.project_path, 'output', 'scripts', 'climo_0001_0005_abrupt'))
+            self.assertEqual(
+                [x['slurm_id'] for x in runmanager.running_jobs],
+                ['{}_{}'.format(array_id, x) for x in range(3)] + [int(submitted[1][0])])
+            self.assertEqual([x['job_id'] for x in runmanager.running_jobs], [x.id for x in chunks + [other]])
+            self.assertTrue(all(x.array is None for x in chunks + [other]))
+            with open(array_script) as fp:
+                script = fp.read()
+            self.assertIn('#SBATCH --array=0-2\n', script)
+            self.assertIn('#SBATCH -n 2\n', script)
+
+            # each task runs the script of its job and writes to that jobs output
+            env = dict(os.environ, SLURM_ARRAY_TASK_ID='1')
+            self.assertEqual(Popen(['bash', array_script], env=env).wait(), 0)
+            with open(chunks[1]._console_output_path) as fp:
+                self.assertEqual(fp.read(), 'years 6 10\n')
+
+            self.fake.set_state('{}_0'.format(array_id), 'COMPLETED', queued=False)
+            self.fake.set_state('{}_1'.format(array_id), 'RUNNING')
+            self.fake.set_state('{}_2'.format(array_id), 'FAILED')
+            self.fake.reset_calls()
+            runmanager.monitor_running_jobs()
+        self.assertEqual([x[0] for x in self.fake.calls()], ['squeue', 'sacct'])
+        self.assertEqual(
+            [x.status for x in chunks + [other]],
+            [JobStatus.COMPLETED, JobStatus.RUNNING, JobStatus.FAILED, JobStatus.PENDING])
+
+    def test_array_grouping(self):
+        """
+        arrays are split at max_size and by slurm arguments, and a job alone
+        in its group is submitted without an array
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        scripts_path = os.path.join(self.project_path, 'output', 'scripts')
+        array = JobArray(scripts_path, 'climo_piControl', max_size=2)
+        jobs = list()
+        for start in [1, 6, 11, 16]:
+            job = _ChunkJob(start, start + 4, 'case', 'piControl')
+            job._console_output_path = os.path.join(scripts_path, '{}.out'.format(start))
+            array.add(job, os.path.join(scripts_path, str(start)), ['-n 2', '-N 1'])
+            jobs.append(job)
+        array.add(jobs[0], os.path.join(scripts_path, 'big'), ['-n 16'])
+        slurm = MagicMock()
+        slurm.batch.side_effect = [10, 11, 12]
+        submitted = array.submit(slurm)
+        self.assertEqual(len(array), 0)
+        self.assertEqual(
+            [x[1] for x in submitted], ['10_0', '10_1', '11_0', '11_1', 12])
+        self.assertEqual(
+            [x[0][0] for x in slurm.batch.call_args_list],
+            [os.path.join(scripts_path, 'climo_piControl_0001_0010_array'),
+             os.path.join(scripts_path, 'climo_piControl_0011_0020_array'),
+             os.path.join(scripts_path, 'big')])
+        self.assertEqual(jobs[3]._job_id, '11_1')
+
+        # a group that fails to submit leaves out only its own jobs
+        for job in jobs:
+            job._job_id = 0
+            array.add(job, os.path.join(scripts_path, str(job.start_year)), ['-n 2', '-N 1'])
+        slurm.batch.side_effect = [20, Exception('sbatch: error: Batch job submission failed')]
+        submitted = array.submit(slurm)
+        self.assertEqual(submitted, [(jobs[0], '20_0'), (jobs[1], '20_1')])
+        self.assertEqual([x._job_id for x in jobs], ['20_0', '20_1', 0, 0])
+
+    def test_partial_submission(self):
+        """
+        when one of the arrays of a pass fails to submit, only its jobs are
+        submitted again, the ones slurm took stay tracked
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        chunks = [_ChunkJob(x, x + 4, 'case', 'piControl') for x in [1, 6, 11, 16]]
+        with self.fake.on_path():
+            runmanager = self.make_runmanager({'case': chunks})
+        runmanager.config['global']['max_array_size'] = 2
+        runmanager.executor = MagicMock()
+        runmanager.executor.batch.side_effect = [30, Exception('sbatch: error: Batch job submission failed')]
+        runmanager.start_ready_jobs()
+        self.assertEqual([x['slurm_id'] for x in runmanager.running_jobs], ['30_0', '30_1'])
+        self.assertEqual(
+            [x.status for x in chunks],
+            [JobStatus.PENDING, JobStatus.PENDING, JobStatus.VALID, JobStatus.VALID])
+
+        runmanager.executor.batch.side_effect = [31]
+        runmanager.start_ready_jobs()
+        self.assertEqual(runmanager.executor.batch.call_count, 3)
+        self.assertEqual(
+            [x['slurm_id'] for x in runmanager.running_jobs], ['30_0', '30_1', '31_0', '31_1'])
+        self.assertEqual([x._job_id for x in chunks], ['30_0', '30_1', '31_0', '31_1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
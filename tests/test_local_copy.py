@@ -0,0 +1,155 @@
+import os
+import sys
+import errno
+import shutil
+import tempfile
+import threading
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from time import time
+from mock import patch
+
+from lib.local_copy import copy_file, parallel_copy, list_directory, METHODS
+from lib.verify_config import verify_config
+from lib.filemanager import FileManager, FileStatus
+from lib.events import EventList
+from lib.util import print_message
+from test_filemanager_catalog import make_config
+
+CASE = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+
+
+class TestLocalCopy(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        self.archive = os.path.join(self.project_path, 'archive')
+        os.makedirs(self.archive)
+        os.makedirs(os.path.join(self.project_path, 'output'))
+
+    def tearDown(self):
+        shutil.rmtree(self.project_path)
+
+    def write_archive(self, name, contents='test', age=0):
+        path = os.path.join(self.archive, name)
+        with open(path, 'w') as fp:
+            fp.write(contents)
+        if age:
+            os.utime(path, (time() - age, time() - age))
+        return path
+
+    def test_copy_methods(self):
+        """
+        files are hardlinked where they can be, and a method that fails between
+        two filesystems is skipped for the files after it
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        source = self.write_archive('a.nc', 'a' * 5000, age=600)
+        local = os.path.join(self.project_path, 'input', 'atm')
+        destination = os.path.join(local, 'a.nc')
+        self.assertEqual(copy_file(source, destination), 'hardlink')
+        self.assertEqual(os.stat(source).st_ino, os.stat(destination).st_ino)
+
+        # the data is copied, not shared, and the timestamps go along with it
+        for method in ['copy', 'sendfile', 'copy_file_range']:
+            os.remove(destination)
+            self.assertEqual(copy_file(source, destination, methods=[method]), method)
+            self.assertNotEqual(os.stat(source).st_ino, os.stat(destination).st_ino)
+            with open(destination) as fp:
+                self.assertEqual(fp.read(), 'a' * 5000)
+            self.assertEqual(int(os.path.getmtime(destination)), int(os.path.getmtime(source)))
+            self.assertFalse(os.path.exists(destination + '.part'))
+
+        file_list = list()
+        for idx in range(10):
+            name = 'file{}.nc'.format(idx)
+            self.write_archive(name, name * 100)
+            file_list.append({
+                'remote_path': os.path.join(self.archive, name),
+                'local_path': os.path.join(local, name)
+            })
+        file_list.append({
+            'remote_path': os.path.join(self.archive, 'missing.nc'),
+            'local_path': os.path.join(local, 'missing.nc')
+        })
+        cross_device = OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        results = list()
+        with patch('lib.local_copy.os.link', side_effect=cross_device) as link:
+            succeeded, failed, counts = parallel_copy(
+                file_list, threads=4, methods=['hardlink', 'copy'],
+                callback=lambda x, y: results.append(y))
+        self.assertEqual(link.call_count, 1)
+        self.assertEqual(counts, {'copy': 10})
+        self.assertEqual(len(succeeded), 10)
+        self.assertEqual([x['remote_path'] for x in failed], [os.path.join(self.archive, 'missing.nc')])
+        self.assertEqual(sorted(results), [False] + [True] * 10)
+        with open(os.path.join(local, 'file3.nc')) as fp:
+            self.assertEqual(fp.read(), 'file3.nc' * 100)
+
+        # once the event is set nothing else is started
+        event = threading.Event()
+        event.set()
+        succeeded, failed, counts = parallel_copy(file_list, event=event)
+        self.assertEqual((len(succeeded), len(failed), counts), (0, 11, {}))
+
+        listing = list_directory(self.archive)
+        self.assertEqual(listing['a.nc'][0], 5000)
+        self.assertEqual(list_directory(os.path.join(self.archive, 'missing')), dict())
+
+    def test_local_copy_transfer(self):
+        """
+        a local_copy case is inventoried and staged from the archive into the project
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=2, catalog_backend='series')
+        config['simulations'][CASE].update({
+            'transfer_type': 'local_copy',
+            'remote_path': self.archive
+        })
+        config['data_types']['atm']['local_copy_methods'] = 'copy'
+        config['global']['local_copy_threads'] = 4
+        self.assertEqual(verify_config(config), [])
+        config['data_types']['atm']['local_copy_methods'] = ['hardlink', 'copy']
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(self.project_path, 'output', 'processflow.db'))
+        filemanager.populate_file_list()
+        series = filemanager._series[(CASE, 'atm')]
+        for offset in range(12):
+            path = series.file(offset).remote_path
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as fp:
+                fp.write('test')
+            os.utime(path, (time() - 600, time() - 600))
+
+        messages = list()
+        with patch('lib.filemanager.print_line', side_effect=lambda x, y: messages.append(x)):
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            for thread in filemanager.thread_list:
+                thread.join()
+        filemanager._writer.flush()
+
+        self.assertEqual(
+            series.local_status,
+            bytearray([FileStatus.PRESENT.value] * 12 + [FileStatus.NOT_PRESENT.value] * 12))
+        first = series.file(0)
+        self.assertEqual(
+            os.stat(first.local_path).st_ino,
+            os.stat(first.remote_path).st_ino)
+        self.assertIn('Local copy complete for 12 files, 12 by hardlink', messages)
+        filemanager.terminate_transfers()
+
+        config['data_types']['atm']['local_copy_methods'] = ['hardlink', 'rsync']
+        self.assertEqual(len(verify_config(config)), 1)
+        self.assertEqual(len(METHODS), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
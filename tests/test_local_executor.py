@@ -0,0 +1,170 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from time import sleep, time
+
+from lib.local_executor import LocalExecutor
+from lib.runmanager import RunManager
+from lib.jobstatus import JobStatus
+from lib.events import EventList
+from lib.util import print_message
+from jobs.job import Job
+
+
+class _Climo(Job):
+    """
+    A climo job that writes its years to a file
+    """
+    array_capable = True
+
+    def __init__(self, *args, **kwargs):
+        super(_Climo, self).__init__(*args, **kwargs)
+        self._job_type = 'climo'
+        self._slurm_args = {'num_cores': '-n 2'}
+        self.data_ready = True
+
+    def setup_data(self, *args, **kwargs):
+        pass
+
+    def postvalidate(self, *args, **kwargs):
+        return self.status == JobStatus.COMPLETED
+
+    def handle_completion(self, *args, **kwargs):
+        pass
+
+    def execute(self, config, dryrun=False):
+        self._dryrun = dryrun
+        return self._submit_cmd_to_slurm(config, ['echo', str(self.start_year), str(self.end_year)])
+
+
+class TestLocalExecutor(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def write_script(self, name, lines, args=None):
+        path = os.path.join(self.path, name)
+        with open(path, 'w') as fp:
+            fp.write('#!/bin/bash\n')
+            for arg in args or list():
+                fp.write('#SBATCH {}\n'.format(arg))
+            fp.write('\n'.join(lines) + '\n')
+        return path
+
+    def wait_for(self, executor, job_id, states, timeout=10):
+        start = time()
+        while time() - start < timeout:
+            info = executor.showjobs([job_id])[str(job_id)]
+            if info['JobState'] in states:
+                return info
+            sleep(0.02)
+        self.fail('job {} never reached {}'.format(job_id, states))
+
+    def test_core_slots(self):
+        """
+        jobs only start when there are enough free cores for them, and smaller
+        jobs use the cores a larger one is waiting for
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        executor = LocalExecutor(cores=5)
+        ids = list()
+        for name in ['a', 'b', 'c']:
+            flag = os.path.join(self.path, name + '.flag')
+            script = self.write_script(name, [
+                'while [ ! -e {} ]; do sleep 0.02; done'.format(flag),
+                'echo {} $SLURM_NTASKS'.format(name)],
+                args=['-n 2', '-o {}'.format(os.path.join(self.path, name + '.out'))])
+            ids.append(executor.batch(script))
+        small = executor.batch(self.write_script('small', ['true'], args=['-n 1']))
+        self.wait_for(executor, ids[0], ['RUNNING'])
+        self.wait_for(executor, ids[1], ['RUNNING'])
+        self.wait_for(executor, small, ['COMPLETED'])
+        self.assertEqual(
+            executor.showjobs([ids[2]])[str(ids[2])]['Reason'], 'Resources')
+        self.assertEqual(
+            [(x['JOBID'], x['STATE']) for x in executor.queue()],
+            [(str(ids[0]), 'R'), (str(ids[1]), 'R'), (str(ids[2]), 'PD')])
+
+        open(os.path.join(self.path, 'a.flag'), 'w').close()
+        self.wait_for(executor, ids[0], ['COMPLETED'])
+        self.wait_for(executor, ids[2], ['RUNNING'])
+        with open(os.path.join(self.path, 'a.out')) as fp:
+            self.assertEqual(fp.read(), 'a 2\n')
+
+        self.assertTrue(executor.cancel(ids[1]))
+        self.assertTrue(executor.cancel(ids[2]))
+        self.assertEqual(
+            [x['JobState'] for _, x in sorted(executor.showjobs(ids + [99]).items())],
+            ['COMPLETED', 'CANCELLED', 'CANCELLED'])
+
+    def test_arrays_and_dependencies(self):
+        """
+        array tasks run with their own task id, and afterok dependencies hold
+        a job until they complete or leave it waiting forever if they dont
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        executor = LocalExecutor(cores=2)
+        array_id = executor.batch(self.write_script(
+            'array', ['echo $SLURM_ARRAY_TASK_ID'],
+            args=['--array=0-2', '-o {}'.format(os.path.join(self.path, 'array_%a.out'))]))
+        tasks = ['{}_{}'.format(array_id, x) for x in range(3)]
+        after = executor.batch(self.write_script(
+            'after', ['true'], args=['--dependency=afterok:{}'.format(':'.join(tasks))]))
+        failing = executor.batch(self.write_script('failing', ['exit 1']))
+        never = executor.batch(self.write_script(
+            'never', ['true'], args=['--dependency=afterok:{}'.format(failing)]))
+
+        self.wait_for(executor, after, ['COMPLETED'])
+        for task in range(3):
+            with open(os.path.join(self.path, 'array_{}.out'.format(task))) as fp:
+                self.assertEqual(fp.read(), '{}\n'.format(task))
+        self.wait_for(executor, failing, ['FAILED'])
+        info = executor.showjobs([never])[str(never)]
+        self.assertEqual((info['JobState'], info['Reason']), ('PENDING', 'DependencyNeverSatisfied'))
+        with self.assertRaises(Exception):
+            executor.batch(self.write_script('bad', ['true'], args=['--dependency=afterok:99']))
+
+    def test_runmanager(self):
+        """
+        the run manager runs its jobs to completion without slurm
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        os.makedirs(os.path.join(self.path, 'output', 'scripts'))
+        runmanager = RunManager.__new__(RunManager)
+        runmanager.executor = LocalExecutor(cores=4)
+        runmanager.event_list = EventList()
+        runmanager.filemanager = None
+        runmanager.config = {'global': {'project_path': self.path}}
+        runmanager.debug = False
+        runmanager.dryrun = False
+        runmanager.max_running_jobs = runmanager.executor.max_running_jobs()
+        runmanager.running_jobs = list()
+        runmanager._job_complete = 0
+        jobs = [_Climo(x, x + 4, 'case', 'piControl') for x in [1, 6, 11]]
+        runmanager._job_total = len(jobs)
+        runmanager.cases = [{'case': 'case', 'jobs': jobs}]
+
+        self.assertFalse(runmanager.check_max_running_jobs())
+        start = time()
+        while runmanager.is_all_done() == -1 and time() - start < 10:
+            runmanager.start_ready_jobs()
+            runmanager.monitor_running_jobs()
+            sleep(0.05)
+        self.assertEqual(runmanager.is_all_done(), 1)
+        self.assertEqual(runmanager._job_complete, 3)
+        with open(jobs[1]._console_output_path) as fp:
+            self.assertEqual(fp.read(), '6 10\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
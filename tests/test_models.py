@@ -0,0 +1,107 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.models import DataFile, DataDirectory, SeriesStatus, database
+from lib.models import setup_catalog, get_schema_version, set_schema_version, SCHEMA_VERSION
+from lib.util import print_message
+
+
+class TestModels(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        database.init(os.path.join(self.tempdir, 'catalog.db'))
+
+    def tearDown(self):
+        database.close()
+        shutil.rmtree(self.tempdir)
+
+    def test_setup_new_catalog(self):
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        setup_catalog()
+        self.assertTrue(DataFile.table_exists())
+        self.assertTrue(DataDirectory.table_exists())
+        self.assertEqual(get_schema_version(), SCHEMA_VERSION)
+        self.assertEqual(
+            len(database.get_indexes('datafile')),
+            len(DataFile._meta.indexes))
+
+    def test_migrate_unversioned_catalog(self):
+        """
+        a catalog from before versioning has no indexes, migrating it should
+        add them and keep the existing rows
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        database.create_table(DataFile)
+        DataFile.create(
+            case='case', name='name', local_path='/a/name', local_status=0,
+            remote_path='', remote_status=1, year=1, month=1, datatype='atm',
+            local_size=0, transfer_type='local', remote_uuid='', remote_hostname='')
+        self.assertEqual(len(database.get_indexes('datafile')), 0)
+        self.assertEqual(get_schema_version(), 1)
+
+        setup_catalog()
+        self.assertEqual(get_schema_version(), SCHEMA_VERSION)
+        self.assertEqual(
+            len(database.get_indexes('datafile')),
+            len(DataFile._meta.indexes))
+        self.assertTrue(DataDirectory.table_exists())
+        self.assertTrue(SeriesStatus.table_exists())
+        self.assertEqual(DataFile.select().count(), 1)
+
+    def test_migrate_series_frequency(self):
+        """
+        series saved before frequencies were recorded are monthly
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        for model in [DataFile, DataDirectory]:
+            database.create_table(model)
+        database.execute_sql(
+            'CREATE TABLE "seriesstatus" ("id" INTEGER NOT NULL PRIMARY KEY, '
+            '"case" VARCHAR(255) NOT NULL, "datatype" VARCHAR(255) NOT NULL, '
+            '"start_year" INTEGER NOT NULL, "local_status" BLOB NOT NULL)')
+        database.execute_sql(
+            'INSERT INTO "seriesstatus" ("case", "datatype", "start_year", "local_status") '
+            'VALUES (?, ?, ?, ?)', ('case', 'atm', 1, buffer('\x01' * 12)))
+        set_schema_version(3)
+
+        setup_catalog()
+        self.assertEqual(get_schema_version(), SCHEMA_VERSION)
+        self.assertEqual(SeriesStatus.get().frequency, 'monthly')
+
+    def test_migrate_remote_size(self):
+        """
+        files catalogued before the remote inventory have no remote size
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        for model in [DataDirectory, SeriesStatus]:
+            database.create_table(model)
+        database.execute_sql(
+            'CREATE TABLE "datafile" ("id" INTEGER NOT NULL PRIMARY KEY, '
+            '"case" VARCHAR(255) NOT NULL, "name" VARCHAR(255) NOT NULL, '
+            '"local_path" VARCHAR(255) NOT NULL, "local_status" INTEGER NOT NULL, '
+            '"remote_path" VARCHAR(255) NOT NULL, "remote_status" INTEGER NOT NULL, '
+            '"year" INTEGER NOT NULL, "month" INTEGER NOT NULL, "datatype" VARCHAR(255) NOT NULL, '
+            '"local_size" INTEGER NOT NULL, "transfer_type" VARCHAR(255) NOT NULL, '
+            '"remote_uuid" VARCHAR(255) NOT NULL, "remote_hostname" VARCHAR(255) NOT NULL)')
+        database.execute_sql(
+            'INSERT INTO "datafile" ("case", "name", "local_path", "local_status", "remote_path", '
+            '"remote_status", "year", "month", "datatype", "local_size", "transfer_type", '
+            '"remote_uuid", "remote_hostname") VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            ('case', 'name', '/a/name', 0, '', 1, 1, 1, 'atm', 0, 'local', '', ''))
+        set_schema_version(4)
+
+        setup_catalog()
+        self.assertEqual(get_schema_version(), SCHEMA_VERSION)
+        self.assertIsNone(DataFile.get().remote_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
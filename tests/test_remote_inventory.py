@@ -0,0 +1,137 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import inspect
+
+from time import time
+from mock import patch
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.globus_interface import list_directory, TaskMonitor
+from lib.filemanager import FileManager, FileStatus
+from lib.models import DataFile
+from lib.events import EventList
+from lib.util import print_message
+from fake_globus import FakeTransferClient
+from sftp_server import SFTPServer
+from test_filemanager_catalog import make_config
+
+CASE = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+
+
+class TestRemoteInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.project_path, 'output'))
+
+    def tearDown(self):
+        shutil.rmtree(self.project_path)
+
+    def make_filemanager(self, config):
+        return FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(self.project_path, 'output', 'processflow.db'))
+
+    def write_remote(self, remote_path, contents='test', age=0):
+        path = os.path.join(self.project_path, remote_path.lstrip('/'))
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fp:
+            fp.write(contents)
+        if age:
+            os.utime(path, (time() - age, time() - age))
+
+    def test_globus_inventory(self):
+        """
+        one listing finds which files exist and which are still being written,
+        only complete files are requested, and listings are reused until they expire
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=1)
+        config['simulations'][CASE].update({
+            'transfer_type': 'globus',
+            'remote_path': '/remote/{}'.format(CASE),
+            'remote_uuid': 'remote_uuid'
+        })
+        config['global']['local_globus_uuid'] = 'local_uuid'
+        filemanager = self.make_filemanager(config)
+        filemanager._globus_monitor = TaskMonitor(
+            event=filemanager.kill_event, min_interval=0.01, max_interval=0.05)
+        filemanager.populate_file_list()
+        for datafile in DataFile.select():
+            if datafile.month < 11:
+                self.write_remote(datafile.remote_path, 'a' * datafile.month, age=600)
+            elif datafile.month == 12:
+                # still being written
+                self.write_remote(datafile.remote_path)
+
+        client = FakeTransferClient(self.project_path, files_per_poll=0)
+        with patch('lib.filemanager.get_client', return_value=client):
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            filemanager._writer.flush()
+            self.assertEqual(len([x for x in client.calls if x[0] == 'operation_ls']), 1)
+            remote = {x.month: (x.remote_status, x.remote_size) for x in DataFile.select()}
+            self.assertEqual(remote.pop(11), (FileStatus.NOT_PRESENT.value, None))
+            self.assertEqual(remote.pop(12), (FileStatus.IN_TRANSIT.value, 4))
+            self.assertEqual(remote, {x: (FileStatus.PRESENT.value, x) for x in range(1, 11)})
+            task = client.tasks.values()[0]
+            self.assertEqual(len(task['items']), 10)
+
+            # the listing is fresh
+            self.assertEqual(filemanager.update_remote_status(), 0)
+            # once its size stops changing the file is complete
+            self.assertEqual(filemanager.update_remote_status(force=True), 1)
+            self.assertEqual(DataFile.get(DataFile.month == 12).remote_status, FileStatus.PRESENT.value)
+            self.assertEqual(DataFile.get(DataFile.month == 11).remote_status, FileStatus.NOT_PRESENT.value)
+
+            # a directory that doesnt exist yet is listed once, without retries
+            start = time()
+            self.assertEqual(list_directory(client, 'remote_uuid', '/remote/missing'), dict())
+            self.assertLess(time() - start, 0.5)
+        filemanager.terminate_transfers()
+
+    def test_sftp_series_inventory(self):
+        """
+        series files are inventoried over the pooled sftp connection
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        server = SFTPServer(self.project_path)
+        try:
+            config = make_config(self.project_path, end_year=2, catalog_backend='series')
+            config['simulations'][CASE].update({
+                'transfer_type': 'sftp',
+                'remote_path': '/remote',
+                'remote_hostname': '127.0.0.1:{}'.format(server.port)
+            })
+            config['global']['remote_settle'] = 30
+            filemanager = self.make_filemanager(config)
+            filemanager.populate_file_list()
+            series = filemanager._series[(CASE, 'atm')]
+            for offset in range(12):
+                self.write_remote(series.file(offset).remote_path, age=60)
+            self.write_remote(series.file(12).remote_path)
+
+            with patch('lib.ssh_interface.getpass', return_value='test'):
+                self.assertEqual(filemanager.update_remote_status(), 1)
+            filemanager._writer.flush()
+            self.assertEqual(
+                series.remote_status,
+                bytearray([FileStatus.PRESENT.value] * 12 + [FileStatus.IN_TRANSIT.value] +
+                          [FileStatus.NOT_PRESENT.value] * 11))
+            self.assertEqual(series.remote_size[0], 4)
+            self.assertNotIn(13, series.remote_size)
+            filemanager.terminate_transfers()
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.rwlock import RWLock
+from lib.util import print_message
+
+
+class TestRWLock(unittest.TestCase):
+
+    def test_rwlock_shared_readers(self):
+        """
+        two readers hold the lock at the same time
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        lock = RWLock()
+        both_in = threading.Event()
+        inside = list()
+
+        def reader():
+            lock.acquire_read()
+            try:
+                inside.append(1)
+                if len(inside) == 2:
+                    both_in.set()
+                both_in.wait(5)
+            finally:
+                lock.release_read()
+
+        threads = [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(both_in.is_set())
+
+    def test_rwlock_exclusive_writer(self):
+        """
+        a writer waits for readers to leave, and readers arriving after a
+        waiting writer go after it
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        lock = RWLock()
+        order = list()
+        lock.acquire_read()
+
+        def writer():
+            lock.acquire()
+            order.append('writer')
+            lock.release()
+
+        def reader():
+            lock.acquire_read()
+            order.append('reader')
+            lock.release_read()
+
+        write_thread = threading.Thread(target=writer)
+        write_thread.start()
+        while not lock._writers_waiting:
+            pass
+        read_thread = threading.Thread(target=reader)
+        read_thread.start()
+        self.assertEqual(order, [])
+        lock.release_read()
+        write_thread.join()
+        read_thread.join()
+        self.assertEqual(order, ['writer', 'reader'])
+        self.assertFalse(lock.locked())
+
+    def test_rwlock_lock_api(self):
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        lock = RWLock()
+        lock.acquire()
+        self.assertTrue(lock.locked())
+        lock.release()
+        self.assertFalse(lock.locked())
+        with self.assertRaises(RuntimeError):
+            lock.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import sys
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.series import DataSeries
+from lib.filemanager import FileStatus
+from lib.util import print_message
+
+
+def make_series(start_year=1, end_year=3):
+    return DataSeries(
+        case='case',
+        datatype='atm',
+        start_year=start_year,
+        end_year=end_year,
+        name_format='case.cam.h0.{year}-{month}.nc',
+        remote_format='/remote/case/archive/atm/hist',
+        local_path='/local/case/atm',
+        status=FileStatus.NOT_PRESENT.value,
+        transfer_type='globus')
+
+
+class TestDataSeries(unittest.TestCase):
+
+    def test_series_render(self):
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        series = make_series()
+        self.assertEqual(len(series), 36)
+        offset = series.offset(2, 3)
+        self.assertEqual(offset, 14)
+        self.assertEqual(series.date(offset), (2, 3, 1, 0))
+        datafile = series.file(offset)
+        self.assertEqual(datafile.name, 'case.cam.h0.0002-03.nc')
+        self.assertEqual(datafile.local_path, '/local/case/atm/case.cam.h0.0002-03.nc')
+        self.assertEqual(datafile.remote_path, '/remote/case/archive/atm/hist/case.cam.h0.0002-03.nc')
+        self.assertEqual(datafile.local_status, FileStatus.NOT_PRESENT.value)
+
+    def test_series_ranges(self):
+        """
+        with all of year 2 present, only ranges inside year 2 are complete
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        series = make_series()
+        series.set_status(range(12, 24), FileStatus.PRESENT.value)
+        self.assertTrue(series.all(FileStatus.PRESENT.value, 2, 2))
+        self.assertFalse(series.all(FileStatus.PRESENT.value, 1, 2))
+        self.assertFalse(series.all(FileStatus.PRESENT.value))
+        self.assertEqual(series.count(FileStatus.PRESENT.value), 12)
+        self.assertEqual(series.count(FileStatus.PRESENT.value, 2, 3), 12)
+        self.assertEqual(series.find(FileStatus.PRESENT.value, 1, 2), range(12, 24))
+        self.assertEqual(series.find(FileStatus.PRESENT.value, 3, 3), [])
+        # years outside the series are clipped
+        self.assertEqual(series.span(0, 10), (0, 36))
+        self.assertEqual(series.span(5, 6), (36, 36))
+
+    def test_series_restore(self):
+        """
+        statuses saved from an earlier run line up by year with the new series
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        old = make_series(start_year=1, end_year=2)
+        old.set_status(range(12, 24), FileStatus.PRESENT.value)
+        series = make_series(start_year=2, end_year=4)
+        series.restore(old.start_year, old.local_status)
+        self.assertEqual(series.find(FileStatus.PRESENT.value), range(0, 12))
+        self.assertEqual(len(series), 36)
+
+        series = make_series(start_year=1, end_year=1)
+        series.restore(old.start_year, old.local_status)
+        self.assertEqual(series.count(FileStatus.PRESENT.value), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+import os
+import sys
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from mock import patch
+
+import paramiko
+
+from lib.ssh_interface import parallel_transfer, download, SSHConnectionPool
+from lib.filemanager import FileManager, FileStatus
+from lib.models import DataFile
+from lib.events import EventList
+from lib.util import print_message
+from sftp_server import SFTPServer
+from test_filemanager_catalog import make_config
+
+
+class TestSFTPTransfer(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        self.remote = os.path.join(self.project_path, 'remote')
+        os.makedirs(self.remote)
+        self.server = SFTPServer(self.project_path)
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.project_path)
+
+    def test_parallel_transfer(self):
+        """
+        files are spread over the channels, and a missing remote file fails
+        without stopping the others or leaving a local file behind
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        local = os.path.join(self.project_path, 'local')
+        os.makedirs(local)
+        file_list = list()
+        for idx in range(20):
+            name = 'file{}.nc'.format(idx)
+            if idx != 7:
+                with open(os.path.join(self.remote, name), 'w') as fp:
+                    fp.write(name * 100)
+            file_list.append({
+                'remote_path': '/remote/' + name,
+                'local_path': os.path.join(local, name)
+            })
+        channels = set()
+
+        def callback(file, success):
+            channels.add(threading.current_thread().name)
+
+        client = self.server.client()
+        try:
+            succeeded, failed = parallel_transfer(client, file_list, channels=4, callback=callback)
+        finally:
+            client.close()
+        self.assertEqual(len(succeeded), 19)
+        self.assertEqual([x['remote_path'] for x in failed], ['/remote/file7.nc'])
+        self.assertFalse(os.path.exists(os.path.join(local, 'file7.nc')))
+        with open(os.path.join(local, 'file3.nc')) as fp:
+            self.assertEqual(fp.read(), 'file3.nc' * 100)
+        self.assertEqual(len(channels), 4)
+
+        # once the event is set nothing else is started
+        event = threading.Event()
+        event.set()
+        client = self.server.client()
+        try:
+            succeeded, failed = parallel_transfer(client, file_list, channels=4, event=event)
+        finally:
+            client.close()
+        self.assertEqual((len(succeeded), len(failed)), (0, 20))
+
+    def test_sftp_download_resume(self):
+        """
+        a download continues from its .part file, and only shows up under
+        its real name once it is complete
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        payload = os.urandom(300000)
+        with open(os.path.join(self.remote, 'ocn.nc'), 'wb') as fp:
+            fp.write(payload)
+        local_path = os.path.join(self.project_path, 'ocn.nc')
+        with open(local_path + '.part', 'wb') as fp:
+            fp.write(payload[:100000])
+
+        client = self.server.client()
+        try:
+            sftp_client = client.open_sftp()
+            # a window smaller than one request still makes progress
+            received = download(sftp_client, '/remote/ocn.nc', local_path, window=1000)
+            self.assertEqual(received, 200000)
+            with open(local_path, 'rb') as fp:
+                self.assertEqual(fp.read(), payload)
+            self.assertFalse(os.path.exists(local_path + '.part'))
+
+            # a .part longer than the remote file is from an older version of it
+            os.remove(local_path)
+            with open(local_path + '.part', 'wb') as fp:
+                fp.write(payload + 'stale')
+            received = download(sftp_client, '/remote/ocn.nc', local_path, window=65536)
+            self.assertEqual(received, 300000)
+            with open(local_path, 'rb') as fp:
+                self.assertEqual(fp.read(), payload)
+
+            os.remove(local_path)
+            with self.assertRaises(IOError):
+                download(sftp_client, '/remote/missing.nc', local_path)
+            self.assertFalse(os.path.exists(local_path))
+            sftp_client.close()
+        finally:
+            client.close()
+
+    def test_ssh_connection_pool(self):
+        """
+        keys are tried before asking for a password, a password is only asked
+        for once, and lost connections are reopened
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        key = paramiko.RSAKey.generate(1024)
+        key_path = os.path.join(self.project_path, 'id_rsa')
+        key.write_private_key_file(key_path)
+        key_server = SFTPServer(self.project_path, authorized_key=key)
+        try:
+            hostname = '127.0.0.1:{}'.format(key_server.port)
+            pool = SSHConnectionPool(key_filename=key_path)
+            with patch('lib.ssh_interface.getpass', side_effect=AssertionError('asked for a password')):
+                client = pool.get(hostname)
+                self.assertIs(pool.get(hostname), client)
+                client.get_transport().close()
+                self.assertTrue(pool.get(hostname).get_transport().is_active())
+            pool.close()
+        finally:
+            key_server.stop()
+
+        hostname = '127.0.0.1:{}'.format(self.server.port)
+        pool = SSHConnectionPool(usernames={hostname: 'test'}, keepalive=5)
+        with patch('lib.ssh_interface.getpass', side_effect=['wrong', 'test']) as getpass:
+            client = pool.get(hostname)
+            self.assertEqual(getpass.call_count, 2)
+            self.assertEqual(client.get_transport().get_username(), 'test')
+
+            # a transfer whose connection drops reconnects with the saved password
+            with open(os.path.join(self.remote, 'a.nc'), 'w') as fp:
+                fp.write('test')
+            client.get_transport().close()
+            succeeded, _ = parallel_transfer(
+                client,
+                [{'remote_path': '/remote/a.nc', 'local_path': os.path.join(self.project_path, 'a.nc')}],
+                reconnect=lambda: pool.get(hostname, prompt=False))
+            self.assertEqual(len(succeeded), 1)
+            self.assertEqual(getpass.call_count, 2)
+        pool.close()
+
+    def test_filemanager_sftp_transfer(self):
+        """
+        transfer_needed pulls the missing files from the host and records
+        each one in the catalog
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        os.makedirs(os.path.join(self.project_path, 'output'))
+        config = make_config(self.project_path, end_year=1)
+        case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+        config['simulations'][case].update({
+            'transfer_type': 'sftp',
+            'remote_path': '/remote',
+            'remote_hostname': '127.0.0.1:{}'.format(self.server.port)
+        })
+        config['global']['sftp_channels'] = 3
+        # the remote files were only just written
+        config['global']['remote_settle'] = 0
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(self.project_path, 'output', 'processflow.db'))
+        filemanager.populate_file_list()
+        remote_path = os.path.join(self.remote, 'archive', 'atm', 'hist')
+        os.makedirs(remote_path)
+        # the last month hasnt been written on the remote yet
+        for datafile in DataFile.select().where(DataFile.month != 12):
+            with open(os.path.join(remote_path, datafile.name), 'w') as fp:
+                fp.write('test')
+
+        with patch('lib.ssh_interface.getpass', return_value='test') as getpass:
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            for thread in filemanager.thread_list:
+                thread.join()
+            filemanager._writer.flush()
+            # the next transfer reuses the connection
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            for thread in filemanager.thread_list:
+                thread.join()
+            filemanager._writer.flush()
+        self.assertEqual(getpass.call_count, 1)
+
+        statuses = {x.month: x.local_status for x in DataFile.select()}
+        self.assertEqual(statuses.pop(12), FileStatus.NOT_PRESENT.value)
+        self.assertEqual(set(statuses.values()), set([FileStatus.PRESENT.value]))
+        self.assertEqual(filemanager.report_files_local()[:6], '11/12 ')
+        filemanager.terminate_transfers()
+
+    def test_filemanager_sftp_unreachable(self):
+        """
+        the files of a host that cant be connected to are left to be tried
+        again, instead of being stuck in transit
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        os.makedirs(os.path.join(self.project_path, 'output'))
+        config = make_config(self.project_path, end_year=1)
+        case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        config['simulations'][case].update({
+            'transfer_type': 'sftp',
+            'remote_path': '/remote',
+            'remote_hostname': '127.0.0.1:{}'.format(port)
+        })
+        config['global']['remote_inventory'] = False
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(self.project_path, 'output', 'processflow.db'))
+        filemanager.populate_file_list()
+        filemanager.transfer_needed(EventList(), filemanager.kill_event)
+        filemanager._writer.flush()
+        self.assertEqual(filemanager.thread_list, list())
+        self.assertEqual(
+            set(x.local_status for x in DataFile.select()), set([FileStatus.NOT_PRESENT.value]))
+        filemanager.terminate_transfers()
+
+
+if __name__ == '__main__':
+    unittest.main()
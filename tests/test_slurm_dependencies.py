@@ -0,0 +1,179 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from subprocess import Popen, PIPE
+
+from lib.slurm import Slurm
+from lib.runmanager import RunManager
+from lib.jobstatus import JobStatus
+from lib.events import EventList
+from lib.util import print_message
+from jobs.job import Job
+from jobs.diag import Diag
+from fake_slurm import FakeSlurm
+
+
+class _Climo(Job):
+    """
+    A climo job that only echoes its years
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_Climo, self).__init__(*args, **kwargs)
+        self._job_type = 'climo'
+        self.data_ready = True
+
+    def get_regrid_path(self, config):
+        return os.path.join(config['global']['project_path'], 'output', 'pp', 'climo')
+
+    def setup_data(self, *args, **kwargs):
+        pass
+
+    def postvalidate(self, *args, **kwargs):
+        return self.status == JobStatus.COMPLETED
+
+    def handle_completion(self, *args, **kwargs):
+        pass
+
+    def execute(self, config, dryrun=False):
+        self._dryrun = dryrun
+        return self._submit_cmd_to_slurm(config, ['echo', 'climo'])
+
+
+class _Diag(Diag):
+    """
+    A diagnostic that lists the climos it was given
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_Diag, self).__init__(*args, **kwargs)
+        self._job_type = 'e3sm_diags'
+        self._short_comp_name = 'obs'
+
+    def setup_data(self, *args, **kwargs):
+        pass
+
+    def postvalidate(self, *args, **kwargs):
+        return self.status == JobStatus.COMPLETED
+
+    def handle_completion(self, *args, **kwargs):
+        pass
+
+    def execute(self, config, dryrun=False):
+        self._dryrun = dryrun
+        if not self.prevalidate():
+            return False
+        input_path, _ = os.path.split(self._input_file_paths[0])
+        return self._submit_cmd_to_slurm(config, ['ls', input_path])
+
+
+class TestSlurmDependencies(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.project_path, 'output', 'scripts'))
+        self.fake = FakeSlurm()
+
+    def tearDown(self):
+        self.fake.remove()
+        shutil.rmtree(self.project_path)
+
+    def make_runmanager(self, jobs, slurm_dependencies=True):
+        runmanager = RunManager.__new__(RunManager)
+        runmanager.executor = Slurm()
+        runmanager.event_list = EventList()
+        runmanager.filemanager = None
+        runmanager.config = {'global': {
+            'project_path': self.project_path,
+            'slurm_dependencies': slurm_dependencies}}
+        runmanager.debug = False
+        runmanager.dryrun = False
+        runmanager.max_running_jobs = 100
+        runmanager.running_jobs = list()
+        runmanager._job_complete = 0
+        runmanager._job_total = len(jobs)
+        runmanager.cases = [{'case': 'case', 'jobs': jobs}]
+        return runmanager
+
+    def make_jobs(self):
+        climo = _Climo(1, 5, 'case', 'piControl')
+        diag = _Diag(1, 5, 'case', 'piControl')
+        diag.depends_on.append(climo.id)
+        return climo, diag
+
+    def test_submit_with_dependency(self):
+        """
+        the diag is queued behind its climo in the same pass, and its run
+        script links in the climos before running
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        climo, diag = self.make_jobs()
+        with self.fake.on_path():
+            runmanager = self.make_runmanager([climo, diag], slurm_dependencies=False)
+            runmanager.start_ready_jobs()
+            self.assertEqual(len(self.fake.submitted()), 1)
+            self.assertEqual(diag.status, JobStatus.VALID)
+
+            climo, diag = self.make_jobs()
+            runmanager = self.make_runmanager([climo, diag])
+            runmanager.start_ready_jobs()
+        (climo_id, _), (diag_id, diag_script) = self.fake.submitted()[1:]
+        self.assertEqual(self.fake.job(diag_id)['dependency'], 'afterok:{}'.format(climo_id))
+        self.assertEqual(diag.status, JobStatus.PENDING)
+        self.assertEqual(
+            [x['slurm_id'] for x in runmanager.running_jobs], [int(climo_id), int(diag_id)])
+
+        # once the climo has run the links are made by the run script
+        regrid_path = climo.get_regrid_path(runmanager.config)
+        os.makedirs(regrid_path)
+        for name in ['piControl_ANN_000101_000512_climo.nc', 'piControl_ANN_000601_001012_climo.nc']:
+            open(os.path.join(regrid_path, name), 'w').close()
+        out, _ = Popen(['bash', diag_script], stdout=PIPE).communicate()
+        self.assertEqual(out, 'piControl_ANN_000101_000512_climo.nc\n')
+
+    def test_dependency_failed(self):
+        """
+        when the climo fails the diag queued behind it is cancelled, whether slurm
+        has marked it DependencyNeverSatisfied yet or not
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        for reason in ['Dependency', 'DependencyNeverSatisfied']:
+            climo, diag = self.make_jobs()
+            with self.fake.on_path():
+                runmanager = self.make_runmanager([climo, diag])
+                runmanager.start_ready_jobs()
+                (climo_id, _), (diag_id, _) = self.fake.submitted()[-2:]
+                self.fake.set_state(climo_id, 'FAILED')
+                self.fake.set_state(diag_id, 'PENDING', reason=reason)
+                runmanager.monitor_running_jobs()
+            self.assertEqual([climo.status, diag.status], [JobStatus.FAILED, JobStatus.FAILED])
+            self.assertEqual(self.fake.job(diag_id)['state'], 'CANCELLED')
+            self.assertEqual(runmanager.running_jobs, list())
+            self.assertEqual(runmanager._job_complete, 2)
+            self.assertEqual(runmanager.is_all_done(), 0)
+
+        # the climo left the queue before the diag was seen to be stuck
+        climo, diag = self.make_jobs()
+        with self.fake.on_path():
+            runmanager = self.make_runmanager([climo, diag])
+            runmanager.start_ready_jobs()
+            (climo_id, _), (diag_id, _) = self.fake.submitted()[-2:]
+            climo.status = JobStatus.FAILED
+            runmanager.running_jobs = runmanager.running_jobs[1:]
+            self.fake.set_state(diag_id, 'PENDING', reason='DependencyNeverSatisfied')
+            self.fake.reset_calls()
+            runmanager.monitor_running_jobs()
+        self.assertEqual(diag.status, JobStatus.FAILED)
+        self.assertIn(['scancel', diag_id], self.fake.calls())
+        self.assertEqual(runmanager.running_jobs, list())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import sys
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from mock import MagicMock
+
+from lib.slurm import Slurm
+from lib.runmanager import RunManager
+from lib.jobstatus import JobStatus
+from lib.events import EventList
+from lib.util import print_message
+from jobs.job import Job
+from fake_slurm import FakeSlurm
+
+
+class TestSlurmPolling(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeSlurm()
+
+    def tearDown(self):
+        self.fake.remove()
+
+    def test_showjobs(self):
+        """
+        jobs in the queue come from one squeue call, and the jobs that
+        have left it from one sacct call
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        running = self.fake.add_job('RUNNING')
+        pending = self.fake.add_job('PENDING')
+        completed = self.fake.add_job('COMPLETED', queued=False)
+        cancelled = self.fake.add_job('CANCELLED by 1234', queued=False)
+        with self.fake.on_path():
+            slurm = Slurm()
+            jobs_info = slurm.showjobs([running, pending, completed, cancelled, 99])
+            self.assertEqual(
+                {x: y['JobState'] for x, y in jobs_info.items()},
+                {str(running): 'RUNNING', str(pending): 'PENDING',
+                 str(completed): 'COMPLETED', str(cancelled): 'CANCELLED'})
+            self.assertEqual(jobs_info[str(running)]['NodeList'], 'node1')
+            self.assertEqual([x[0] for x in self.fake.calls()], ['squeue', 'sacct'])
+            # the same as scontrol reports for a queued job
+            self.assertEqual(slurm.showjob(running)['JobState'], 'RUNNING')
+
+            # a single job that has left the queue makes squeue fail
+            self.fake.reset_calls()
+            self.assertEqual(slurm.showjobs([completed])[str(completed)]['JobState'], 'COMPLETED')
+            self.assertEqual(slurm.showjobs([]), dict())
+            ids = [self.fake.add_job('RUNNING') for _ in range(5)]
+            self.fake.reset_calls()
+            self.assertEqual(len(slurm.showjobs(ids, batch_size=2)), 5)
+            self.assertEqual([x[0] for x in self.fake.calls()], ['squeue'] * 3)
+
+    def test_monitor_running_jobs(self):
+        """
+        one lookup updates every running job, and jobs that finished or that
+        slurm no longer knows about are handled
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        with self.fake.on_path():
+            runmanager = RunManager.__new__(RunManager)
+            runmanager.executor = Slurm()
+            runmanager.event_list = EventList()
+            runmanager.filemanager = None
+            runmanager.config = dict()
+            runmanager._job_complete = 0
+            runmanager._job_total = 4
+            runmanager.running_jobs = list()
+            jobs = list()
+            for state, queued in [('RUNNING', True), ('COMPLETED', False), ('FAILED', True), (None, False)]:
+                job = Job(1, 5, 'case', 'case')
+                job.status = JobStatus.SUBMITTED
+                job.postvalidate = MagicMock(return_value=True)
+                job.handle_completion = MagicMock()
+                slurm_id = self.fake.add_job(state, queued) if state else 99
+                runmanager.running_jobs.append({'job_id': job.id, 'slurm_id': slurm_id})
+                jobs.append(job)
+            runmanager.cases = [{'case': 'case', 'jobs': jobs}]
+            self.fake.reset_calls()
+            runmanager.monitor_running_jobs()
+
+        self.assertEqual([x[0] for x in self.fake.calls()], ['squeue', 'sacct'])
+        self.assertEqual(
+            [x.status for x in jobs],
+            [JobStatus.RUNNING, JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.COMPLETED])
+        self.assertEqual([x.handle_completion.call_count for x in jobs], [0, 1, 1, 1])
+        self.assertEqual([x['job_id'] for x in runmanager.running_jobs], [jobs[0].id])
+        self.assertEqual(runmanager._job_complete, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import sys
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from time import sleep, time
+
+from lib.slurm import Slurm
+from lib.runmanager import RunManager
+from lib.jobstatus import JobStatus
+from lib.events import EventList
+from lib.util import print_message
+from jobs.job import Job
+from fake_slurm import FakeSlurm
+
+
+class TestSlurmSimulator(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = None
+
+    def tearDown(self):
+        if self.fake:
+            self.fake.remove()
+
+    def write_script(self, name, args=None):
+        path = os.path.join(self.fake.root, name)
+        with open(path, 'w') as fp:
+            fp.write('#!/bin/bash\n')
+            for arg in args or list():
+                fp.write('#SBATCH {}\n'.format(arg))
+        return path
+
+    def wait_for(self, slurm, job_id, states, timeout=10):
+        start = time()
+        while time() - start < timeout:
+            info = slurm.showjobs([job_id]).get(str(job_id))
+            if info and info['JobState'] in states:
+                return info
+            sleep(0.05)
+        self.fail('job {} never reached {}'.format(job_id, states))
+
+    def test_outcomes(self):
+        """
+        simulated jobs wait, run and then complete, fail or time out, and
+        afterok dependents of a job that didnt complete never start
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        self.fake = FakeSlurm(simulate={'runtime': 0.2, 'runtime_sigma': 0, 'linger': 60})
+        with self.fake.on_path():
+            slurm = Slurm()
+            outcomes = dict()
+            for outcome, failure_rate, timeout_rate in [('COMPLETED', 0, 0), ('FAILED', 1, 0), ('TIMEOUT', 0, 1)]:
+                self.fake.set_simulation(failure_rate=failure_rate, timeout_rate=timeout_rate)
+                outcomes[outcome] = slurm.batch(self.write_script(outcome))
+            self.assertEqual(
+                slurm.showjobs([outcomes['COMPLETED']])[str(outcomes['COMPLETED'])]['JobState'], 'RUNNING')
+            for outcome, job_id in outcomes.items():
+                self.wait_for(slurm, job_id, [outcome])
+
+            self.fake.set_simulation(failure_rate=0, timeout_rate=0)
+            after = slurm.batch(self.write_script(
+                'after', ['--dependency=afterok:{}'.format(outcomes['COMPLETED'])]))
+            never = slurm.batch(self.write_script(
+                'never', ['--dependency=afterok:{}'.format(outcomes['FAILED'])]))
+            self.wait_for(slurm, after, ['COMPLETED'])
+            info = slurm.showjobs([never])[str(never)]
+            self.assertEqual((info['JobState'], info['Reason']), ('PENDING', 'DependencyNeverSatisfied'))
+
+    def test_transport_errors(self):
+        """
+        commands fail at random with Transport endpoint is not connected,
+        and the slurm wrapper retries through them
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        self.fake = FakeSlurm(simulate={'runtime': 0, 'transport_error_rate': 0.3})
+        with self.fake.on_path():
+            slurm = Slurm()
+            ids = [slurm.batch(self.write_script('job{}'.format(x))) for x in range(5)]
+            for job_id in ids:
+                self.wait_for(slurm, job_id, ['COMPLETED'])
+        self.assertEqual(len(set(ids)), 5)
+        self.assertTrue(len(self.fake.calls()) > len(ids) * 2)
+
+    def test_timeout_finishes_job(self):
+        """
+        a job that runs out of time leaves the running jobs as failed,
+        taking the jobs that depend on it with it
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        self.fake = FakeSlurm(simulate={'runtime': 0, 'timeout_rate': 1})
+        with self.fake.on_path():
+            runmanager = RunManager.__new__(RunManager)
+            runmanager.executor = Slurm()
+            runmanager.event_list = EventList()
+            runmanager.filemanager = None
+            runmanager.config = dict()
+            runmanager._job_complete = 0
+            runmanager._job_total = 2
+            runmanager.running_jobs = list()
+            job = Job(1, 5, 'case', 'case')
+            job.status = JobStatus.SUBMITTED
+            job.postvalidate = lambda *args, **kwargs: False
+            job.handle_completion = lambda *args, **kwargs: None
+            depjob = Job(1, 5, 'case', 'case')
+            depjob._depends_on.append(job.id)
+            runmanager.cases = [{'case': 'case', 'jobs': [job, depjob]}]
+            slurm_id = runmanager.executor.batch(self.write_script('timeout'))
+            runmanager.running_jobs.append({'slurm_id': slurm_id, 'job_id': job.id})
+            runmanager.monitor_running_jobs()
+        self.assertEqual(runmanager.running_jobs, list())
+        self.assertEqual(depjob.status, JobStatus.FAILED)
+        self.assertEqual(runmanager.is_all_done(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
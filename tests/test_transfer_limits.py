@@ -0,0 +1,268 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from time import sleep, time
+from mock import patch
+
+from lib.transfer_limits import TokenBucket, EndpointLimit, TransferLimits
+from lib.ssh_interface import parallel_transfer
+from lib.verify_config import verify_config
+from lib.globus_interface import TaskMonitor
+from lib.filemanager import FileManager, FileStatus
+from lib.models import DataFile
+from lib.events import EventList
+from lib.util import print_message
+from sftp_server import SFTPServer
+from fake_globus import FakeTransferClient
+from test_filemanager_catalog import make_config
+
+CASE = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+
+
+def wait_for(condition, timeout=10):
+    end = time() + timeout
+    while not condition():
+        if time() > end:
+            return False
+        sleep(0.01)
+    return True
+
+
+class _CountingLimit(EndpointLimit):
+    """
+    An EndpointLimit that remembers the most transfers it had active at once
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(_CountingLimit, self).__init__(*args, **kwargs)
+        self.peak = 0
+
+    def acquire(self, event=None, block=True):
+        acquired = super(_CountingLimit, self).acquire(event, block)
+        if acquired:
+            self.peak = max(self.peak, self.stats().active)
+        return acquired
+
+
+class TestTransferLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        self.remote = os.path.join(self.project_path, 'remote')
+        os.makedirs(self.remote)
+        os.makedirs(os.path.join(self.project_path, 'output'))
+
+    def tearDown(self):
+        shutil.rmtree(self.project_path)
+
+    def test_token_bucket(self):
+        """
+        threads sharing a bucket are held to its rate once the burst is used up
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        bucket = TokenBucket(rate=400000, burst=100000)
+
+        def consume():
+            for _ in range(10):
+                bucket.consume(25000)
+
+        threads = [threading.Thread(target=consume) for _ in range(2)]
+        start = time()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 500000 tokens, the first 100000 are free
+        elapsed = time() - start
+        self.assertGreater(elapsed, 0.95)
+        self.assertLess(elapsed, 1.5)
+
+        # a set event stops the wait
+        event = threading.Event()
+        event.set()
+        start = time()
+        bucket.consume(4000000, event)
+        self.assertLess(time() - start, 0.5)
+
+        limits = TransferLimits({
+            'global': {'max_transfers': 4},
+            'simulations': {
+                'start_year': 1,
+                'a': {'transfer_type': 'sftp', 'remote_hostname': 'host', 'max_bandwidth': 2},
+                'b': {'transfer_type': 'sftp', 'remote_hostname': 'host', 'max_transfers': 2},
+                'c': {'transfer_type': 'globus', 'remote_uuid': 'uuid', 'max_bandwidth': 2},
+                'd': {'transfer_type': 'globus', 'remote_uuid': 'other'}
+            }
+        })
+        self.assertEqual(
+            (limits.get('host').max_transfers, limits.get('host').max_bandwidth), (2, 2 * 2**20))
+        self.assertEqual(
+            (limits.get('uuid').max_transfers, limits.get('uuid').max_bandwidth), (4, None))
+        self.assertIs(limits.get('host'), limits.get('host'))
+        self.assertEqual(sorted(limits.stats().keys()), ['host', 'uuid'])
+
+    def test_sftp_limits(self):
+        """
+        a host capped at two transfers never has more running than that,
+        however many channels are open, and keeps to its bandwidth
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        server = SFTPServer(self.project_path)
+        try:
+            local = os.path.join(self.project_path, 'local')
+            os.makedirs(local)
+            file_list = list()
+            for idx in range(6):
+                name = 'file{}.nc'.format(idx)
+                with open(os.path.join(self.remote, name), 'w') as fp:
+                    fp.write('a' * 2**17)
+                file_list.append({
+                    'remote_path': '/remote/' + name,
+                    'local_path': os.path.join(local, name)
+                })
+            limit = _CountingLimit(max_transfers=2, max_bandwidth=2**18)
+            client = server.client()
+            start = time()
+            try:
+                succeeded, failed = parallel_transfer(
+                    client, file_list, channels=4, window=2**15, limit=limit)
+            finally:
+                client.close()
+            elapsed = time() - start
+            self.assertEqual((len(succeeded), len(failed)), (6, 0))
+            self.assertEqual(limit.peak, 2)
+            # 768KB at 256KB/s, the first second is free
+            self.assertGreater(elapsed, 1.8)
+            stats = limit.stats()
+            self.assertEqual((stats.active, stats.files, stats.bytes), (0, 6, 6 * 2**17))
+            self.assertGreater(stats.rate, 0)
+
+            config = make_config(self.project_path, end_year=1)
+            config['global']['max_transfers'] = 0
+            config['simulations'][CASE]['max_bandwidth'] = 'fast'
+            self.assertEqual(verify_config(config), [
+                'global max_transfers must be a positive integer',
+                '{} max_bandwidth must be a positive number of MB/s'.format(CASE)])
+        finally:
+            server.stop()
+
+    def test_globus_endpoint_cap(self):
+        """
+        an endpoint allowed one task at a time gets its second task
+        only once the first has finished
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=1)
+        config['simulations'][CASE].update({
+            'transfer_type': 'globus',
+            'remote_path': '/remote/{}'.format(CASE),
+            'remote_uuid': 'remote_uuid',
+            'max_transfers': 1
+        })
+        config['global']['local_globus_uuid'] = 'local_uuid'
+        config['global']['remote_settle'] = 0
+        # a different sync level goes in its own task
+        config['data_types']['lnd'] = {
+            'remote_path': 'REMOTE_PATH/archive/lnd/hist',
+            'file_format': 'CASEID.clm2.h0.YEAR-MONTH.nc',
+            'local_path': 'PROJECT_PATH/input/CASEID/lnd',
+            'monthly': True,
+            'sync_level': 'size'
+        }
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(self.project_path, 'output', 'processflow.db'))
+        filemanager._globus_monitor = TaskMonitor(
+            event=filemanager.kill_event, min_interval=0.01, max_interval=0.05)
+        filemanager.populate_file_list()
+        for datafile in DataFile.select():
+            remote_path = os.path.join(self.project_path, datafile.remote_path.lstrip('/'))
+            if not os.path.exists(os.path.dirname(remote_path)):
+                os.makedirs(os.path.dirname(remote_path))
+            with open(remote_path, 'w') as fp:
+                fp.write('test')
+
+        client = FakeTransferClient(self.project_path, files_per_poll=0)
+        with patch('lib.filemanager.get_client', return_value=client):
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            self.assertEqual(len(client.tasks), 1)
+            self.assertEqual(filemanager.transfer_stats()['remote_uuid'].active, 1)
+            # the other files werent started
+            self.assertEqual(
+                DataFile.select().where(DataFile.local_status == FileStatus.IN_TRANSIT.value).count(), 12)
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            self.assertEqual(len(client.tasks), 1)
+
+            client.files_per_poll = 12
+            self.assertTrue(wait_for(lambda: not filemanager._globus_monitor.active()))
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            self.assertEqual(len(client.tasks), 2)
+            # size then checksum, as TransferData numbers them
+            self.assertEqual(sorted(client.sync_levels), [1, 3])
+            self.assertTrue(wait_for(lambda: not filemanager._globus_monitor.active()))
+        filemanager._writer.flush()
+        self.assertEqual(
+            set(x.local_status for x in DataFile.select()), set([FileStatus.PRESENT.value]))
+        stats = filemanager.transfer_stats()['remote_uuid']
+        self.assertEqual((stats.active, stats.files, stats.bytes), (0, 24, 24 * 4))
+        filemanager.terminate_transfers()
+
+    def test_globus_submit_failure(self):
+        """
+        a task that fails to start gives its slot back and leaves its files
+        to be requested again
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=1)
+        config['simulations'][CASE].update({
+            'transfer_type': 'globus',
+            'remote_path': '/remote/{}'.format(CASE),
+            'remote_uuid': 'remote_uuid',
+            'max_transfers': 1
+        })
+        config['global']['local_globus_uuid'] = 'local_uuid'
+        config['global']['remote_inventory'] = False
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(self.project_path, 'output', 'processflow.db'))
+        filemanager._globus_monitor = TaskMonitor(
+            event=filemanager.kill_event, min_interval=0.01, max_interval=0.05)
+        filemanager.populate_file_list()
+        for datafile in DataFile.select():
+            remote_path = os.path.join(self.project_path, datafile.remote_path.lstrip('/'))
+            if not os.path.exists(os.path.dirname(remote_path)):
+                os.makedirs(os.path.dirname(remote_path))
+            with open(remote_path, 'w') as fp:
+                fp.write('test')
+
+        client = FakeTransferClient(self.project_path)
+        with patch('lib.filemanager.get_client', side_effect=[Exception('Token expired'), client]):
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            filemanager._writer.flush()
+            self.assertEqual(filemanager.transfer_stats()['remote_uuid'].active, 0)
+            self.assertEqual(
+                set(x.local_status for x in DataFile.select()), set([FileStatus.NOT_PRESENT.value]))
+
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            self.assertEqual(len(client.tasks), 1)
+            self.assertTrue(wait_for(lambda: not filemanager._globus_monitor.active()))
+        filemanager._writer.flush()
+        self.assertEqual(
+            set(x.local_status for x in DataFile.select()), set([FileStatus.PRESENT.value]))
+        filemanager.terminate_transfers()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from time import sleep, time
+from mock import patch
+
+from lib.runmanager import RunManager
+from lib.globus_interface import TaskMonitor
+from lib.filemanager import FileManager, FileStatus
+from lib.jobstatus import JobStatus
+from lib.models import DataFile
+from lib.events import EventList
+from lib.util import print_message
+from jobs.job import Job
+from fake_globus import FakeTransferClient
+from test_filemanager_catalog import make_config
+
+CASE = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+
+
+def wait_for(condition, timeout=10):
+    end = time() + timeout
+    while not condition():
+        if time() > end:
+            return False
+        sleep(0.01)
+    return True
+
+
+class TestTransferPriority(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.project_path, 'output'))
+
+    def tearDown(self):
+        shutil.rmtree(self.project_path)
+
+    def make_filemanager(self, config):
+        config['simulations'][CASE].update({
+            'transfer_type': 'globus',
+            'remote_path': '/remote/{}'.format(CASE),
+            'remote_uuid': 'remote_uuid'
+        })
+        config['global']['local_globus_uuid'] = 'local_uuid'
+        # the remote files were only just written
+        config['global']['remote_settle'] = 0
+        filemanager = FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(self.project_path, 'output', 'processflow.db'))
+        filemanager._globus_monitor = TaskMonitor(
+            event=filemanager.kill_event, min_interval=0.01, max_interval=0.05)
+        filemanager.populate_file_list()
+        for datafile in DataFile.select():
+            remote_path = os.path.join(self.project_path, datafile.remote_path.lstrip('/'))
+            if not os.path.exists(os.path.dirname(remote_path)):
+                os.makedirs(os.path.dirname(remote_path))
+            with open(remote_path, 'w') as fp:
+                fp.write('test')
+        return filemanager
+
+    def test_transfer_priorities(self):
+        """
+        jobs are ranked by start year, then by the jobs waiting on them,
+        and jobs that already have their data are left out
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path)
+        config['global'].update({
+            'max_jobs': 4,
+            'dryrun': False,
+            'debug': False,
+            'resource_path': ''
+        })
+        with patch('lib.runmanager.Slurm'):
+            runmanager = RunManager(EventList(), threading.Event(), config, None)
+        climo = Job(1, 2, CASE, 'piControl', data_required=['atm'])
+        timeseries = Job(1, 2, CASE, 'piControl', data_required=['atm'])
+        diags = Job(1, 2, CASE, 'piControl', data_required=['atm'])
+        diags.depends_on.append(climo.id)
+        later = Job(3, 4, CASE, 'piControl', data_required=['atm'])
+        ready = Job(1, 2, CASE, 'piControl', data_required=['atm'])
+        ready.data_ready = True
+        done = Job(1, 2, CASE, 'piControl', data_required=['atm'])
+        done.status = JobStatus.COMPLETED
+        runmanager.cases = [{'case': CASE, 'jobs': [later, diags, timeseries, climo, ready, done]}]
+
+        priorities = runmanager.transfer_priorities()
+        self.assertEqual([x[0] for x in priorities], [(1, -1, 0), (1, 0, 0), (1, 0, 1), (3, 0, 0)])
+        self.assertEqual(priorities[0][1], climo.get_data_requirements())
+        self.assertEqual(priorities[-1][1], [(CASE, 'atm', 3, 4)])
+
+    def test_transfer_waves(self):
+        """
+        the files of the best ranked job go in the first wave, and the next
+        wave waits until most of the first has arrived
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=3)
+        config['global']['transfer_wave_size'] = 12
+        filemanager = self.make_filemanager(config)
+        # the job that needs year 2 has others waiting on it
+        priorities = [((1, -2, 0), [(CASE, 'atm', 2, 2)]),
+                      ((1, 0, 0), [(CASE, 'atm', 1, 1)])]
+
+        client = FakeTransferClient(self.project_path, files_per_poll=0)
+        with patch('lib.filemanager.get_client', return_value=client):
+            filemanager.transfer_needed(EventList(), filemanager.kill_event, priorities=priorities)
+            filemanager._writer.flush()
+            self.assertEqual(
+                set(x.year for x in DataFile.select().where(
+                    DataFile.local_status == FileStatus.IN_TRANSIT.value)),
+                set([2]))
+
+            # nothing more is sent while the wave is in transit
+            filemanager.transfer_needed(EventList(), filemanager.kill_event, priorities=priorities)
+            self.assertEqual(len(client.tasks), 1)
+
+            client.files_per_poll = 4
+            self.assertTrue(wait_for(lambda: not filemanager._globus_monitor.active()))
+            filemanager._writer.flush()
+            filemanager.transfer_needed(EventList(), filemanager.kill_event, priorities=priorities)
+            filemanager._writer.flush()
+            self.assertEqual(len(client.tasks), 2)
+            self.assertEqual(
+                set(x.year for x in DataFile.select().where(
+                    DataFile.local_status == FileStatus.IN_TRANSIT.value)),
+                set([1]))
+        filemanager.terminate_transfers()
+
+    def test_rank_transfers(self):
+        """
+        between jobs of the same rank the one closest to having all its data
+        goes first, and files no job needs go last
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=4)
+        filemanager = self.make_filemanager(config)
+        DataFile.update(local_status=FileStatus.PRESENT.value).where(
+            (DataFile.year == 3) & (DataFile.month < 10)).execute()
+        candidates = [(x, {'id': x.id}) for x in DataFile.select().where(
+            DataFile.local_status == FileStatus.NOT_PRESENT.value)]
+        priorities = [((1, 0, 0), [(CASE, 'atm', 1, 1)]),
+                      ((1, 0, 0), [(CASE, 'atm', 3, 3)])]
+        order = filemanager._rank_transfers(candidates, priorities)
+        years = [x[0].year for x in order]
+        self.assertEqual(years, [3] * 3 + [1] * 12 + [2] * 12 + [4] * 12)
+        self.assertEqual([x[0].month for x in order[:3]], [10, 11, 12])
+
+        # without priorities files go in date order
+        order = filemanager._rank_transfers(candidates[::-1], None)
+        self.assertEqual([x[0].id for x in order], [x[0].id for x in candidates])
+        filemanager.terminate_transfers()
+
+
+if __name__ == '__main__':
+    unittest.main()
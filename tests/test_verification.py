@@ -0,0 +1,328 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from time import sleep, time
+from mock import patch
+
+from lib import filemanager as filemanager_module
+from lib.ssh_interface import remote_checksums
+from lib.verification import selected, compare_checksums, checksum_algorithm
+from lib.verify_config import verify_config
+from lib.globus_interface import TaskMonitor
+from lib.filemanager import FileManager, FileStatus
+from lib.models import DataFile
+from lib.events import EventList
+from lib.util import print_message
+from sftp_server import SFTPServer
+from fake_globus import FakeTransferClient
+from test_filemanager_catalog import make_config
+
+CASE = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+
+
+def wait_for(condition, timeout=10):
+    end = time() + timeout
+    while not condition():
+        if time() > end:
+            return False
+        sleep(0.01)
+    return True
+
+
+class TestVerification(unittest.TestCase):
+
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        self.remote = os.path.join(self.project_path, 'remote')
+        os.makedirs(self.remote)
+        os.makedirs(os.path.join(self.project_path, 'output'))
+
+    def tearDown(self):
+        shutil.rmtree(self.project_path)
+
+    def make_filemanager(self, config):
+        # the remote files are only just written
+        config['global']['remote_settle'] = 0
+        return FileManager(
+            mutex=threading.Lock(),
+            event_list=EventList(),
+            config=config,
+            database=os.path.join(self.project_path, 'output', 'processflow.db'))
+
+    def test_verify_selection(self):
+        """
+        the sample is about the requested fraction, and the same files
+        are picked every time
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        paths = ['/p/input/atm/file{}.nc'.format(x) for x in range(4000)]
+        sample = [x for x in paths if selected(x, 'sample', 0.05)]
+        self.assertGreater(len(sample), 140)
+        self.assertLess(len(sample), 260)
+        self.assertEqual(sample, [x for x in paths if selected(x, 'sample', 0.05)])
+        self.assertTrue(all(selected(x, 'all', 0) for x in paths[:10]))
+        self.assertFalse(any(selected(x, 'none', 1) for x in paths[:10]))
+        self.assertFalse(any(selected(x, 'sample', 0) for x in paths[:10]))
+
+        config = make_config(self.project_path, end_year=1)
+        config['global']['sync_level'] = 'size'
+        config['simulations'][CASE]['verify'] = 'sample'
+        config['data_types']['atm']['verify_fraction'] = 0.1
+        self.assertEqual(verify_config(config), [])
+        config['global']['sync_level'] = 'fast'
+        config['simulations'][CASE]['verify'] = 'some'
+        config['data_types']['atm']['verify_fraction'] = 2
+        self.assertEqual(len(verify_config(config)), 3)
+        config['global']['checksum_command'] = 'cksum'
+        self.assertEqual(len(verify_config(config)), 1)
+
+        self.assertEqual(checksum_algorithm('sha256sum'), 'sha256')
+        self.assertEqual(checksum_algorithm('/usr/bin/md5sum'), 'md5')
+        self.assertIsNone(checksum_algorithm('md5sum -b'))
+        self.assertIsNone(checksum_algorithm('cksum'))
+
+    def test_sftp_verification(self):
+        """
+        sampled files are checksummed on the host, and a file that doesnt
+        match is removed so its transferred again
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        server = SFTPServer(self.project_path)
+        try:
+            remote_path = os.path.join(self.remote, 'archive', 'atm', 'hist')
+            os.makedirs(remote_path)
+            with open(os.path.join(remote_path, 'a b.nc'), 'w') as fp:
+                fp.write('test')
+            client = server.client()
+            checksums = remote_checksums(
+                client, ['/remote/archive/atm/hist/a b.nc', '/remote/missing.nc'])
+            client.close()
+            self.assertEqual(checksums, {'/remote/archive/atm/hist/a b.nc': '098f6bcd4621d373cade4e832627b4f6'})
+            verified, mismatched, unverified = compare_checksums(
+                [{'remote_path': '/remote/archive/atm/hist/a b.nc',
+                  'local_path': os.path.join(remote_path, 'a b.nc')},
+                 {'remote_path': '/remote/missing.nc',
+                  'local_path': os.path.join(remote_path, 'a b.nc')},
+                 {'remote_path': '/remote/archive/atm/hist/a b.nc',
+                  'local_path': os.path.join(remote_path, 'missing.nc')}],
+                checksums)
+            self.assertEqual((len(verified), len(mismatched), len(unverified)), (1, 1, 1))
+            self.assertEqual(mismatched[0]['local_path'], os.path.join(remote_path, 'missing.nc'))
+
+            config = make_config(self.project_path, end_year=1)
+            config['simulations'][CASE].update({
+                'transfer_type': 'sftp',
+                'remote_path': '/remote',
+                'remote_hostname': '127.0.0.1:{}'.format(server.port),
+                'verify': 'all'
+            })
+            config['global']['checksum_command'] = 'sha256sum'
+            filemanager = self.make_filemanager(config)
+            filemanager.populate_file_list()
+            for datafile in DataFile.select():
+                with open(os.path.join(remote_path, datafile.name), 'w') as fp:
+                    fp.write('test')
+            corrupted = DataFile.get(DataFile.month == 3).local_path
+            gone = DataFile.get(DataFile.month == 7).name
+            real_transfer = filemanager_module.ssh_parallel_transfer
+            during = list()
+
+            def transfer(*args, **kwargs):
+                result = real_transfer(*args, **kwargs)
+                # a poll before they're verified doesnt count them as present yet
+                filemanager.update_local_status()
+                filemanager._writer.flush()
+                during.extend(x.local_status for x in DataFile.select())
+                with open(corrupted, 'w') as fp:
+                    fp.write('tesT')
+                # nothing on the remote to checksum it against
+                os.remove(os.path.join(remote_path, gone))
+                return result
+
+            messages = list()
+            with patch('lib.ssh_interface.getpass', return_value='test'), \
+                    patch('lib.filemanager.ssh_parallel_transfer', side_effect=transfer), \
+                    patch('lib.filemanager.print_line', side_effect=lambda x, y: messages.append(x)):
+                filemanager.transfer_needed(EventList(), filemanager.kill_event)
+                for thread in filemanager.thread_list:
+                    thread.join()
+            filemanager._writer.flush()
+
+            # nothing was used before it was verified
+            self.assertEqual(set(during), set([FileStatus.IN_TRANSIT.value]))
+            statuses = {x.month: x.local_status for x in DataFile.select()}
+            self.assertEqual(statuses.pop(3), FileStatus.NOT_PRESENT.value)
+            self.assertEqual(set(statuses.values()), set([FileStatus.PRESENT.value]))
+            self.assertFalse(os.path.exists(corrupted))
+            self.assertIn('checksum mismatch for {}, it will be transferred again'.format(
+                os.path.basename(corrupted)), messages)
+            self.assertIn(
+                'verified 10 of 12 sampled sftp files, 1 couldnt be checksummed on the remote', messages)
+            self.assertEqual(filemanager._verifying, set())
+            filemanager.terminate_transfers()
+        finally:
+            server.stop()
+
+    def test_globus_verification(self):
+        """
+        the transfer uses the configured sync level, then the sample is
+        synced again by checksum, which copies only the file that differs
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=1)
+        config['simulations'][CASE].update({
+            'transfer_type': 'globus',
+            'remote_path': '/remote/{}'.format(CASE),
+            'remote_uuid': 'remote_uuid',
+            'verify': 'all'
+        })
+        config['data_types']['atm']['sync_level'] = 'size'
+        config['global']['local_globus_uuid'] = 'local_uuid'
+        filemanager = self.make_filemanager(config)
+        filemanager._globus_monitor = TaskMonitor(
+            event=filemanager.kill_event, min_interval=0.01, max_interval=0.05)
+        filemanager.populate_file_list()
+        for datafile in DataFile.select():
+            remote_path = os.path.join(self.project_path, datafile.remote_path.lstrip('/'))
+            if not os.path.exists(os.path.dirname(remote_path)):
+                os.makedirs(os.path.dirname(remote_path))
+            with open(remote_path, 'w') as fp:
+                fp.write('test')
+        changed = DataFile.get(DataFile.month == 5)
+        real_submit = filemanager_module.globus_submit_transfer
+        during = list()
+
+        def submit(*args, **kwargs):
+            if kwargs.get('label') == 'Processflow verification':
+                # the files are all there, but arent present until they're verified
+                filemanager.update_local_status()
+                filemanager._writer.flush()
+                during.extend(x.local_status for x in DataFile.select())
+                # the same size, so only a checksum sync notices it
+                with open(os.path.join(self.project_path, changed.remote_path.lstrip('/')), 'w') as fp:
+                    fp.write('tesT')
+            return real_submit(*args, **kwargs)
+
+        client = FakeTransferClient(self.project_path, files_per_poll=5)
+        messages = list()
+        with patch('lib.filemanager.get_client', return_value=client), \
+                patch('lib.filemanager.globus_submit_transfer', side_effect=submit), \
+                patch('lib.filemanager.print_line', side_effect=lambda x, y: messages.append(x)):
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            self.assertTrue(wait_for(lambda: len(client.sync_levels) == 2 and not filemanager._globus_monitor.active()))
+        filemanager._writer.flush()
+
+        # size then checksum, as TransferData numbers them
+        self.assertEqual(client.sync_levels, [1, 3])
+        self.assertEqual(during, [FileStatus.IN_TRANSIT.value] * 12)
+        self.assertEqual(filemanager._verifying, set())
+        with open(changed.local_path) as fp:
+            self.assertEqual(fp.read(), 'tesT')
+        self.assertIn('checksum mismatch for {}, it was transferred again'.format(changed.name), messages)
+        self.assertIn('verified 12 sampled globus files, 1 were transferred again', messages)
+        self.assertEqual(
+            set(x.local_status for x in DataFile.select()),
+            set([FileStatus.PRESENT.value]))
+        filemanager.terminate_transfers()
+
+    def test_globus_verification_failure(self):
+        """
+        a verification task that fails leaves the sampled files in place and
+        is run again, instead of sending every file again
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_config(self.project_path, end_year=1)
+        config['simulations'][CASE].update({
+            'transfer_type': 'globus',
+            'remote_path': '/remote/{}'.format(CASE),
+            'remote_uuid': 'remote_uuid',
+            'verify': 'all'
+        })
+        config['data_types']['atm']['sync_level'] = 'size'
+        config['global']['local_globus_uuid'] = 'local_uuid'
+        filemanager = self.make_filemanager(config)
+        filemanager._globus_monitor = TaskMonitor(
+            event=filemanager.kill_event, min_interval=0.01, max_interval=0.05)
+        filemanager.populate_file_list()
+        for datafile in DataFile.select():
+            remote_path = os.path.join(self.project_path, datafile.remote_path.lstrip('/'))
+            if not os.path.exists(os.path.dirname(remote_path)):
+                os.makedirs(os.path.dirname(remote_path))
+            with open(remote_path, 'w') as fp:
+                fp.write('test')
+        removed = DataFile.get(DataFile.month == 2).local_path
+        real_submit = filemanager_module.globus_submit_transfer
+        verifications = list()
+
+        def submit(*args, **kwargs):
+            task_id = real_submit(*args, **kwargs)
+            if kwargs.get('label') == 'Processflow verification':
+                verifications.append(len(args[3]))
+                if len(verifications) == 1:
+                    # the endpoint went away before anything was checked
+                    client.tasks[task_id]['status'] = 'FAILED'
+                    os.remove(removed)
+            return task_id
+
+        client = FakeTransferClient(self.project_path, files_per_poll=5)
+        messages = list()
+        with patch('lib.filemanager.get_client', return_value=client), \
+                patch('lib.filemanager.globus_submit_transfer', side_effect=submit), \
+                patch('lib.filemanager.print_line', side_effect=lambda x, y: messages.append(x)):
+            filemanager.transfer_needed(EventList(), filemanager.kill_event)
+            self.assertTrue(wait_for(lambda: len(client.sync_levels) == 3 and not filemanager._globus_monitor.active()))
+        filemanager._writer.flush()
+
+        self.assertEqual(client.sync_levels, [1, 3, 3])
+        self.assertEqual(verifications, [12, 11])
+        self.assertIn('verified 11 sampled globus files, 0 were transferred again', messages)
+        statuses = {x.month: x.local_status for x in DataFile.select()}
+        # only the file that really is gone is transferred again
+        self.assertEqual(statuses.pop(2), FileStatus.NOT_PRESENT.value)
+        self.assertEqual(set(statuses.values()), set([FileStatus.PRESENT.value]))
+        self.assertEqual(filemanager._verifying, set())
+        filemanager.terminate_transfers()
+
+    def test_verifying_files_skipped(self):
+        """
+        update_local_status leaves files waiting to be verified alone, with
+        either catalog backend
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        for backend in ['table', 'series']:
+            project_path = os.path.join(self.project_path, backend)
+            os.makedirs(os.path.join(project_path, 'output'))
+            config = make_config(project_path, end_year=1, catalog_backend=backend)
+            config['simulations'][CASE]['transfer_type'] = 'sftp'
+            filemanager = FileManager(
+                mutex=threading.Lock(),
+                event_list=EventList(),
+                config=config,
+                database=os.path.join(project_path, 'output', 'processflow.db'))
+            filemanager.populate_file_list()
+            local_path = os.path.join(project_path, 'input', CASE, 'atm')
+            if not os.path.exists(local_path):
+                os.makedirs(local_path)
+            names = ['{}.cam.h0.0001-{:02d}.nc'.format(CASE, x) for x in range(1, 13)]
+            for name in names:
+                open(os.path.join(local_path, name), 'w').close()
+            filemanager._verifying.update(os.path.join(local_path, x) for x in names[:3])
+
+            self.assertTrue(filemanager.update_local_status())
+            self.assertEqual(filemanager.progress()[(CASE, 'atm')].present, 9)
+            filemanager._verifying.clear()
+            self.assertTrue(filemanager.update_local_status())
+            self.assertEqual(filemanager.progress()[(CASE, 'atm')].present, 12)
+            filemanager.terminate_transfers()
+
+
+if __name__ == '__main__':
+    unittest.main()